@@ -1,6 +1,32 @@
 from pathlib import Path, PosixPath
+from CloudMeasurement.experiments.sshExecutor import SshExecutor
+from time import sleep, time
 import ansible_runner
 
+EXECUTORS = ("ansible", "ssh")
+# status of the hosts in the events of ansible-runner
+HOST_EVENTS = {"runner_on_ok": "ok", "runner_on_failed": "failed", "runner_on_unreachable": "unreachable",
+               "runner_on_skipped": "skipped"}
+# seconds before the first retry of the failed hosts, doubled at every retry
+DEFAULT_BACKOFF = 5
+
+# ssh connections kept open between the tasks and between the cm commands, modules piped through the open
+# connection instead of copied with sftp, and facts gathered only by the plays that ask for them. The host keys of
+# the new probes are accepted the first time and stored in the known hosts of the inventory, a changed key is
+# refused.
+ANSIBLE_CONFIG_TEMPLATE = """[defaults]
+host_key_checking = True
+gathering = explicit
+fact_caching = jsonfile
+fact_caching_connection = {facts_path}
+fact_caching_timeout = 86400
+
+[ssh_connection]
+pipelining = True
+ssh_args = -C -o ControlMaster=auto -o ControlPersist=30m -o ServerAliveInterval=30 {host_key_args}
+control_path_dir = ~/.ansible/cp
+control_path = %(directory)s/%%C
+"""
 
 class InventoryConfiguration(object):
     def __init__(self, inventory_path):
@@ -35,12 +61,194 @@ class InventoryConfiguration(object):
                     else:
                         ansible_password = "ansible_password={}".format(password)
                         inventory.write("{} {} {} {}\n".format(public_ip, ansible_user, ansible_password, comment))
+        self.make_config()
+
+    def make_config(self):
+        """
+        Write the ansible.cfg of the inventory, used by all the runs against it
+        :return: path of the ansible.cfg
+        """
+        config_path = self.get_config_path(self.path)
+        with open(config_path, "w") as config:
+            host_key_args = " ".join(SshExecutor.get_host_key_options(self.get_known_hosts_path(self.path)))
+            config.write(ANSIBLE_CONFIG_TEMPLATE.format(facts_path=self.path.with_suffix(".facts"),
+                                                        host_key_args=host_key_args))
+        return config_path
+
+    @staticmethod
+    def get_config_path(inventory_path):
+        return Path(inventory_path).with_suffix(".ansible.cfg")
+
+    @staticmethod
+    def get_known_hosts_path(inventory_path):
+        return Path(inventory_path).with_suffix(".known_hosts")
+
+    @staticmethod
+    def get_envvars(inventory_path):
+        """
+        :param inventory_path: path of the inventory, or a dict inventory
+        :return: environment of the ansible runs against the inventory, the ansible.cfg of the inventory is used if
+                 it exists
+        """
+        if isinstance(inventory_path, dict):
+            return dict()
+        config_path = InventoryConfiguration.get_config_path(inventory_path)
+        return {"ANSIBLE_CONFIG": str(config_path)} if config_path.is_file() else dict()
+
+    @staticmethod
+    def read_inventory(inventory_path):
+        """
+        :param inventory_path: path of an inventory written by make_inventory
+        :return: dict inventory {"all": {"hosts": {ip: hostvars}, "children": {group: {"hosts": {ip: {}}}}}}
+        """
+        hosts = dict()
+        children = dict()
+        group = None
+        with open(inventory_path) as inventory:
+            for line in inventory:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                if line.startswith("["):
+                    group = line.strip("[]")
+                    continue
+                fields = line.split()
+                hosts[fields[0]] = dict(field.split("=", 1) for field in fields[1:])
+                if group is not None:
+                    children.setdefault(group, {"hosts": dict()})["hosts"][fields[0]] = dict()
+        return {"all": {"hosts": hosts, "children": children}}
+
+    @staticmethod
+    def get_hosts(inventory_path, host_pattern="all"):
+        """
+        :param inventory_path: path of an inventory written by make_inventory, or a dict inventory
+        :param host_pattern: all, localhost, a group or the ip of a host
+        :return: list of tuples (host, user) matching the pattern
+        """
+        if host_pattern == "localhost":
+            return [("localhost", None)]
+        if isinstance(inventory_path, dict):
+            inventory = inventory_path
+        else:
+            inventory = InventoryConfiguration.read_inventory(inventory_path)
+        hosts = inventory["all"]["hosts"]
+        if host_pattern == "all":
+            selected = list(hosts)
+        elif host_pattern in inventory["all"]["children"]:
+            selected = list(inventory["all"]["children"][host_pattern]["hosts"])
+        else:
+            selected = [host for host in hosts if host == host_pattern]
+        return [(host, hosts[host].get("ansible_user", None)) for host in selected]
+
+    @staticmethod
+    def get_event_handler(on_host_task, attempt=0):
+        """
+        :param on_host_task: optional callable (dict with host, task, status, duration, attempt and timestamp),
+                             called as soon as a task is completed in a host
+        :param attempt: 0 for the first run, n for the n-th retry
+        :return: event handler for ansible-runner
+        """
+        def event_handler(event):
+            status = HOST_EVENTS.get(event.get("event", None), None)
+            if status is not None and on_host_task is not None:
+                event_data = event.get("event_data", dict())
+                on_host_task({"host": event_data.get("host", None), "task": event_data.get("task", None),
+                              "status": status, "duration": event_data.get("duration", None), "attempt": attempt,
+                              "timestamp": time()})
+            return True
+
+        return event_handler
+
+    @staticmethod
+    def get_retry_hosts(stats):
+        """
+        :return: sorted list of the failed and of the unreachable hosts of the stats
+        """
+        if not stats:
+            return []
+        return sorted(set(stats.get("failures", dict())) | set(stats.get("dark", dict())))
+
+    @staticmethod
+    def merge_stats(stats, retry_stats, hosts):
+        """
+        :param stats: stats of the previous runs
+        :param retry_stats: stats of the run of the retried hosts
+        :param hosts: retried hosts, their previous stats are replaced by the ones of the retry
+        :return: merged stats
+        """
+        merged = {key: {host: count for host, count in values.items() if host not in hosts}
+                  for key, values in stats.items()}
+        for key, values in (retry_stats or dict()).items():
+            merged.setdefault(key, dict()).update(values)
+        return merged
+
+    @staticmethod
+    def run_with_retries(run, retries=0, backoff=DEFAULT_BACKOFF):
+        """
+        Run on all the hosts, then run again only on the failed and on the unreachable hosts, waiting backoff
+        seconds before the first retry and doubling them at every retry
+        :param run: callable (hosts, attempt) returning the stats, hosts is None for the first run
+        :param retries: maximum number of retries
+        :param backoff: seconds before the first retry
+        :return: merged stats of all the runs
+        """
+        stats = run(None, 0)
+        for attempt in range(1, retries + 1):
+            hosts = InventoryConfiguration.get_retry_hosts(stats)
+            if not hosts:
+                break
+            sleep(backoff * 2 ** (attempt - 1))
+            stats = InventoryConfiguration.merge_stats(stats, run(hosts, attempt), hosts)
+        return stats
 
     @staticmethod
-    def run_inventory(inventory_path, host_pattern, module, module_args, forks=10, cmdline="--become"):
-        r = ansible_runner.run(host_pattern=host_pattern, module=module, module_args=module_args,
-                               inventory=inventory_path, forks=forks, cmdline=cmdline)
-        return r.stats
+    def run_inventory(inventory_path, host_pattern, module, module_args, forks=10, cmdline="--become",
+                      executor="ansible", envvars=None, retries=0, backoff=DEFAULT_BACKOFF, on_host_task=None,
+                      known_hosts_path=None):
+        """
+        :param inventory_path: path of the inventory, or a dict inventory
+        :param executor: ansible, or ssh to run the simple modules with SshExecutor, without the fixed cost of an
+                         ansible run
+        :param envvars: optional environment of the ansible run, the one of the inventory otherwise
+        :param retries: number of times the failed and the unreachable hosts are run again
+        :param backoff: seconds before the first retry, doubled at every retry
+        :param on_host_task: optional callable (dict with host, task, status, duration, attempt and timestamp),
+                             called as soon as the task is completed in a host
+        :param known_hosts_path: known hosts of the ssh executor, the ones of the inventory file by default, it is
+                                 needed with a dict inventory
+        :return: stats of the run
+        """
+        if executor not in EXECUTORS:
+            raise ValueError("executor should be one of {}, got: {}".format(EXECUTORS, executor))
+        if executor == "ssh":
+            all_hosts = InventoryConfiguration.get_hosts(inventory_path, host_pattern=host_pattern)
+            if known_hosts_path is None:
+                if isinstance(inventory_path, dict):
+                    raise ValueError("known_hosts_path is needed by the ssh executor with a dict inventory")
+                known_hosts_path = InventoryConfiguration.get_known_hosts_path(inventory_path)
+
+            def run(hosts, attempt):
+                ssh_executor = SshExecutor(known_hosts_path=known_hosts_path, concurrency=forks)
+                stats = ssh_executor.run([(host, user) for host, user in all_hosts if hosts is None or host in hosts],
+                                         module=module, module_args=module_args, become="--become" in cmdline)
+                if on_host_task is not None:
+                    for host, duration in ssh_executor.durations.items():
+                        status = "ok" if host in stats["ok"] else "unreachable" if host in stats["dark"] else "failed"
+                        on_host_task({"host": host, "task": module, "status": status, "duration": duration,
+                                      "attempt": attempt, "timestamp": time()})
+                return stats
+        else:
+            if envvars is None:
+                envvars = InventoryConfiguration.get_envvars(inventory_path)
+
+            def run(hosts, attempt):
+                r = ansible_runner.run(host_pattern=host_pattern if hosts is None else ":".join(hosts), module=module,
+                                       module_args=module_args, inventory=inventory_path, forks=forks,
+                                       cmdline=cmdline, envvars=envvars,
+                                       event_handler=InventoryConfiguration.get_event_handler(on_host_task, attempt))
+                return r.stats
+
+        return InventoryConfiguration.run_with_retries(run, retries=retries, backoff=backoff)
 
 
 if __name__ == '__main__':
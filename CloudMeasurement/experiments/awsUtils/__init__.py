@@ -1 +1,6 @@
+from .apiInstrumentation import ApiCallRecorder
 from .awsUtils import AWSUtils
+from .clientPool import ClientPool
+from .metadataCatalog import MetadataCatalog
+from .rateLimiter import RateLimiter, TokenBucket
+from .trustedHandles import TrustedHandles
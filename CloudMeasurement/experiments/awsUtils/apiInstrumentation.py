@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from threading import Lock, local
+from time import time
+
+DEFAULT_PHASE = "other"
+
+
+class ApiCallRecorder(object):
+    def __init__(self):
+        """
+        Record every api call made by the registered boto3 clients using the botocore event system:
+        operation name, region, latency, retries and error code, tagged with the current provisioning phase.
+        The phase belongs to the thread that sets it, the threads of the executors get it with bind_phase.
+        """
+        self._lock = Lock()
+        self._local = local()
+        self.records = []
+
+    @property
+    def phase(self):
+        return getattr(self._local, "phase", DEFAULT_PHASE)
+
+    def register(self, client, region):
+        """
+        Hook the recorder in the botocore events of the client
+        :param client: boto3 client, for a resource use resource.meta.client
+        :param region: region of the client
+        :return: None
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+
+        def start_call(model, context, **kwargs):
+            context["cm_start_time"] = time()
+            context["cm_phase"] = self.phase
+            context["cm_operation"] = model.name
+
+        # after-call-error is emitted without the operation model
+        def end_call(context, http_response=None, parsed=None, exception=None, **kwargs):
+            start_time = context.get("cm_start_time", time())
+            error, retries = None, 0
+            if parsed is not None:
+                retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+                if http_response is not None and http_response.status_code >= 300:
+                    error = parsed.get("Error", {}).get("Code", str(http_response.status_code))
+            if exception is not None:
+                error = type(exception).__name__
+            self.add_record(operation=context.get("cm_operation", None), region=region,
+                            phase=context.get("cm_phase", self.phase), latency=time() - start_time, retries=retries,
+                            error=error, timestamp=start_time)
+
+        client.meta.events.register("before-parameter-build.{}".format(service), start_call)
+        client.meta.events.register("after-call.{}".format(service), end_call)
+        client.meta.events.register("after-call-error.{}".format(service), end_call)
+
+    def add_record(self, operation, region, phase, latency, retries=0, error=None, timestamp=None):
+        with self._lock:
+            self.records.append({"operation": operation, "region": region, "phase": phase, "latency": latency,
+                                 "retries": retries, "error": error,
+                                 "timestamp": time() if timestamp is None else timestamp})
+
+    def set_phase(self, phase):
+        """
+        Set the phase assigned to the next api calls of this thread, ex. "vpc_creation", "peering",
+        "instance_launch", "teardown"
+        :param phase: phase name
+        :return: None
+        """
+        self._local.phase = phase
+
+    @contextmanager
+    def record_phase(self, phase):
+        previous_phase = self.phase
+        self.set_phase(phase)
+        try:
+            yield
+        finally:
+            self.set_phase(previous_phase)
+
+    def bind_phase(self, function):
+        """
+        :param function: function run in another thread, ex. submitted to a ThreadPoolExecutor
+        :return: function recording its api calls with the phase of this thread
+        """
+        phase = self.phase
+
+        def run(*args, **kwargs):
+            with self.record_phase(phase):
+                return function(*args, **kwargs)
+        return run
+
+    def get_records(self):
+        with self._lock:
+            return list(self.records)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+        self.set_phase(DEFAULT_PHASE)
+
+    @staticmethod
+    def summarize(records):
+        """
+        Aggregate the records by phase and operation
+        :param records: list of records
+        :return: dict {(phase, operation): {"calls", "latency", "max_latency", "retries", "errors"}}
+        """
+        summary = dict()
+        for record in records:
+            key = (record["phase"], record["operation"])
+            stats = summary.setdefault(key, {"calls": 0, "latency": 0.0, "max_latency": 0.0, "retries": 0,
+                                             "errors": 0})
+            stats["calls"] += 1
+            stats["latency"] += record["latency"]
+            stats["max_latency"] = max(stats["max_latency"], record["latency"])
+            stats["retries"] += record["retries"]
+            stats["errors"] += int(record["error"] is not None)
+        return summary
@@ -1,17 +1,132 @@
-import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-from time import sleep
+
+from .apiInstrumentation import ApiCallRecorder
+from .clientPool import ClientPool
+from .metadataCatalog import MetadataCatalog
+from .polling import poll_until
+from .rateLimiter import RateLimiter
+from .trustedHandles import TrustedHandles
+from .vpcTeardown import VpcTeardown
+from CloudMeasurement.experiments.sshProbe import SshProbe, SSH_PORT, DEFAULT_PROBE_TIMEOUT
+
+VPC_QUOTA = ("vpc", "L-F678F1CE")
+STANDARD_VCPUS_QUOTA = ("ec2", "L-1216C47A")
+STANDARD_INSTANCE_FAMILIES = ("a", "c", "d", "h", "i", "m", "r", "t", "z")
+DEFAULT_MAX_VPCS = 5
+# 20 t3.small instances, the previous default limit
+DEFAULT_MAX_VCPUS = 40
+# transit gateways and their attachments need some minutes to become available or to be deleted
+TRANSIT_GATEWAY_TIMEOUT = 900
+# seconds allowed to create or copy an image
+IMAGE_TIMEOUT = 3600
+
+RATE_LIMITER = RateLimiter()
+API_RECORDER = ApiCallRecorder()
+# the retries are handled by the RATE_LIMITER, the botocore ones are disabled
+CLIENT_POOL = ClientPool(config=Config(retries={"mode": "legacy", "max_attempts": 0}), rate_limiter=RATE_LIMITER,
+                         recorder=API_RECORDER)
+METADATA_CATALOG = MetadataCatalog()
+TRUSTED_HANDLES = TrustedHandles()
 
 
 class AWSUtils(object):
     def __init__(self, region="eu-central-1"):
-        self.ec2_resource = boto3.resource('ec2', region_name=region)
-        self.ec2_client = boto3.client('ec2', region_name=region)
+        self.ec2_resource = AWSUtils.get_resource(region=region)
+        self.ec2_client = AWSUtils.get_client(region=region)
+
+    @staticmethod
+    def get_client(region, service="ec2"):
+        """
+        Return the pooled boto3 client for the region, every AWSUtils method should use it instead of boto3.client
+        :param region: region name ex. eu-central-1
+        :param service: aws service name
+        :return: boto3 client
+        """
+        return CLIENT_POOL.get_client(region=region, service=service)
+
+    @staticmethod
+    def get_resource(region, service="ec2"):
+        """
+        Return the pooled boto3 resource for the region and the current thread
+        :param region: region name ex. eu-central-1
+        :param service: aws service name
+        :return: boto3 resource
+        """
+        return CLIENT_POOL.get_resource(region=region, service=service)
+
+    @staticmethod
+    def get_rate_limiter_metrics():
+        """
+        :return: dict with the calls, throttles, retries and the time spent waiting, in total and per region
+        """
+        return RATE_LIMITER.get_metrics()
+
+    @staticmethod
+    def get_api_calls():
+        """
+        :return: dict with the number of api calls made by the pooled clients, for every operation
+        """
+        return CLIENT_POOL.get_api_calls()
+
+    @staticmethod
+    def set_api_phase(phase):
+        """
+        Set the provisioning phase assigned to the next api calls
+        :param phase: phase name ex. "vpc_creation", "peering", "instance_launch", "teardown"
+        :return: None
+        """
+        API_RECORDER.set_phase(phase)
+
+    @staticmethod
+    def bind_api_phase(function):
+        """
+        :param function: function submitted to a ThreadPoolExecutor
+        :return: function whose api calls get the provisioning phase of the calling thread
+        """
+        return API_RECORDER.bind_phase(function)
+
+    @staticmethod
+    def get_api_records():
+        """
+        :return: list of the recorded api calls, every record is a dict with operation, region, phase, latency,
+        retries, error and timestamp
+        """
+        return API_RECORDER.get_records()
+
+    @staticmethod
+    def clear_api_records():
+        API_RECORDER.clear()
+
+    @staticmethod
+    def get_tag_specifications(resource_type, name, tags=None):
+        """
+        Build the TagSpecifications parameter, so the resources are tagged in the same call that creates them
+        :param resource_type: ec2 resource type ex. "vpc", "subnet", "instance"
+        :param name: value of the Name tag
+        :param tags: optional dict with other tags
+        :return: list for the TagSpecifications parameter
+        """
+        tags_list = [{"Key": "Name", "Value": name}]
+        if tags is not None:
+            tags_list += [{"Key": key, "Value": value} for key, value in tags.items()]
+        return [{"ResourceType": resource_type, "Tags": tags_list}]
+
+    @staticmethod
+    def get_pool_stats():
+        """
+        :return: dict with the number of sessions, clients and resources created and reused by the pool
+        """
+        return CLIENT_POOL.get_stats()
 
     @staticmethod
     def check_if_region_exists(region):
         regions = AWSUtils.get_all_regions()
+        if region not in regions:
+            # the cached list may be older than the region, check it again before failing
+            regions = AWSUtils.get_all_regions(refresh=True)
         if region not in regions:
             raise ValueError("The region that you specified '{}' does not exists,"
                              " possible regions are: {}".format(region, regions))
@@ -23,33 +138,62 @@ class AWSUtils(object):
             raise ValueError("The Availability Zone that you specified '{}' does not exists in region {},"
                              "possible az in the region are: {}".format(az, region, azs))
 
+    @staticmethod
+    def trust_resource(region, resource_id):
+        """
+        Mark a resource id as trusted, the validation of a trusted id is skipped
+        :param region: region where the resource is created
+        :param resource_id: id of the resource ex. vpc-xxxx
+        :return: None
+        """
+        TRUSTED_HANDLES.add(region=region, resource_id=resource_id)
+
+    @staticmethod
+    def check_if_resource_id_exists_in_region(resource_id, region, describe_operation, ids_parameter, description):
+        """
+        Check that a resource exists with a describe call filtered on its id, the resource ids created by the tool
+        are trusted and they are not checked again
+        :param resource_id: id of the resource
+        :param region: region where the resource should be
+        :param describe_operation: name of the ec2 client describe method ex. "describe_subnets"
+        :param ids_parameter: name of the ids parameter of the describe method ex. "SubnetIds"
+        :param description: name of the resource used in the error message
+        :return: None
+        """
+        if TRUSTED_HANDLES.is_trusted(region=region, resource_id=resource_id):
+            return
+        ec2_client = AWSUtils.get_client(region=region)
+        try:
+            getattr(ec2_client, describe_operation)(**{ids_parameter: [resource_id]})
+        except ClientError as e:
+            error_code = e.response.get("Error", {}).get("Code", "")
+            if error_code.endswith(".NotFound") or error_code.endswith(".Malformed"):
+                raise ValueError("The {} that you specified '{}' does not exists in region {}"
+                                 "".format(description, resource_id, region))
+            raise
+
     @staticmethod
     def check_if_route_table_id_exists_in_region(route_table_id, region):
-        route_table_ids = AWSUtils.get_route_table_ids_in_the_region(region=region)
-        if route_table_id not in route_table_ids:
-            raise ValueError("The Route Table id that you specified '{}' does not exists in region {},"
-                             "possible Route Tables in the region are: {}".format(route_table_id, region,
-                                                                                  route_table_ids))
+        AWSUtils.check_if_resource_id_exists_in_region(resource_id=route_table_id, region=region,
+                                                       describe_operation="describe_route_tables",
+                                                       ids_parameter="RouteTableIds", description="Route Table id")
 
     @staticmethod
     def check_if_subnet_id_exists_in_region(subnet_id, region):
         AWSUtils.check_if_region_exists(region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
-        list_of_subnets = ec2_resource.subnets.all()
-        subnets_ids = [subnet.id for subnet in list_of_subnets]
-        if subnet_id not in subnets_ids:
-            raise ValueError("The Subnet id that you specified '{}' does not exists in region {},"
-                             "possible Subnet in the region are: {}".format(subnet_id, region, subnets_ids))
+        AWSUtils.check_if_resource_id_exists_in_region(resource_id=subnet_id, region=region,
+                                                       describe_operation="describe_subnets",
+                                                       ids_parameter="SubnetIds", description="Subnet id")
 
     @staticmethod
     def get_route_table_ids_in_the_region(region):
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         return [rt.id for rt in list(ec2_resource.route_tables.iterator())]
 
     @staticmethod
     def create_vpc_peering(region, vpc_id, peer_region, peer_vpc_id):
         AWSUtils.check_if_region_exists(region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         peer_request = ec2_resource.create_vpc_peering_connection(PeerVpcId=peer_vpc_id,
                                                                   PeerRegion=peer_region,
                                                                   VpcId=vpc_id)
@@ -57,17 +201,12 @@ class AWSUtils(object):
         vpc_requester = ec2_resource.Vpc(id=vpc_id)
         AWSUtils.check_if_region_exists(region=peer_region)
 
-        ec2_resource = boto3.resource('ec2', region_name=peer_region)
+        ec2_resource = AWSUtils.get_resource(region=peer_region)
         vpc_accepter = ec2_resource.Vpc(id=peer_vpc_id)
-        peer_request = None
-        for t in range(10):
-            try:
-                peer_request = list(ec2_resource.vpc_peering_connections.filter(
-                    VpcPeeringConnectionIds=[request_id]))
-                break
-            except ClientError:
-                print("ClientError on try: {} {}".format(t, request_id))
-                sleep(0.5)
+        # the request is not immediately visible in the peer region
+        AWSUtils.get_client(region=peer_region).get_waiter("vpc_peering_connection_exists").wait(
+            VpcPeeringConnectionIds=[request_id], WaiterConfig={"Delay": 2, "MaxAttempts": 30})
+        peer_request = list(ec2_resource.vpc_peering_connections.filter(VpcPeeringConnectionIds=[request_id]))
 
         if not peer_request:
             raise IndexError("the peer request is empty: {}".format(request_id))
@@ -90,23 +229,101 @@ class AWSUtils(object):
         return response
 
     @staticmethod
-    def get_all_regions(region="eu-central-1"):
-        ec2_client = boto3.client('ec2', region_name=region)
+    def request_vpc_peering(region, vpc_id, peer_region, peer_vpc_id):
+        """
+        Request a peering connection, without waiting for its acceptance
+        :param region: region of the requester vpc
+        :param vpc_id: requester vpc id
+        :param peer_region: region of the accepter vpc
+        :param peer_vpc_id: accepter vpc id
+        :return: VpcPeeringConnectionId
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.create_vpc_peering_connection(VpcId=vpc_id, PeerVpcId=peer_vpc_id,
+                                                            PeerRegion=peer_region)
+        return response["VpcPeeringConnection"]["VpcPeeringConnectionId"]
+
+    @staticmethod
+    def accept_vpc_peerings(region, peering_ids):
+        """
+        Accept all the peering connections requested to the vpcs of a region, with a single waiter and a single
+        describe call for all of them
+        :param region: region of the accepter vpcs
+        :param peering_ids: list of VpcPeeringConnectionIds
+        :return: list of the accept responses
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        # the requests are not immediately visible in the accepter region
+        ec2_client.get_waiter("vpc_peering_connection_exists").wait(
+            VpcPeeringConnectionIds=peering_ids, WaiterConfig={"Delay": 2, "MaxAttempts": 30})
+        peerings = ec2_client.describe_vpc_peering_connections(
+            VpcPeeringConnectionIds=peering_ids)["VpcPeeringConnections"]
+        for peering in peerings:
+            if peering["Status"]["Code"] != "pending-acceptance":
+                raise ValueError("status code for peering request {} in {} is {}"
+                                 "".format(peering["VpcPeeringConnectionId"], region, peering["Status"]["Code"]))
+        return [ec2_client.accept_vpc_peering_connection(VpcPeeringConnectionId=peering_id)
+                for peering_id in peering_ids]
+
+    @staticmethod
+    def add_peer_routes(region, route_table_id, routes):
+        """
+        Program all the peering routes of a route table in a single pass
+        :param region: region of the route table
+        :param route_table_id: RouteTable Id
+        :param routes: dict {destination cidr block: VpcPeeringConnectionId}
+        :return: list of the create_route responses
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        return [ec2_client.create_route(RouteTableId=route_table_id, DestinationCidrBlock=destination_cidr_block,
+                                        VpcPeeringConnectionId=peering_id)
+                for destination_cidr_block, peering_id in routes.items()]
+
+    @staticmethod
+    def get_all_regions(region="eu-central-1", refresh=False):
+        """
+        Return the sorted list of the regions, the list is read from the metadata catalog when it is not expired
+        :param region: region used to query the regions
+        :param refresh: ignore the catalog and query the regions again
+        :return: list of region names
+        """
+        if not refresh:
+            list_region = METADATA_CATALOG.get("regions", "all")
+            if list_region is not None:
+                return list_region
+        ec2_client = AWSUtils.get_client(region=region)
         response = ec2_client.describe_regions()
         list_region = []
         for region in response['Regions']:
             list_region.append(region['RegionName'])
-        return sorted(list_region)
+        list_region = sorted(list_region)
+        METADATA_CATALOG.put("regions", "all", list_region)
+        return list_region
 
     @staticmethod
     def get_az_in_the_region(region="eu-central-1"):
+        list_az = METADATA_CATALOG.get("azs", region)
+        if list_az is not None:
+            return list_az
         AWSUtils.check_if_region_exists(region=region)
-        temp_client = boto3.client('ec2', region_name=region)
+        temp_client = AWSUtils.get_client(region=region)
         response = temp_client.describe_availability_zones()
         list_az = []
         for az in list(response['AvailabilityZones']):
             list_az.append(az['ZoneName'])
-        return sorted(list_az)
+        list_az = sorted(list_az)
+        METADATA_CATALOG.put("azs", region, list_az)
+        return list_az
+
+    @staticmethod
+    def invalidate_metadata(kind=None, region=None):
+        """
+        Invalidate the cached regions, availability zones and AMI ids
+        :param kind: "regions", "azs" or "ami", by default all of them
+        :param region: invalidate only the metadata of this region
+        :return: None
+        """
+        METADATA_CATALOG.invalidate(kind=kind, region=region)
 
     @staticmethod
     def get_all_az(region="eu-central-1"):
@@ -128,10 +345,11 @@ class AWSUtils(object):
         :return: vpc id
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
-        vpc = ec2_resource.create_vpc(CidrBlock=cidr_block, **kwargs)
-        vpc.create_tags(Tags=[{"Key": "Name", "Value": vpc_name}])
+        ec2_resource = AWSUtils.get_resource(region=region)
+        vpc = ec2_resource.create_vpc(CidrBlock=cidr_block,
+                                      TagSpecifications=AWSUtils.get_tag_specifications("vpc", vpc_name), **kwargs)
         vpc.wait_until_available()
+        AWSUtils.trust_resource(region=region, resource_id=vpc.id)
         return vpc.id
 
     @staticmethod
@@ -144,7 +362,7 @@ class AWSUtils(object):
         :return: None
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         ec2_client.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={"Value": value})
 
     @staticmethod
@@ -157,7 +375,7 @@ class AWSUtils(object):
         :return: None
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         ec2_client.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={"Value": value})
 
     @staticmethod
@@ -170,14 +388,15 @@ class AWSUtils(object):
         :return: None
         """
         AWSUtils.check_if_subnet_id_exists_in_region(subnet_id=subnet_id, region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         response = ec2_client.modify_subnet_attribute(MapPublicIpOnLaunch={'Value': value, }, SubnetId=subnet_id, )
         status_code = response["ResponseMetadata"]["HTTPStatusCode"]
         if status_code != 200:
             raise ValueError("The request returned a wrong HTTPStatusCode: {}".format(status_code))
 
     @staticmethod
-    def create_subnet(vpc_id, region, az, subnet_name, cidr_block, route_table_id, **kwargs):
+    def create_subnet(vpc_id, region, az, subnet_name, cidr_block, route_table_id, map_public_ip_on_launch=False,
+                      **kwargs):
         """
         Create a subnet inside a Vpc
         :param vpc_id: id of a Vpc already created; be careful, the Vpc should be ready, before creating a subnet
@@ -188,6 +407,7 @@ class AWSUtils(object):
          that the subnet pool is valid. You can check if it is a valid subnet at:
          https://docs.aws.amazon.com/vpc/latest/userguide/VPC_Subnets.html
         :param route_table_id: Route table id associated to the subnet
+        :param map_public_ip_on_launch: enable MapPublicIpOnLaunch on the new subnet, without validating it again
         :param kwargs: Optional parameters that you can assign to the Subnet
         :return: subnet object from boto3.resource('ec2')
         """
@@ -195,24 +415,33 @@ class AWSUtils(object):
         AWSUtils.check_if_az_exists_in_region(az=az, region=region)
         AWSUtils.check_if_route_table_id_exists_in_region(route_table_id=route_table_id, region=region)
 
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         route_table = ec2_resource.RouteTable(route_table_id)
-        subnet = ec2_resource.create_subnet(CidrBlock=cidr_block, VpcId=vpc_id, AvailabilityZone=az, **kwargs)
-        subnet.create_tags(Tags=[{"Key": "Name", "Value": subnet_name}])
+        subnet = ec2_resource.create_subnet(CidrBlock=cidr_block, VpcId=vpc_id, AvailabilityZone=az,
+                                            TagSpecifications=AWSUtils.get_tag_specifications("subnet", subnet_name),
+                                            **kwargs)
+        AWSUtils.trust_resource(region=region, resource_id=subnet.id)
+        if map_public_ip_on_launch:
+            # CreateSubnet does not accept MapPublicIpOnLaunch, the subnet is trusted so no validation is done
+            AWSUtils.modify_MapPublicIpOnLaunch(subnet_id=subnet.id, region=region, value=True)
         route_table.associate_with_subnet(SubnetId=subnet.id)
         return subnet.id
 
     @staticmethod
-    def create_internet_gateway(region, **kwargs):
+    def create_internet_gateway(region, gateway_name=None, **kwargs):
         """
         Create an Internet Gateway
         :param region: region where to crate the Internet Gateway
+        :param gateway_name: optional Name tag of the gateway
         :param kwargs: Optional parameters that you can assign to the gateway
         :return: Internet Gateway id
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
+        if gateway_name is not None:
+            kwargs["TagSpecifications"] = AWSUtils.get_tag_specifications("internet-gateway", gateway_name)
         IGW = ec2_resource.create_internet_gateway(**kwargs)
+        AWSUtils.trust_resource(region=region, resource_id=IGW.id)
         return IGW.id
 
     @staticmethod
@@ -227,18 +456,18 @@ class AWSUtils(object):
         """
         AWSUtils.check_if_region_exists(region=region)
         vpc = AWSUtils.get_vpc_obj_from_vpc_id(vpc_id=vpc_id, region=region)
-        route_table = vpc.create_route_table(**kwargs)
-        sleep(1)
-        route_table.create_tags(Tags=[{"Key": "Name", "Value": table_name}])
+        route_table = vpc.create_route_table(TagSpecifications=AWSUtils.get_tag_specifications("route-table",
+                                                                                               table_name),
+                                             **kwargs)
+        AWSUtils.trust_resource(region=region, resource_id=route_table.id)
         return route_table.id
 
     @staticmethod
     def get_vpc_obj_from_vpc_id(vpc_id, region):
-        ec2_resource = boto3.resource('ec2', region_name=region)
-        list_of_vpc_ids = [vpc.id for vpc in list(ec2_resource.vpcs.all())]
-        if vpc_id not in list_of_vpc_ids:
-            raise ValueError("vpc_id: {}, do not exist in region {}.\n"
-                             "available ids are: {}".format(vpc_id, region, list_of_vpc_ids))
+        AWSUtils.check_if_resource_id_exists_in_region(resource_id=vpc_id, region=region,
+                                                       describe_operation="describe_vpcs",
+                                                       ids_parameter="VpcIds", description="vpc_id")
+        ec2_resource = AWSUtils.get_resource(region=region)
         vpc = ec2_resource.Vpc(vpc_id)
         return vpc
 
@@ -254,7 +483,7 @@ class AWSUtils(object):
         :return: Route Object
         """
         AWSUtils.check_if_route_table_id_exists_in_region(route_table_id=route_table_id, region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         route_table = ec2_resource.RouteTable(route_table_id)
         route = route_table.create_route(GatewayId=gateway_id, DestinationCidrBlock=destination_cidr_block, **kwargs)
         return route
@@ -271,7 +500,7 @@ class AWSUtils(object):
         :return: Route Object
         """
         AWSUtils.check_if_route_table_id_exists_in_region(route_table_id=route_table_id, region=region)
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         route_table = ec2_resource.RouteTable(route_table_id)
         route = route_table.create_route(VpcPeeringConnectionId=peer_id,
                                          DestinationCidrBlock=destination_cidr_block, **kwargs)
@@ -292,7 +521,8 @@ class AWSUtils(object):
         vpc_obj.attach_internet_gateway(InternetGatewayId=internet_gateway_id, **kwargs)
 
     @staticmethod
-    def run_instances(region, subnet_id, instance_type, key_name, image_id, number_of_instances=1, **kwargs):
+    def run_instances(region, subnet_id, instance_type, key_name, image_id, number_of_instances=1,
+                      security_group_ids=None, instance_name=None, **kwargs):
         """
         Run multiple instances in the specified SubnetId, using the specified KeyName pair and The specified Id
         :param region:
@@ -301,12 +531,18 @@ class AWSUtils(object):
         :param key_name:
         :param image_id:
         :param number_of_instances:
+        :param security_group_ids: optional list of Security Groups Ids assigned at launch
+        :param instance_name: optional Name tag assigned at launch
         :param kwargs: Optional parameters to personalize your image, the correct documentation can be found at:
         https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.run_instances
         :return: list of the instances ids
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
+        if security_group_ids is not None:
+            kwargs["SecurityGroupIds"] = security_group_ids
+        if instance_name is not None:
+            kwargs["TagSpecifications"] = AWSUtils.get_tag_specifications("instance", instance_name)
         response = ec2_client.run_instances(SubnetId=subnet_id, ImageId=image_id, InstanceType=instance_type,
                                             KeyName=key_name, MaxCount=number_of_instances,
                                             MinCount=number_of_instances, **kwargs)
@@ -325,13 +561,13 @@ class AWSUtils(object):
         :return: None
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         ec2_client.get_waiter('instance_running').wait(Filters=[{'Name': "instance-id", "Values": instances_id_list}])
 
     @staticmethod
     def create_security_group(vpc_id, region, security_group_name, description="", **kwargs):
         """
-        Create a new Security in the Vpc
+        Create a new Security in the Vpc, the Name tag is the security_group_name
         :param region: region where the vpc is created
         :param vpc_id: Vpc Id where to create the new Security Group
         :param security_group_name: Name of the Security Group, it should be unique
@@ -340,9 +576,13 @@ class AWSUtils(object):
         :return: SecurityGroup Id
         """
         AWSUtils.check_if_region_exists(region=region)
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         sg = ec2_client.create_security_group(VpcId=vpc_id, GroupName=security_group_name,
-                                              Description=description, **kwargs)
+                                              Description=description,
+                                              TagSpecifications=AWSUtils.get_tag_specifications("security-group",
+                                                                                                security_group_name),
+                                              **kwargs)
+        AWSUtils.trust_resource(region=region, resource_id=sg["GroupId"])
         return sg["GroupId"]
 
     @staticmethod
@@ -372,7 +612,7 @@ class AWSUtils(object):
 
         ingress_data, egress_data = None, None
 
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         if "ingress" in directions:
             ingress_data = ec2_client.authorize_security_group_ingress(GroupId=security_group_id,
                                                                        IpPermissions=ip_permissions)
@@ -397,7 +637,7 @@ class AWSUtils(object):
         """
         AWSUtils.check_if_region_exists(region=region)
         responses = []
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         for id_ in instances_id:
             responses.append(ec2_client.modify_instance_attribute(InstanceId=id_, Groups=security_groups, **kwargs))
         return responses
@@ -406,33 +646,135 @@ class AWSUtils(object):
     def generate_experiment_id():
         return str(uuid.uuid4()).split("-")[0].upper()
 
+    @staticmethod
+    def get_service_quota(region, service_code, quota_code, default=None):
+        """
+        Read the applied value of a quota from Service Quotas, falling back to the aws default value
+        :param region: region name
+        :param service_code: service quotas service code ex. "vpc"
+        :param quota_code: quota code ex. "L-F678F1CE"
+        :param default: value returned when the quota can not be read
+        :return: quota value
+        """
+        quotas_client = AWSUtils.get_client(region=region, service="service-quotas")
+        try:
+            return quotas_client.get_service_quota(ServiceCode=service_code, QuotaCode=quota_code)["Quota"]["Value"]
+        except ClientError:
+            pass
+        try:
+            return quotas_client.get_aws_default_service_quota(ServiceCode=service_code,
+                                                               QuotaCode=quota_code)["Quota"]["Value"]
+        except ClientError:
+            return default
+
+    @staticmethod
+    def count_vpcs(region):
+        ec2_client = AWSUtils.get_client(region=region)
+        return sum(len(page["Vpcs"]) for page in ec2_client.get_paginator("describe_vpcs").paginate())
+
+    @staticmethod
+    def count_running_standard_vcpus(region):
+        """
+        Count the vCPUs of the on-demand standard (A, C, D, H, I, M, R, T, Z) instances, the ones limited by the
+        running instances quota
+        :param region: region name
+        :return: number of vCPUs
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        vcpus = 0
+        paginator = ec2_client.get_paginator("describe_instances")
+        for page in paginator.paginate(Filters=[{"Name": "instance-state-name", "Values": ["pending", "running"]}]):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    if "InstanceLifecycle" in instance:
+                        continue
+                    if instance["InstanceType"][0] not in STANDARD_INSTANCE_FAMILIES:
+                        continue
+                    cpu_options = instance.get("CpuOptions", {})
+                    vcpus += cpu_options.get("CoreCount", 1) * cpu_options.get("ThreadsPerCore", 1)
+        return vcpus
+
+    @staticmethod
+    def get_instance_type_vcpus(region, instance_type):
+        vcpus = METADATA_CATALOG.get("vcpus", region, name=instance_type)
+        if vcpus is not None:
+            return vcpus
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.describe_instance_types(InstanceTypes=[instance_type])
+        vcpus = response["InstanceTypes"][0]["VCpuInfo"]["DefaultVCpus"]
+        METADATA_CATALOG.put("vcpus", region, vcpus, name=instance_type)
+        return vcpus
+
+    @staticmethod
+    def get_ena_support(region, instance_type):
+        """
+        :return: True if the instance type supports the Elastic Network Adapter
+        """
+        ena_support = METADATA_CATALOG.get("ena", region, name=instance_type)
+        if ena_support is not None:
+            return ena_support
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.describe_instance_types(InstanceTypes=[instance_type])
+        ena_support = response["InstanceTypes"][0]["NetworkInfo"]["EnaSupport"] in ("required", "supported")
+        METADATA_CATALOG.put("ena", region, ena_support, name=instance_type)
+        return ena_support
+
+    @staticmethod
+    def get_capacity_report(region, vpc_needed=1, instances_needed=1, instance_type="t3.small"):
+        """
+        Compare the resources needed in the region with the used ones and with the account quotas
+        :param region: region name
+        :param vpc_needed: number of new vpcs
+        :param instances_needed: number of new instances
+        :param instance_type: type of the new instances
+        :return: dict with the used, needed and limit values, "ok" is False if the resources are not enough
+        """
+        vpcs_limit = AWSUtils.get_service_quota(region=region, service_code=VPC_QUOTA[0], quota_code=VPC_QUOTA[1],
+                                                default=DEFAULT_MAX_VPCS)
+        vcpus_limit = AWSUtils.get_service_quota(region=region, service_code=STANDARD_VCPUS_QUOTA[0],
+                                                 quota_code=STANDARD_VCPUS_QUOTA[1], default=DEFAULT_MAX_VCPUS)
+        vcpus_needed = instances_needed * AWSUtils.get_instance_type_vcpus(region=region,
+                                                                           instance_type=instance_type)
+        report = {"region": region,
+                  "vpcs_used": AWSUtils.count_vpcs(region=region), "vpcs_needed": vpc_needed,
+                  "vpcs_limit": int(vpcs_limit),
+                  "vcpus_used": AWSUtils.count_running_standard_vcpus(region=region), "vcpus_needed": vcpus_needed,
+                  "vcpus_limit": int(vcpus_limit)}
+        enough_vpcs = report["vpcs_used"] + vpc_needed <= report["vpcs_limit"]
+        enough_vcpus = report["vcpus_used"] + vcpus_needed <= report["vcpus_limit"]
+        report["ok"] = enough_vpcs and enough_vcpus
+        return report
+
+    @staticmethod
+    def preflight(requirements, max_workers=16):
+        """
+        Build the capacity report of all the regions concurrently, before creating any resource
+        :param requirements: dict {region: {"vpc_needed": int, "instances_needed": int, "instance_type": str}}
+        :param max_workers: maximum number of regions queried at the same time
+        :return: dict {region: capacity report}
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {region: executor.submit(AWSUtils.get_capacity_report, region=region, **requirement)
+                       for region, requirement in requirements.items()}
+            return {region: future.result() for region, future in futures.items()}
+
     @staticmethod
     def check_if_it_is_possible_to_create_a_new_vpc_in_the_region(region, vpc_needed=1):
-        default_max_vpcs = 5
-        ec2_client = boto3.client('ec2', region_name=region)
-        usedVpc = len(ec2_client.describe_vpcs()["Vpcs"])
-        if usedVpc + vpc_needed > default_max_vpcs:
+        used_vpcs = AWSUtils.count_vpcs(region=region)
+        max_vpcs = AWSUtils.get_service_quota(region=region, service_code=VPC_QUOTA[0], quota_code=VPC_QUOTA[1],
+                                              default=DEFAULT_MAX_VPCS)
+        if used_vpcs + vpc_needed > max_vpcs:
             raise PermissionError(f"You dont have enough free Vpcs in {region}: Required={vpc_needed},"
-                                  f" used={usedVpc}, limit={default_max_vpcs}")
+                                  f" used={used_vpcs}, limit={max_vpcs}")
 
     @staticmethod
-    def check_if_maximum_it_possible_to_run_instances_in_the_region(region, instances_needed=1):
-        default_total_max_instances = 20
-        ec2_client = boto3.client('ec2', region_name=region)
-        used_instances = {}
-        for reservation in ec2_client.describe_instances()["Reservations"]:
-            instances = reservation["Instances"]
-            for instance in instances:
-                instance_type = instance['InstanceType']
-                if instance["State"]["Name"] == "running":
-                    if instance_type in used_instances.keys():
-                        used_instances[instance_type] += 1
-                    else:
-                        used_instances[instance_type] = 1
-
-        if sum(used_instances.values()) + instances_needed > default_total_max_instances:
-            raise PermissionError(f"You dont have enough free instances: Required={instances_needed},"
-                                  f" used={sum(used_instances)}, limit={default_total_max_instances}")
+    def check_if_maximum_it_possible_to_run_instances_in_the_region(region, instances_needed=1,
+                                                                    instance_type="t3.small"):
+        report = AWSUtils.get_capacity_report(region=region, vpc_needed=0, instances_needed=instances_needed,
+                                              instance_type=instance_type)
+        if report["vcpus_used"] + report["vcpus_needed"] > report["vcpus_limit"]:
+            raise PermissionError(f"You dont have enough free vCPUs in {region}: Required={report['vcpus_needed']},"
+                                  f" used={report['vcpus_used']}, limit={report['vcpus_limit']}")
 
     @staticmethod
     def get_image_AMI_from_region(region, image_name):
@@ -444,7 +786,10 @@ class AWSUtils(object):
                 ex. ubuntu/images/hvm-ssd/ubuntu-bionic-18.04-amd64-server-20190722.1 for Ubuntu bionic
         :return:  string containing the ImageId
         """
-        ec2_client = boto3.client('ec2', region_name=region)
+        image_id = METADATA_CATALOG.get("ami", region, name=image_name)
+        if image_id is not None:
+            return image_id
+        ec2_client = AWSUtils.get_client(region=region)
         images_response_with_filter = ec2_client.describe_images(ExecutableUsers=["all"],
                                                                  Filters=[{"Name": "name", "Values": [image_name]}])
 
@@ -453,17 +798,105 @@ class AWSUtils(object):
             raise RuntimeError(f"Image with Name: {image_name} not found in region:{region}")
         image_description = Images[0]
         image_id = image_description["ImageId"]
+        METADATA_CATALOG.put("ami", region, image_id, name=image_name)
         return image_id
 
+    @staticmethod
+    def create_image(region, instance_id, name):
+        """
+        Create an image from the disk of an instance, and wait until it is available
+        :param region: region of the instance
+        :param instance_id: instance id
+        :param name: name of the image, unique in the region
+        :return: image id
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        image_id = ec2_client.create_image(InstanceId=instance_id, Name=name, Description=name,
+                                           TagSpecifications=AWSUtils.get_tag_specifications("image", name))["ImageId"]
+        AWSUtils.wait_for_state(region=region, describe_operation="describe_images", ids_parameter="ImageIds",
+                                result_key="Images", resource_ids=[image_id], states=("available",),
+                                description="image {}".format(image_id), timeout=IMAGE_TIMEOUT)
+        return image_id
+
+    @staticmethod
+    def copy_image(region, source_region, source_image_id, name):
+        """
+        Copy an image in another region, and wait until the copy is available
+        :param region: destination region
+        :param source_region: region of the image
+        :param source_image_id: image id in the source region
+        :param name: name of the copy
+        :return: image id of the copy
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        image_id = ec2_client.copy_image(SourceRegion=source_region, SourceImageId=source_image_id, Name=name,
+                                         Description=name)["ImageId"]
+        AWSUtils.wait_for_state(region=region, describe_operation="describe_images", ids_parameter="ImageIds",
+                                result_key="Images", resource_ids=[image_id], states=("available",),
+                                description="image {}".format(image_id), timeout=IMAGE_TIMEOUT)
+        return image_id
+
+    @staticmethod
+    def deregister_image(region, image_id):
+        ec2_client = AWSUtils.get_client(region=region)
+        return ec2_client.deregister_image(ImageId=image_id)
+
+    @staticmethod
+    def describe_instances_data(region, instances_id_list):
+        """
+        Read the addresses, the availability zone and the state of many instances with a single paginated
+        describe_instances call
+        :param region: region where the instances are running
+        :param instances_id_list: List of instances Ids
+        :return: dict {instance_id: {"public_address", "private_address", "availability_zone", "state"}}
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        instances_data = dict()
+        paginator = ec2_client.get_paginator("describe_instances")
+        for page in paginator.paginate(Filters=[{"Name": "instance-id", "Values": instances_id_list}]):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instances_data[instance["InstanceId"]] = {
+                        "public_address": instance.get("PublicIpAddress", None),
+                        "private_address": instance.get("PrivateIpAddress", None),
+                        "availability_zone": instance["Placement"]["AvailabilityZone"],
+                        "state": instance["State"]["Name"]}
+        return instances_data
+
+    @staticmethod
+    def get_instances_status(region, instances_id_list):
+        """
+        Read the status checks of many instances with a single paginated describe_instance_status call
+        :param region: region where the instances are running
+        :param instances_id_list: List of instances Ids
+        :return: dict {instance_id: "ok" when both the system and the instance checks are ok}
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        statuses = dict()
+        paginator = ec2_client.get_paginator("describe_instance_status")
+        for page in paginator.paginate(InstanceIds=instances_id_list, IncludeAllInstances=True):
+            for status in page["InstanceStatuses"]:
+                checks = (status["InstanceStatus"]["Status"], status["SystemStatus"]["Status"])
+                statuses[status["InstanceId"]] = "ok" if checks == ("ok", "ok") else checks[0]
+        return statuses
+
+    @staticmethod
+    def probe_ssh(addresses, port=SSH_PORT, timeout=DEFAULT_PROBE_TIMEOUT):
+        """
+        Check concurrently that sshd answers on the addresses
+        :return: dict {address: reachable}
+        """
+        return SshProbe.probe_many(addresses, port=port, timeout=timeout)
+
     @staticmethod
     def get_instance_private_ip(region, instance_id):
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         instance = ec2_resource.Instance(id=instance_id)
         return instance.private_ip_address
 
     @staticmethod
     def get_instance_public_ip(region, instance_id):
-        ec2_resource = boto3.resource('ec2', region_name=region)
+        ec2_resource = AWSUtils.get_resource(region=region)
         instance = ec2_resource.Instance(id=instance_id)
         return instance.public_ip_address
 
@@ -480,134 +913,274 @@ class AWSUtils(object):
         :return: None
         """
         responses = []
-        ec2_client = boto3.client('ec2', region_name=region)
+        ec2_client = AWSUtils.get_client(region=region)
         for id_ in instance_ids:
             responses.append(ec2_client.modify_instance_attribute(InstanceId=id_, Groups=groups, **kwargs))
 
     @staticmethod
-    def remove_vpc(region, vpc_id):
+    def get_account_id(region="eu-central-1"):
+        return AWSUtils.get_client(region=region, service="sts").get_caller_identity()["Account"]
+
+    @staticmethod
+    def wait_for_state(region, describe_operation, ids_parameter, result_key, resource_ids, states, description,
+                       timeout=TRANSIT_GATEWAY_TIMEOUT):
+        """
+        Poll a describe call until all the resources are in one of the states. A resource that is not found
+        is considered deleted, or not yet visible.
+        :param region: region of the resources
+        :param describe_operation: name of the ec2 client describe method
+        :param ids_parameter: name of the ids parameter of the describe method
+        :param result_key: key of the resources list in the describe response
+        :param resource_ids: list of resource ids
+        :param states: accepted states ex. ("available",)
+        :param description: description used in the timeout error
+        :param timeout: maximum number of seconds to wait
+        :return: list of the resources
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+
+        def in_state():
+            try:
+                resources = getattr(ec2_client, describe_operation)(**{ids_parameter: resource_ids})[result_key]
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code", "").endswith(".NotFound"):
+                    return [] if "deleted" in states else None
+                raise
+            if len(resources) < len(resource_ids) and "deleted" not in states:
+                return None
+            if all(resource["State"] in states for resource in resources):
+                return resources
+            return None
+
+        return poll_until(in_state, timeout=timeout, delay=2, description=description)
+
+    @staticmethod
+    def create_transit_gateway(region, name):
+        """
+        Create a transit gateway, with the default route table association and propagation enabled
+        :param region: region
+        :param name: Name tag of the transit gateway
+        :return: dict with transit_gateway_id and route_table_id (the default route table)
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.create_transit_gateway(
+            Description=name, Options={"DefaultRouteTableAssociation": "enable",
+                                       "DefaultRouteTablePropagation": "enable"},
+            TagSpecifications=AWSUtils.get_tag_specifications("transit-gateway", name))
+        transit_gateway_id = response["TransitGateway"]["TransitGatewayId"]
+        transit_gateway = AWSUtils.wait_for_state(region=region, describe_operation="describe_transit_gateways",
+                                                  ids_parameter="TransitGatewayIds",
+                                                  result_key="TransitGateways", resource_ids=[transit_gateway_id],
+                                                  states=("available",), description="transit gateway creation")[0]
+        return {"transit_gateway_id": transit_gateway_id,
+                "route_table_id": transit_gateway["Options"]["AssociationDefaultRouteTableId"]}
+
+    @staticmethod
+    def attach_vpc_to_transit_gateway(region, transit_gateway_id, vpc_id, subnet_ids, name):
+        """
+        Attach the vpc to the transit gateway and wait until the attachment is available
+        :param region: region
+        :param transit_gateway_id: TransitGatewayId
+        :param vpc_id: Vpc Id
+        :param subnet_ids: one subnet for every availability zone used by the vpc
+        :param name: Name tag of the attachment
+        :return: TransitGatewayAttachmentId
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.create_transit_gateway_vpc_attachment(
+            TransitGatewayId=transit_gateway_id, VpcId=vpc_id, SubnetIds=subnet_ids,
+            TagSpecifications=AWSUtils.get_tag_specifications("transit-gateway-attachment", name))
+        attachment_id = response["TransitGatewayVpcAttachment"]["TransitGatewayAttachmentId"]
+        AWSUtils.wait_for_state(region=region, describe_operation="describe_transit_gateway_vpc_attachments",
+                                ids_parameter="TransitGatewayAttachmentIds", result_key="TransitGatewayVpcAttachments",
+                                resource_ids=[attachment_id], states=("available",),
+                                description="transit gateway vpc attachment")
+        return attachment_id
+
+    @staticmethod
+    def request_transit_gateway_peering(region, transit_gateway_id, peer_region, peer_transit_gateway_id, name):
+        """
+        Request a peering attachment between two transit gateways of the same account, without waiting for its
+        acceptance
+        :return: TransitGatewayAttachmentId
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        response = ec2_client.create_transit_gateway_peering_attachment(
+            TransitGatewayId=transit_gateway_id, PeerTransitGatewayId=peer_transit_gateway_id,
+            PeerAccountId=AWSUtils.get_account_id(region=region), PeerRegion=peer_region,
+            TagSpecifications=AWSUtils.get_tag_specifications("transit-gateway-attachment", name))
+        return response["TransitGatewayPeeringAttachment"]["TransitGatewayAttachmentId"]
+
+    @staticmethod
+    def accept_transit_gateway_peerings(region, attachment_ids):
+        """
+        Accept all the peering attachments requested to the transit gateway of a region, and wait until they are
+        available
+        :param region: region of the accepter transit gateway
+        :param attachment_ids: list of TransitGatewayAttachmentIds
+        :return: None
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        wait_arguments = {"region": region, "describe_operation": "describe_transit_gateway_peering_attachments",
+                          "ids_parameter": "TransitGatewayAttachmentIds",
+                          "result_key": "TransitGatewayPeeringAttachments", "resource_ids": attachment_ids}
+        AWSUtils.wait_for_state(states=("pendingAcceptance",), description="transit gateway peering request",
+                                **wait_arguments)
+        for attachment_id in attachment_ids:
+            ec2_client.accept_transit_gateway_peering_attachment(TransitGatewayAttachmentId=attachment_id)
+        AWSUtils.wait_for_state(states=("available",), description="transit gateway peering", **wait_arguments)
+
+    @staticmethod
+    def add_transit_gateway_routes(region, route_table_id, routes):
+        """
+        Add static routes in a transit gateway route table
+        :param region: region
+        :param route_table_id: TransitGatewayRouteTableId
+        :param routes: dict {destination cidr block: TransitGatewayAttachmentId}
+        :return: list of the responses
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        return [ec2_client.create_transit_gateway_route(DestinationCidrBlock=destination_cidr_block,
+                                                        TransitGatewayRouteTableId=route_table_id,
+                                                        TransitGatewayAttachmentId=attachment_id)
+                for destination_cidr_block, attachment_id in routes.items()]
+
+    @staticmethod
+    def add_vpc_route_to_transit_gateway(region, route_table_id, transit_gateway_id, destination_cidr_block):
+        ec2_client = AWSUtils.get_client(region=region)
+        return ec2_client.create_route(RouteTableId=route_table_id, DestinationCidrBlock=destination_cidr_block,
+                                       TransitGatewayId=transit_gateway_id)
+
+    @staticmethod
+    def delete_route(region, route_table_id, destination_cidr_block):
+        ec2_client = AWSUtils.get_client(region=region)
+        try:
+            ec2_client.delete_route(RouteTableId=route_table_id, DestinationCidrBlock=destination_cidr_block)
+        except ClientError as e:
+            if not e.response.get("Error", {}).get("Code", "").endswith(".NotFound"):
+                raise
+
+    @staticmethod
+    def delete_transit_gateway_peering(region, attachment_id):
+        ec2_client = AWSUtils.get_client(region=region)
+        ec2_client.delete_transit_gateway_peering_attachment(TransitGatewayAttachmentId=attachment_id)
+        AWSUtils.wait_for_state(region=region, describe_operation="describe_transit_gateway_peering_attachments",
+                                ids_parameter="TransitGatewayAttachmentIds",
+                                result_key="TransitGatewayPeeringAttachments", resource_ids=[attachment_id],
+                                states=("deleted",), description="transit gateway peering deletion")
+
+    @staticmethod
+    def delete_transit_gateway_vpc_attachment(region, attachment_id):
+        ec2_client = AWSUtils.get_client(region=region)
+        ec2_client.delete_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment_id)
+        AWSUtils.wait_for_state(region=region, describe_operation="describe_transit_gateway_vpc_attachments",
+                                ids_parameter="TransitGatewayAttachmentIds", result_key="TransitGatewayVpcAttachments",
+                                resource_ids=[attachment_id], states=("deleted",),
+                                description="transit gateway vpc attachment deletion")
+
+    @staticmethod
+    def delete_transit_gateway(region, transit_gateway_id):
+        AWSUtils.get_client(region=region).delete_transit_gateway(TransitGatewayId=transit_gateway_id)
+
+    @staticmethod
+    def get_vpcs_by_name(region, name):
+        """
+        :param region: region
+        :param name: value of the Name tag
+        :return: list of the ids of the vpcs with the Name tag
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        paginator = ec2_client.get_paginator("describe_vpcs")
+        return [vpc["VpcId"] for page in paginator.paginate(Filters=[{"Name": "tag:Name", "Values": [name]}])
+                for vpc in page["Vpcs"]]
+
+    @staticmethod
+    def create_placement_group(region, name, group_name, strategy="cluster"):
+        """
+        Create a placement group, a placement group with the same name is reused
+        :param region: region
+        :param name: name of the placement group, unique in the region
+        :param group_name: Name tag, used to find the placement groups of an experiment
+        :param strategy: cluster, spread or partition
+        :return: name of the placement group
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        try:
+            ec2_client.create_placement_group(GroupName=name, Strategy=strategy,
+                                              TagSpecifications=AWSUtils.get_tag_specifications("placement-group",
+                                                                                                group_name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code", "") != "InvalidPlacementGroup.Duplicate":
+                raise
+        return name
+
+    @staticmethod
+    def remove_placement_groups(region, group_name):
         """
-        Remove the vpc using boto3.resource('ec2')
+        Delete the placement groups with the Name tag, their instances must be already terminated
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        placement_groups = ec2_client.describe_placement_groups(
+            Filters=[{"Name": "tag:Name", "Values": [group_name]}])["PlacementGroups"]
+        for placement_group in placement_groups:
+            ec2_client.delete_placement_group(GroupName=placement_group["GroupName"])
+
+    @staticmethod
+    def tag_resources(region, resource_ids, name):
+        """
+        Replace the Name tag of many resources with a single call
+        :param region: region of the resources
+        :param resource_ids: list of resource ids, of any type
+        :param name: new value of the Name tag
+        :return: client response
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        return ec2_client.create_tags(Resources=list(resource_ids), Tags=[{"Key": "Name", "Value": name}])
+
+    @staticmethod
+    def remove_vpc_instances(region, vpc_id):
+        """
+        Terminate all the instances of the vpc, and wait until they are terminated
+        """
+        VpcTeardown(ec2_client=AWSUtils.get_client(region=region), vpc_id=vpc_id).delete_instances()
+
+    @staticmethod
+    def remove_vpc_peerings(region, vpc_id):
+        """
+        Delete all the peering connections requested or accepted by the vpc
+        """
+        VpcTeardown(ec2_client=AWSUtils.get_client(region=region), vpc_id=vpc_id).delete_peerings()
+
+    @staticmethod
+    def remove_transit_gateway_peerings(region, transit_gateway_id):
+        """
+        Delete all the peering attachments of the transit gateway, and wait until they are deleted
+        """
+        ec2_client = AWSUtils.get_client(region=region)
+        attachments = ec2_client.describe_transit_gateway_peering_attachments(
+            Filters=[{"Name": "transit-gateway-id", "Values": [transit_gateway_id]},
+                     {"Name": "state", "Values": ["initiating", "initiatingRequest", "pendingAcceptance", "pending",
+                                                  "available", "modifying"]}])["TransitGatewayPeeringAttachments"]
+        for attachment in attachments:
+            AWSUtils.delete_transit_gateway_peering(region=region,
+                                                    attachment_id=attachment["TransitGatewayAttachmentId"])
+
+    @staticmethod
+    def remove_vpc(region, vpc_id, max_workers=8):
+        """
+        Remove the vpc and all its dependencies, the resources are deleted following their dependency graph,
+        deleting the independent ones concurrently.
         :param region: region where the vpc is located
         :param vpc_id: Id of the Vpc
+        :param max_workers: maximum number of resources types deleted at the same time
         :return: client response
-        Script adapted from https://gist.github.com/vernhart/c6a0fc94c0aeaebe84e5cd6f3dede4ce
-        TODO: Make it cleaner and more modular, seems to work now, but the code is terrible
-        """
-        ec2_resource = boto3.resource('ec2', region_name=region)
-        ec2 = ec2_resource
-        vpc = ec2.Vpc(vpc_id)
-        ec2client = ec2.meta.client
-
-        # detach default dhcp_options if associated with the vpc
-        dhcp_options_default = ec2.DhcpOptions('default')
-        if dhcp_options_default:
-            dhcp_options_default.associate_with_vpc(
-                VpcId=vpc.id
-            )
-
-        # delete any instances
-        public_ips = []
-        for subnet in vpc.subnets.all():
-            for instance in subnet.instances.all():
-                if instance.public_ip_address:
-                    public_ips.append(instance.public_ip_address)
-                instance.terminate()
-
-        # delete nat_gateways
-        nat_gateways = ec2client.describe_nat_gateways(Filters=[{"Name": "vpc-id", "Values": [vpc.id]}])["NatGateways"]
-        nat_ids = [nat['NatGatewayId']for nat in nat_gateways]
-
-        for nat in nat_gateways:
-            for address in nat["NatGatewayAddresses"]:
-                if "PublicIp" in address.keys():
-                    public_ips.append(address["PublicIp"])
-
-        for nat in nat_ids:
-            ec2client.delete_nat_gateway(NatGatewayId=nat)
-
-        # wait that all the nat gateways are in deleted state
-            nat_gateways = ec2client.describe_nat_gateways(Filters=[{"Name": "vpc-id", "Values": [vpc.id]}])[
-                "NatGateways"]
-            if nat_gateways == []:
-                break
-            status = tuple(set([nat["State"] for nat in nat_gateways]))
-            if status == ("deleted",):
-                break
-
-            sleep(1)
-
-        # wait that all the instances are deleted
-
-        subnets = vpc.subnets.all()
-        i = 0
-        for subnet in subnets:
-            i += len(list(subnet.instances.all()))
-
-        completed_hosts = 0
-        while True:
-            subnets = vpc.subnets.all()
-            instances = []
-            for subnet in subnets:
-                instances += subnet.instances.all()
-                if i-len(instances) != completed_hosts:
-                    completed_hosts = i-len(instances)
-            if not instances:
-                break
-            sleep(1)
-
-        # detach and delete all gateways associated with the vpc
-        for gw in vpc.internet_gateways.all():
-            # We need to remove the public address before removing the Internet GW
-            vpc.detach_internet_gateway(InternetGatewayId=gw.id)
-            gw.delete()
-        # delete all route table associations
-        route_tables = ec2client.describe_route_tables(Filters=[{"Name": "vpc-id", "Values": [vpc.id]}])["RouteTables"]
-        for rt in route_tables:
-            associations = rt['Associations']
-            if associations == []:
-                ec2client.delete_route_table(RouteTableId=rt['RouteTableId'])
-                continue
-
-            for association in associations:
-                if not association["Main"]:
-                    association_id = association['RouteTableAssociationId']
-                    ec2client.disassociate_route_table(AssociationId=association_id)
-            sleep(1)
-            if (False,) == tuple(set([association["Main"] for association in associations])):
-                ec2client.delete_route_table(RouteTableId=rt["RouteTableId"])
-
-        # delete our endpoints
-        for ep in ec2client.describe_vpc_endpoints(
-                Filters=[{
-                    'Name': 'vpc-id',
-                    'Values': [vpc.id]
-                }])['VpcEndpoints']:
-            ec2client.delete_vpc_endpoints(VpcEndpointIds=[ep['VpcEndpointId']])
-        # delete our security groups
-        sleep(5)
-        for sg in vpc.security_groups.all():
-            if sg.group_name != 'default':
-                sg.delete()
-        # delete any vpc peering connections
-        for vpcpeer in ec2client.describe_vpc_peering_connections(
-                Filters=[{
-                    'Name': 'requester-vpc-info.vpc-id',
-                    'Values': [vpc.id]
-                }])['VpcPeeringConnections']:
-            ec2.VpcPeeringConnection(vpcpeer['VpcPeeringConnectionId']).delete()
-        # delete non-default network acls
-        for netacl in vpc.network_acls.all():
-            if not netacl.is_default:
-                netacl.delete()
-        # delete network interfaces
-        for subnet in vpc.subnets.all():
-            for interface in subnet.network_interfaces.all():
-                interface.delete()
-            subnet.delete()
-        # finally, delete the vpc
-
-        return ec2client.delete_vpc(VpcId=vpc.id)
+        """
+        teardown = VpcTeardown(ec2_client=AWSUtils.get_client(region=region), vpc_id=vpc_id,
+                               max_workers=max_workers)
+        response = teardown.run()
+        for resource_id in teardown.deleted_ids:
+            TRUSTED_HANDLES.discard(region=region, resource_id=resource_id)
+        return response
 
 
 if __name__ == '__main__':
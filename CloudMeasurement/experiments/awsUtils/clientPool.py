@@ -0,0 +1,170 @@
+from collections import Counter
+from os import environ
+from threading import RLock, local
+
+import boto3
+
+
+class ClientPool(object):
+    def __init__(self, config=None, rate_limiter=None, recorder=None):
+        """
+        Pool of boto3 sessions, clients and resources keyed by region and credentials.
+        boto3 clients are thread safe and are shared by every thread, resources are not, so they are pooled in a
+        threading.local and dropped with their thread. The creation of sessions, clients and resources is
+        serialized with a lock, since boto3.Session is not thread safe.
+        :param config: optional botocore Config used by all the clients and resources
+        :param rate_limiter: optional RateLimiter registered in every client and resource created by the pool
+        :param recorder: optional ApiCallRecorder registered in every client and resource created by the pool
+        """
+        self.config = config
+        self.rate_limiter = rate_limiter
+        self.recorder = recorder
+        self._lock = RLock()
+        self._sessions = dict()
+        self._clients = dict()
+        self._local = local()
+        self.stats = {"sessions_created": 0, "clients_created": 0, "clients_reused": 0,
+                      "resources_created": 0, "resources_reused": 0}
+        self.api_calls = Counter()
+
+    @staticmethod
+    def get_credentials_key(profile_name=None, aws_access_key_id=None):
+        """
+        Return the key used to identify a set of credentials
+        :param profile_name: aws profile, by default the AWS_PROFILE environment variable
+        :param aws_access_key_id: aws access key id, by default the AWS_ACCESS_KEY_ID environment variable
+        :return: tuple (profile_name, aws_access_key_id)
+        """
+        return (profile_name or environ.get("AWS_PROFILE"),
+                aws_access_key_id or environ.get("AWS_ACCESS_KEY_ID"))
+
+    def get_session(self, profile_name=None, aws_access_key_id=None, aws_secret_access_key=None):
+        """
+        Return the boto3 Session for the given credentials, creating it only the first time
+        :param profile_name: aws profile
+        :param aws_access_key_id: aws access key id
+        :param aws_secret_access_key: aws secret access key
+        :return: boto3.Session
+        """
+        key = self.get_credentials_key(profile_name=profile_name, aws_access_key_id=aws_access_key_id)
+        with self._lock:
+            session = self._sessions.get(key, None)
+            if session is None:
+                session = boto3.Session(profile_name=profile_name, aws_access_key_id=aws_access_key_id,
+                                        aws_secret_access_key=aws_secret_access_key)
+                self._sessions[key] = session
+                self.stats["sessions_created"] += 1
+            return session
+
+    def get_client(self, region, service="ec2", profile_name=None, aws_access_key_id=None,
+                   aws_secret_access_key=None):
+        """
+        Return a boto3 client for the service in the region, the same client is shared by all the threads
+        :param region: region name ex. eu-central-1
+        :param service: aws service name
+        :param profile_name: aws profile
+        :param aws_access_key_id: aws access key id
+        :param aws_secret_access_key: aws secret access key
+        :return: boto3 client
+        """
+        credentials_key = self.get_credentials_key(profile_name=profile_name, aws_access_key_id=aws_access_key_id)
+        key = (service, region, credentials_key)
+        with self._lock:
+            client = self._clients.get(key, None)
+            if client is not None:
+                self.stats["clients_reused"] += 1
+                return client
+            session = self.get_session(profile_name=profile_name, aws_access_key_id=aws_access_key_id,
+                                       aws_secret_access_key=aws_secret_access_key)
+            client = session.client(service, region_name=region, config=self.config)
+            self.register_api_calls_counter(client=client)
+            if self.rate_limiter is not None:
+                self.rate_limiter.register(client=client, region=region, account=credentials_key)
+            if self.recorder is not None:
+                self.recorder.register(client=client, region=region)
+            self._clients[key] = client
+            self.stats["clients_created"] += 1
+            return client
+
+    def get_resource(self, region, service="ec2", profile_name=None, aws_access_key_id=None,
+                     aws_secret_access_key=None):
+        """
+        Return a boto3 resource for the service in the region, resources are not thread safe so every thread
+        gets its own resource
+        :param region: region name ex. eu-central-1
+        :param service: aws service name
+        :param profile_name: aws profile
+        :param aws_access_key_id: aws access key id
+        :param aws_secret_access_key: aws secret access key
+        :return: boto3 resource
+        """
+        credentials_key = self.get_credentials_key(profile_name=profile_name, aws_access_key_id=aws_access_key_id)
+        key = (service, region, credentials_key)
+        resources = self.get_thread_resources()
+        with self._lock:
+            resource = resources.get(key, None)
+            if resource is not None:
+                self.stats["resources_reused"] += 1
+                return resource
+            session = self.get_session(profile_name=profile_name, aws_access_key_id=aws_access_key_id,
+                                       aws_secret_access_key=aws_secret_access_key)
+            resource = session.resource(service, region_name=region, config=self.config)
+            self.register_api_calls_counter(client=resource.meta.client)
+            if self.rate_limiter is not None:
+                self.rate_limiter.register(client=resource.meta.client, region=region, account=credentials_key)
+            if self.recorder is not None:
+                self.recorder.register(client=resource.meta.client, region=region)
+            resources[key] = resource
+            self.stats["resources_created"] += 1
+            return resource
+
+    def get_thread_resources(self):
+        """
+        :return: dict {(service, region, credentials key): resource} of the calling thread
+        """
+        thread_local = self._local
+        if not hasattr(thread_local, "resources"):
+            thread_local.resources = dict()
+        return thread_local.resources
+
+    def register_api_calls_counter(self, client):
+        """
+        Count the api calls made by the client, for every operation
+        :param client: boto3 client
+        :return: None
+        """
+        def count_call(model, **kwargs):
+            with self._lock:
+                self.api_calls[model.name] += 1
+
+        # before-parameter-build is emitted for every call, also when another handler short-circuits before-call
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register("before-parameter-build.{}".format(service), count_call)
+
+    def get_api_calls(self):
+        """
+        :return: dict with the number of api calls made by the pooled clients, for every operation
+        """
+        with self._lock:
+            return dict(self.api_calls)
+
+    def get_stats(self):
+        """
+        :return: copy of the counters of created and reused clients and resources
+        """
+        with self._lock:
+            return dict(self.stats)
+
+    def clear(self):
+        """
+        Drop all the pooled sessions, clients and resources and reset the counters
+        :return: None
+        """
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+            # the resources of the other threads are dropped with the old threading.local
+            self._local = local()
+            self.api_calls.clear()
+            for key in self.stats:
+                self.stats[key] = 0
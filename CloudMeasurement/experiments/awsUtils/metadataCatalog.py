@@ -0,0 +1,92 @@
+import sqlite3
+from json import dumps, loads
+from os import makedirs
+from pathlib import Path
+from time import time
+
+DEFAULT_CATALOG_PATH = Path.home() / ".CloudMeasurement" / "metadataCatalog.db"
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class MetadataCatalog(object):
+    def __init__(self, db_path=DEFAULT_CATALOG_PATH, ttl=DEFAULT_TTL):
+        """
+        Persistent cache for the cloud metadata that rarely changes (regions, availability zones, AMI ids).
+        The entries are stored in a SQLite db, so the cache is warm across different cm invocations, and they
+        expire after ttl seconds.
+        :param db_path: path of the SQLite db, it is created at the first access
+        :param ttl: time to live of the entries in seconds
+        """
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+
+    def _connect(self):
+        makedirs(self.db_path.parent, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute('''CREATE TABLE IF NOT EXISTS METADATA ([KIND] TEXT, [REGION] TEXT, [NAME] TEXT, [VALUE] TEXT,
+         [TIMESTAMP] REAL, PRIMARY KEY (KIND, REGION, NAME)) ''')
+        return conn
+
+    def get(self, kind, region, name=""):
+        """
+        Return the cached value, or None if it is missing or expired
+        :param kind: kind of metadata ex. "regions", "azs", "ami"
+        :param region: region of the metadata
+        :param name: optional name that identify the entry inside the region, ex. the image name
+        :return: the cached value or None
+        """
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute('''SELECT VALUE, TIMESTAMP FROM METADATA WHERE KIND=? AND REGION=? AND NAME=? ''',
+                      (kind, region, name))
+            row = c.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        value, timestamp = row
+        if time() - timestamp > self.ttl:
+            return None
+        return loads(value)
+
+    def put(self, kind, region, value, name=""):
+        """
+        Store a value in the catalog, replacing the previous one
+        :param kind: kind of metadata ex. "regions", "azs", "ami"
+        :param region: region of the metadata
+        :param value: json serializable value
+        :param name: optional name that identify the entry inside the region, ex. the image name
+        :return: None
+        """
+        conn = self._connect()
+        try:
+            conn.execute('''INSERT OR REPLACE INTO METADATA VALUES (?, ?, ?, ?, ?)''',
+                         (kind, region, name, dumps(value), time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def invalidate(self, kind=None, region=None):
+        """
+        Remove the entries from the catalog, without arguments the whole catalog is invalidated
+        :param kind: invalidate only this kind of metadata
+        :param region: invalidate only the metadata of this region
+        :return: None
+        """
+        conditions, values = [], []
+        if kind is not None:
+            conditions.append("KIND=?")
+            values.append(kind)
+        if region is not None:
+            conditions.append("REGION=?")
+            values.append(region)
+        query = "DELETE FROM METADATA"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        conn = self._connect()
+        try:
+            conn.execute(query, values)
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,24 @@
+from time import sleep, time
+
+
+def poll_until(condition, timeout=600, delay=0.5, max_delay=10, backoff=1.5, description="condition"):
+    """
+    Call condition until it returns a value that is not None or False, waiting between the calls with an
+    exponential backoff. The first checks are fast, so the resources that are ready immediately do not wait.
+    :param condition: callable without arguments
+    :param timeout: maximum number of seconds to wait
+    :param delay: first delay in seconds
+    :param max_delay: maximum delay between two calls
+    :param backoff: multiplier applied to the delay after every call
+    :param description: description used in the timeout error
+    :return: the value returned by condition
+    """
+    deadline = time() + timeout
+    while True:
+        result = condition()
+        if result is not None and result is not False:
+            return result
+        if time() + delay > deadline:
+            raise TimeoutError("Timeout after {} seconds waiting for {}".format(timeout, description))
+        sleep(delay)
+        delay = min(delay * backoff, max_delay)
@@ -0,0 +1,192 @@
+from botocore.retryhandler import EXCEPTION_MAP
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+
+THROTTLING_ERROR_CODES = ("RequestLimitExceeded", "Throttling", "ThrottlingException", "ThrottledException",
+                          "RequestThrottled", "RequestThrottledException", "TooManyRequestsException",
+                          "EC2ThrottledException")
+TRANSIENT_ERROR_CODES = ("InternalError", "InternalFailure", "ServiceUnavailable", "Unavailable")
+# the exceptions retried by the legacy retry handler of botocore, the other ones are raised at once
+RETRYABLE_EXCEPTIONS = tuple(EXCEPTION_MAP["GENERAL_CONNECTION_ERROR"])
+
+DEFAULT_RATE = 20
+DEFAULT_CAPACITY = 100
+DEFAULT_MIN_RATE = 1
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 20
+
+
+class TokenBucket(object):
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_CAPACITY, min_rate=DEFAULT_MIN_RATE):
+        """
+        Adaptive token bucket, the refill rate is halved when a request is throttled and it slowly grows back
+        to the maximum rate with the successful requests.
+        :param rate: maximum number of tokens added every second
+        :param capacity: maximum number of tokens in the bucket (burst)
+        :param min_rate: the rate never goes under this value
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def acquire(self, tokens=1):
+        """
+        Take the tokens from the bucket, waiting until they are available
+        :param tokens: number of tokens
+        :return: number of seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            sleep(delay)
+            waited += delay
+
+    def reserve(self, tokens=1):
+        """
+        Take the tokens from the bucket without waiting, the bucket can go in debt
+        :param tokens: number of tokens
+        :return: number of seconds to wait before the tokens are available
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RateLimiter(object):
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_CAPACITY, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Rate limiter shared by all the boto3 clients, with one token bucket for every account and region.
+        It is hooked in the botocore event system: every call takes a token before being sent, and the throttled
+        or transient errors are retried with a jittered exponential backoff (full jitter).
+        :param rate: requests per second allowed in every account and region
+        :param capacity: burst of requests allowed in every account and region
+        :param max_attempts: maximum number of attempts for a single call
+        :param base_delay: base of the exponential backoff in seconds
+        :param max_delay: maximum backoff in seconds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = Lock()
+        self.buckets = dict()
+        self.metrics = dict()
+
+    def get_bucket(self, account, region):
+        """
+        :param account: key that identifies the account, ex. the credentials key of the ClientPool
+        :param region: region name
+        :return: TokenBucket of the account in the region
+        """
+        key = (account, region)
+        with self._lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(rate=self.rate, capacity=self.capacity)
+                self.metrics[key] = {"calls": 0, "throttles": 0, "retries": 0, "errors": 0,
+                                     "wait_time": 0.0, "backoff_time": 0.0}
+            return self.buckets[key]
+
+    def _add_metric(self, key, name, value=1):
+        with self._lock:
+            self.metrics[key][name] += value
+
+    def register(self, client, region, account=None):
+        """
+        Hook the rate limiter in the botocore events of the client
+        :param client: boto3 client, for a resource use resource.meta.client
+        :param region: region of the client
+        :param account: key that identifies the account
+        :return: None
+        """
+        key = (account, region)
+        bucket = self.get_bucket(account=account, region=region)
+        service = client.meta.service_model.service_id.hyphenize()
+
+        def before_call(**kwargs):
+            waited = bucket.acquire()
+            self._add_metric(key, "calls")
+            self._add_metric(key, "wait_time", waited)
+
+        def needs_retry(response=None, attempts=1, caught_exception=None, **kwargs):
+            return self.get_retry_delay(key=key, bucket=bucket, response=response, attempts=attempts,
+                                        caught_exception=caught_exception)
+
+        client.meta.events.register("before-call.{}".format(service), before_call)
+        client.meta.events.register_first("needs-retry.{}".format(service), needs_retry)
+
+    def get_retry_delay(self, key, bucket, response, attempts, caught_exception):
+        """
+        Decide if a call should be retried
+        :return: seconds to wait before retrying, None if the call should not be retried
+        """
+        throttled = False
+        if caught_exception is not None:
+            if not isinstance(caught_exception, RETRYABLE_EXCEPTIONS):
+                return None
+        else:
+            http_response, parsed = response
+            error_code = parsed.get("Error", {}).get("Code", "")
+            throttled = error_code in THROTTLING_ERROR_CODES
+            retryable = throttled or error_code in TRANSIENT_ERROR_CODES or http_response.status_code >= 500
+            if not retryable:
+                bucket.on_success()
+                return None
+
+        if throttled:
+            bucket.on_throttle()
+            self._add_metric(key, "throttles")
+        if attempts >= self.max_attempts:
+            self._add_metric(key, "errors")
+            return None
+
+        # botocore sleeps once before the retry: the token of the retry is reserved without waiting, and the
+        # sleep lasts until both the backoff and the token wait are over
+        backoff = uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+        token_wait = bucket.reserve()
+        delay = max(backoff, token_wait)
+        self._add_metric(key, "retries")
+        self._add_metric(key, "backoff_time", backoff)
+        self._add_metric(key, "wait_time", delay - backoff)
+        return delay
+
+    def get_metrics(self):
+        """
+        :return: dict with the total metrics and the metrics of every region
+        """
+        with self._lock:
+            total = {"calls": 0, "throttles": 0, "retries": 0, "errors": 0, "wait_time": 0.0, "backoff_time": 0.0}
+            regions = dict()
+            for (account, region), metrics in self.metrics.items():
+                region_metrics = regions.setdefault(region, {name: 0 for name in total})
+                for name, value in metrics.items():
+                    total[name] += value
+                    region_metrics[name] += value
+            return {"total": total, "regions": regions}
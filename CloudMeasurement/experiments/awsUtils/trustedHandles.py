@@ -0,0 +1,44 @@
+from threading import Lock
+
+
+class TrustedHandles(object):
+    def __init__(self):
+        """
+        Thread safe registry of the resource ids created by the tool in the current process.
+        An id in the registry is known to exist, so the validation before using it can be skipped.
+        """
+        self._lock = Lock()
+        self._handles = set()
+
+    def add(self, region, resource_id):
+        """
+        Register a resource id as trusted
+        :param region: region where the resource is created
+        :param resource_id: id of the resource ex. vpc-xxxx, subnet-xxxx
+        :return: None
+        """
+        with self._lock:
+            self._handles.add((region, resource_id))
+
+    def discard(self, region, resource_id):
+        """
+        Remove a resource id from the trusted ones, ex. when the resource is deleted
+        :param region: region where the resource is created
+        :param resource_id: id of the resource
+        :return: None
+        """
+        with self._lock:
+            self._handles.discard((region, resource_id))
+
+    def is_trusted(self, region, resource_id):
+        """
+        :param region: region where the resource is created
+        :param resource_id: id of the resource
+        :return: True if the resource was created by the tool
+        """
+        with self._lock:
+            return (region, resource_id) in self._handles
+
+    def clear(self):
+        with self._lock:
+            self._handles.clear()
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import time
+
+from botocore.exceptions import ClientError
+
+from .polling import poll_until
+
+DEFAULT_TIMEOUT = 900
+
+
+class VpcTeardown(object):
+    def __init__(self, ec2_client, vpc_id, max_workers=8, timeout=DEFAULT_TIMEOUT):
+        """
+        Remove a vpc and all its dependencies. The resources are the nodes of a dependency graph, every node is
+        deleted as soon as all the nodes it depends on are deleted, and the independent nodes are deleted
+        concurrently. Instances use the ec2 waiter, the other resources are polled with an adaptive delay.
+        :param ec2_client: boto3 ec2 client of the region where the vpc is located
+        :param vpc_id: Id of the Vpc
+        :param max_workers: maximum number of nodes deleted at the same time
+        :param timeout: maximum number of seconds to wait for a single node
+        """
+        self.ec2_client = ec2_client
+        self.vpc_id = vpc_id
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.timings = dict()
+        # ids of the resources removed with the vpc, the main route table, the default security group and the
+        # default network acl are deleted by delete_vpc
+        self.deleted_ids = set()
+        self.nodes = {
+            "dhcp_options": (self.associate_default_dhcp_options, []),
+            "instances": (self.delete_instances, []),
+            "nat_gateways": (self.delete_nat_gateways, []),
+            "endpoints": (self.delete_endpoints, []),
+            "peerings": (self.delete_peerings, []),
+            "route_tables": (self.delete_route_tables, []),
+            "internet_gateways": (self.delete_internet_gateways, ["instances", "nat_gateways"]),
+            "network_interfaces": (self.delete_network_interfaces, ["instances", "nat_gateways", "endpoints"]),
+            "security_groups": (self.delete_security_groups, ["instances", "endpoints", "network_interfaces"]),
+            "subnets": (self.delete_subnets, ["instances", "nat_gateways", "network_interfaces", "route_tables"]),
+            "network_acls": (self.delete_network_acls, ["subnets"]),
+        }
+        self.nodes["vpc"] = (self.delete_vpc, list(self.nodes.keys()))
+
+    def run(self):
+        """
+        Delete all the nodes of the graph, respecting their dependencies
+        :return: delete_vpc response
+        """
+        done = dict()
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while len(done) < len(self.nodes):
+                for name, (function, dependencies) in self.nodes.items():
+                    if name in done or name in running.values():
+                        continue
+                    if all(dependency in done for dependency in dependencies):
+                        running[executor.submit(self.timed, name, function)] = name
+
+                finished, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    done[name] = future.result()
+        return done["vpc"]
+
+    def timed(self, name, function):
+        start = time()
+        result = function()
+        self.timings[name] = time() - start
+        return result
+
+    def vpc_filter(self, name="vpc-id"):
+        return [{"Name": name, "Values": [self.vpc_id]}]
+
+    def retry_on_dependency(self, function, description, **kwargs):
+        """
+        Call the function until the resource has no more dependencies
+        :param function: boto3 client method that deletes a resource
+        :param description: description used in the timeout error
+        :param kwargs: arguments of the function
+        :return: function response
+        """
+        def attempt():
+            try:
+                return function(**kwargs)
+            except ClientError as e:
+                error_code = e.response.get("Error", {}).get("Code", "")
+                if error_code.endswith(".NotFound"):
+                    return {}
+                if error_code in ("DependencyViolation", "InvalidParameterValue") or error_code.endswith(".InUse"):
+                    return None
+                raise
+
+        return poll_until(attempt, timeout=self.timeout, description=description)
+
+    def associate_default_dhcp_options(self):
+        self.ec2_client.associate_dhcp_options(DhcpOptionsId="default", VpcId=self.vpc_id)
+
+    def delete_instances(self):
+        instance_ids = []
+        paginator = self.ec2_client.get_paginator("describe_instances")
+        for page in paginator.paginate(Filters=self.vpc_filter()):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    if instance["State"]["Name"] != "terminated":
+                        instance_ids.append(instance["InstanceId"])
+        if not instance_ids:
+            return
+        self.ec2_client.terminate_instances(InstanceIds=instance_ids)
+        self.ec2_client.get_waiter("instance_terminated").wait(
+            InstanceIds=instance_ids, WaiterConfig={"Delay": 5, "MaxAttempts": int(self.timeout / 5)})
+        self.deleted_ids.update(instance_ids)
+
+    def delete_nat_gateways(self):
+        nat_gateways = self.ec2_client.describe_nat_gateways(Filter=self.vpc_filter())["NatGateways"]
+        for nat in nat_gateways:
+            if nat["State"] not in ("deleting", "deleted"):
+                self.ec2_client.delete_nat_gateway(NatGatewayId=nat["NatGatewayId"])
+
+        def all_deleted():
+            states = [nat["State"] for nat in
+                      self.ec2_client.describe_nat_gateways(Filter=self.vpc_filter())["NatGateways"]]
+            return all(state == "deleted" for state in states)
+
+        if nat_gateways:
+            poll_until(all_deleted, timeout=self.timeout, delay=2, description="nat gateways deletion")
+
+    def delete_endpoints(self):
+        endpoints = self.ec2_client.describe_vpc_endpoints(Filters=self.vpc_filter())["VpcEndpoints"]
+        endpoint_ids = [ep["VpcEndpointId"] for ep in endpoints if ep["State"].lower() != "deleted"]
+        if not endpoint_ids:
+            return
+        self.ec2_client.delete_vpc_endpoints(VpcEndpointIds=endpoint_ids)
+
+        def all_deleted():
+            endpoints = self.ec2_client.describe_vpc_endpoints(Filters=self.vpc_filter())["VpcEndpoints"]
+            return all(ep["State"].lower() == "deleted" for ep in endpoints)
+
+        poll_until(all_deleted, timeout=self.timeout, description="vpc endpoints deletion")
+
+    def delete_peerings(self):
+        for filter_name in ("requester-vpc-info.vpc-id", "accepter-vpc-info.vpc-id"):
+            peerings = self.ec2_client.describe_vpc_peering_connections(
+                Filters=self.vpc_filter(filter_name))["VpcPeeringConnections"]
+            for peering in peerings:
+                if peering["Status"]["Code"] in ("deleted", "deleting", "rejected", "failed", "expired"):
+                    continue
+                self.retry_on_dependency(self.ec2_client.delete_vpc_peering_connection,
+                                         description="vpc peering deletion",
+                                         VpcPeeringConnectionId=peering["VpcPeeringConnectionId"])
+
+    def delete_route_tables(self):
+        route_tables = self.ec2_client.describe_route_tables(Filters=self.vpc_filter())["RouteTables"]
+        for rt in route_tables:
+            self.deleted_ids.add(rt["RouteTableId"])
+            associations = rt["Associations"]
+            if any(association["Main"] for association in associations):
+                continue
+            for association in associations:
+                self.ec2_client.disassociate_route_table(AssociationId=association["RouteTableAssociationId"])
+            self.retry_on_dependency(self.ec2_client.delete_route_table, description="route table deletion",
+                                     RouteTableId=rt["RouteTableId"])
+
+    def delete_internet_gateways(self):
+        gateways = self.ec2_client.describe_internet_gateways(
+            Filters=self.vpc_filter("attachment.vpc-id"))["InternetGateways"]
+        for gw in gateways:
+            # the detach fails until all the public addresses in the vpc are released
+            self.retry_on_dependency(self.ec2_client.detach_internet_gateway, description="igw detach",
+                                     InternetGatewayId=gw["InternetGatewayId"], VpcId=self.vpc_id)
+            self.ec2_client.delete_internet_gateway(InternetGatewayId=gw["InternetGatewayId"])
+            self.deleted_ids.add(gw["InternetGatewayId"])
+
+    def delete_network_interfaces(self):
+        interfaces = self.ec2_client.describe_network_interfaces(Filters=self.vpc_filter())["NetworkInterfaces"]
+        for interface in interfaces:
+            self.retry_on_dependency(self.ec2_client.delete_network_interface, description="eni deletion",
+                                     NetworkInterfaceId=interface["NetworkInterfaceId"])
+            self.deleted_ids.add(interface["NetworkInterfaceId"])
+
+    def delete_security_groups(self):
+        security_groups = self.ec2_client.describe_security_groups(Filters=self.vpc_filter())["SecurityGroups"]
+        for sg in security_groups:
+            self.deleted_ids.add(sg["GroupId"])
+            if sg["GroupName"] == "default":
+                continue
+            self.retry_on_dependency(self.ec2_client.delete_security_group, description="security group deletion",
+                                     GroupId=sg["GroupId"])
+
+    def delete_subnets(self):
+        subnets = self.ec2_client.describe_subnets(Filters=self.vpc_filter())["Subnets"]
+        for subnet in subnets:
+            self.retry_on_dependency(self.ec2_client.delete_subnet, description="subnet deletion",
+                                     SubnetId=subnet["SubnetId"])
+            self.deleted_ids.add(subnet["SubnetId"])
+
+    def delete_network_acls(self):
+        network_acls = self.ec2_client.describe_network_acls(Filters=self.vpc_filter())["NetworkAcls"]
+        for network_acl in network_acls:
+            self.deleted_ids.add(network_acl["NetworkAclId"])
+            if not network_acl["IsDefault"]:
+                self.retry_on_dependency(self.ec2_client.delete_network_acl, description="network acl deletion",
+                                         NetworkAclId=network_acl["NetworkAclId"])
+
+    def delete_vpc(self):
+        response = self.retry_on_dependency(self.ec2_client.delete_vpc, description="vpc deletion",
+                                            VpcId=self.vpc_id)
+        self.deleted_ids.add(self.vpc_id)
+        return response
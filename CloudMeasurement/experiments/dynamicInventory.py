@@ -0,0 +1,95 @@
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+from json import load, dump
+from os import replace
+from pathlib import Path
+from threading import Lock
+
+EXPERIMENT_GROUP_PREFIX = "experiment_"
+# the inventories are cached in a file next to the db, so the cache is shared by all the cm commands
+CACHE_SUFFIX = ".inventory.json"
+
+
+class DynamicInventory(object):
+    """
+    Ansible inventory built from the INSTANCES table, instead of the inventory file written by cm -c. The hosts
+    are grouped by experiment, region and availability zone, and the inventory is rebuilt only when the
+    modification time or the size of the db change.
+    """
+    _lock = Lock()
+
+    def __init__(self, db_path, user="ubuntu"):
+        """
+        :param db_path: path of the db
+        :param user: ssh user of the probes
+        """
+        self.db_path = Path(db_path)
+        self.user = user
+
+    @staticmethod
+    def get_group_name(name):
+        """
+        :return: ansible group of a region or an availability zone, as in the inventory files, ex. eu_central_1a
+        """
+        return name.replace("-", "_")
+
+    def get_inventory(self, experiment_id=None):
+        """
+        :param experiment_id: optional experiment id, all the experiments otherwise
+        :return: dict inventory in the yaml/json format of ansible, accepted by ansible-runner:
+                 {"all": {"hosts": {ip: hostvars}, "children": {group: {"hosts": {ip: {}}}}}}, read from the cache
+                 file when the db is not modified
+        """
+        key = "{}@{}".format(self.user, "all" if experiment_id is None else experiment_id)
+        db_stat = self.db_path.stat()
+        version = [db_stat.st_mtime_ns, db_stat.st_size]
+        with self._lock:
+            cache = self.read_cache()
+            if cache.get("version", None) == version and key in cache["inventories"]:
+                return cache["inventories"][key]
+            inventory = self.build_inventory(experiment_id=experiment_id)
+            if cache.get("version", None) != version:
+                cache = {"version": version, "inventories": dict()}
+            cache["inventories"][key] = inventory
+            self.write_cache(cache)
+        return inventory
+
+    def get_cache_path(self):
+        return self.db_path.with_suffix(CACHE_SUFFIX)
+
+    def read_cache(self):
+        """
+        :return: dict {"version": [db mtime, db size], "inventories": {user@experiment: inventory}}, empty if the
+                 cache file is missing or broken
+        """
+        try:
+            with open(str(self.get_cache_path())) as cache_file:
+                return load(cache_file)
+        except (OSError, ValueError):
+            return dict()
+
+    def write_cache(self, cache):
+        # written in a temporary file then renamed, a cm command running at the same time never reads half a file
+        tmp_path = self.db_path.with_suffix(CACHE_SUFFIX + ".tmp")
+        with open(str(tmp_path), "w") as cache_file:
+            dump(cache, cache_file)
+        replace(str(tmp_path), str(self.get_cache_path()))
+
+    def build_inventory(self, experiment_id=None):
+        if experiment_id is None:
+            rows = CloudMeasurementDB.get_instances(db_path=self.db_path)
+        else:
+            rows = CloudMeasurementDB.get_instances_experiment(db_path=self.db_path, experiment_id=experiment_id)
+        hosts = dict()
+        children = dict()
+        for row in rows:
+            instance_id, machine_type, row_experiment_id, region, availability_zone = row[:5]
+            public_ip, private_ip = row[7:9]
+            if public_ip in (None, "None"):
+                continue
+            hosts[public_ip] = {"ansible_user": self.user, "instance_id": instance_id, "machine_type": machine_type,
+                                "experiment_id": row_experiment_id, "region": region,
+                                "availability_zone": availability_zone, "private_ip": private_ip}
+            for group in (EXPERIMENT_GROUP_PREFIX + row_experiment_id, self.get_group_name(region),
+                          self.get_group_name(availability_zone)):
+                children.setdefault(group, {"hosts": dict()})["hosts"][public_ip] = dict()
+        return {"all": {"hosts": hosts, "children": children}}
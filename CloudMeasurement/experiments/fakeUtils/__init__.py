@@ -0,0 +1,2 @@
+from .fakeCloud import FakeCloud, FakeEc2Client
+from .fakeUtils import FakeUtils
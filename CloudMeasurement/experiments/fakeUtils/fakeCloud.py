@@ -0,0 +1,391 @@
+import ipaddress
+from collections import Counter, deque
+from random import Random
+from threading import RLock
+from time import sleep, time
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from CloudMeasurement.experiments.awsUtils import ApiCallRecorder
+
+FAKE_REGIONS = ("af-south-1", "ap-east-1", "ap-northeast-1", "ap-northeast-2", "ap-northeast-3", "ap-south-1",
+                "ap-southeast-1", "ap-southeast-2", "ca-central-1", "eu-central-1", "eu-north-1", "eu-south-1",
+                "eu-west-1", "eu-west-2", "eu-west-3", "me-south-1", "sa-east-1", "us-east-1", "us-east-2",
+                "us-west-1", "us-west-2")
+FAKE_AZS = ("a", "b", "c")
+FAKE_PUBLIC_NETWORK = "100.64.0.0/10"
+INSTANCE_TYPE_VCPUS = {"t3.nano": 2, "t3.micro": 2, "t3.small": 2, "t3.medium": 2, "t3.large": 2,
+                       "c5.large": 2, "c5.xlarge": 4, "c5n.large": 2, "c5n.xlarge": 4, "m5.large": 2, "m5.xlarge": 4}
+
+DEFAULT_CONFIGURATION = {
+    # seconds spent by every api call, and by the operations in operation_latency
+    "latency": 0.0,
+    "operation_latency": {},
+    # seconds before a new instance is running and before a terminated instance is gone
+    "instance_boot_time": 0.0,
+    "instance_termination_time": 0.0,
+    # random extra boot time of every instance, then seconds before its status checks are ok and before
+    # its sshd answers, counted from when it is running
+    "instance_boot_jitter": 0.0,
+    "instance_status_time": 0.0,
+    "instance_ssh_time": 0.0,
+    # probability that a call is throttled, and maximum number of calls per second in every region
+    "throttle_rate": 0.0,
+    "region_rate": None,
+    # probability that a call fails, for every call and for the operations in operation_failure_rate
+    "failure_rate": 0.0,
+    "operation_failure_rate": {},
+    # backoff of the throttled calls, like the RateLimiter of AWSUtils
+    "max_attempts": 8,
+    "base_delay": 0.05,
+    "max_delay": 1.0,
+    "vpc_quota": 5,
+    "vcpus_quota": 40,
+    "seed": None,
+}
+
+
+class FakeCloud(object):
+    def __init__(self, **configuration):
+        """
+        In memory simulation of the ec2 resources used by the experiments. Every api call can be slowed down,
+        throttled or failed, the throttled calls are retried with a jittered exponential backoff.
+        :param configuration: values that override DEFAULT_CONFIGURATION
+        """
+        self._lock = RLock()
+        self.recorder = ApiCallRecorder()
+        self.configure(**configuration)
+
+    def configure(self, **configuration):
+        """
+        Reset the simulated cloud with a new configuration, see DEFAULT_CONFIGURATION for the keys
+        :param configuration: values that override DEFAULT_CONFIGURATION
+        :return: None
+        """
+        unknown = set(configuration) - set(DEFAULT_CONFIGURATION)
+        if unknown:
+            raise ValueError("Unknown fake cloud configuration: {}".format(sorted(unknown)))
+        with self._lock:
+            self.configuration = dict(DEFAULT_CONFIGURATION, **configuration)
+            self.random = Random(self.configuration["seed"])
+            self.resources = {region: dict() for region in FAKE_REGIONS}
+            self.public_addresses = ipaddress.ip_network(FAKE_PUBLIC_NETWORK).hosts()
+            self.calls_timestamps = {region: deque() for region in FAKE_REGIONS}
+            self.api_calls = Counter()
+            self.metrics = {region: {"calls": 0, "throttles": 0, "retries": 0, "errors": 0, "wait_time": 0.0,
+                                     "backoff_time": 0.0} for region in FAKE_REGIONS}
+        self.recorder.clear()
+
+    @staticmethod
+    def new_id(prefix):
+        # random like the ec2 ids, so the ids of different cm runs saved in the same db never collide
+        return "{}-{}".format(prefix, uuid4().hex[:17])
+
+    def next_public_address(self):
+        with self._lock:
+            return str(next(self.public_addresses))
+
+    def get_region(self, region):
+        if region not in self.resources:
+            raise ValueError("The region that you specified '{}' does not exists,"
+                             " possible regions are: {}".format(region, list(FAKE_REGIONS)))
+        return self.resources[region]
+
+    def is_throttled(self, region):
+        with self._lock:
+            if self.random.random() < self.configuration["throttle_rate"]:
+                return True
+            region_rate = self.configuration["region_rate"]
+            if region_rate is None:
+                return False
+            now = time()
+            timestamps = self.calls_timestamps[region]
+            while timestamps and now - timestamps[0] > 1:
+                timestamps.popleft()
+            if len(timestamps) >= region_rate:
+                return True
+            timestamps.append(now)
+            return False
+
+    def is_failed(self, operation):
+        with self._lock:
+            failure_rate = self.configuration["operation_failure_rate"].get(operation,
+                                                                            self.configuration["failure_rate"])
+            return self.random.random() < failure_rate
+
+    def call(self, operation, region, function, *args, **kwargs):
+        """
+        Simulate an api call: wait its latency, retry it while it is throttled, then apply function to the state
+        :param operation: name of the api operation ex. "CreateVpc"
+        :param region: region of the call
+        :param function: function that reads or modifies the state, it is called holding the lock
+        :return: function result
+        """
+        self.get_region(region)
+        configuration = self.configuration
+        start_time = time()
+        retries, error = 0, None
+        with self._lock:
+            self.api_calls[operation] += 1
+            self.metrics[region]["calls"] += 1
+        try:
+            while self.is_throttled(region):
+                with self._lock:
+                    self.metrics[region]["throttles"] += 1
+                if retries + 1 >= configuration["max_attempts"]:
+                    raise self.error("RequestLimitExceeded", operation, "Request limit exceeded.")
+                delay = self.random.uniform(0, min(configuration["max_delay"],
+                                                   configuration["base_delay"] * 2 ** retries))
+                sleep(delay)
+                retries += 1
+                with self._lock:
+                    self.metrics[region]["retries"] += 1
+                    self.metrics[region]["backoff_time"] += delay
+
+            sleep(configuration["operation_latency"].get(operation, configuration["latency"]))
+            if self.is_failed(operation):
+                raise self.error("InternalError", operation, "Injected failure.")
+            with self._lock:
+                return function(*args, **kwargs)
+        except ClientError as e:
+            error = e.response["Error"]["Code"]
+            with self._lock:
+                self.metrics[region]["errors"] += 1
+            raise
+        finally:
+            self.recorder.add_record(operation=operation, region=region, phase=self.recorder.phase,
+                                     latency=time() - start_time, retries=retries, error=error,
+                                     timestamp=start_time)
+
+    @staticmethod
+    def error(code, operation, message=""):
+        return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+    def add_resource(self, region, resource_type, prefix, **fields):
+        resource_id = self.new_id(prefix)
+        self.get_region(region)[resource_id] = dict(fields, id=resource_id, type=resource_type)
+        return resource_id
+
+    def get_resource(self, region, resource_id, resource_type, error_code):
+        resource = self.get_region(region).get(resource_id, None)
+        if resource is None or resource["type"] != resource_type:
+            raise self.error(error_code, resource_type, "The id '{}' does not exist".format(resource_id))
+        return resource
+
+    def find(self, region, resource_type, **fields):
+        """
+        :return: list of the resources of the type whose fields have the given values
+        """
+        return [resource for resource in list(self.get_region(region).values())
+                if resource["type"] == resource_type
+                and all(resource.get(key, None) == value for key, value in fields.items())]
+
+    def remove(self, region, resource_id):
+        self.get_region(region).pop(resource_id, None)
+
+    def get_metrics(self):
+        with self._lock:
+            total = {"calls": 0, "throttles": 0, "retries": 0, "errors": 0, "wait_time": 0.0, "backoff_time": 0.0}
+            regions = dict()
+            for region, metrics in self.metrics.items():
+                if metrics["calls"] == 0:
+                    continue
+                regions[region] = dict(metrics)
+                for name, value in metrics.items():
+                    total[name] += value
+            return {"total": total, "regions": regions}
+
+    def get_api_calls(self):
+        with self._lock:
+            return dict(self.api_calls)
+
+
+class FakeEc2Client(object):
+    def __init__(self, cloud, region):
+        """
+        Subset of the boto3 ec2 client used by VpcTeardown, backed by a FakeCloud
+        :param cloud: FakeCloud
+        :param region: region of the client
+        """
+        self.cloud = cloud
+        self.region = region
+
+    FILTERS = {"vpc-id": "vpc_id", "attachment.vpc-id": "vpc_id", "requester-vpc-info.vpc-id": "vpc_id",
+               "accepter-vpc-info.vpc-id": "peer_vpc_id", "instance-id": "id", "instance-state-name": "state"}
+
+    def describe(self, operation, resource_type, key, filters=None):
+        def describe_resources():
+            resources = [resource for resource in self.cloud.get_region(self.region).values()
+                         if resource["type"] == resource_type]
+            for f in filters or []:
+                field = self.FILTERS[f["Name"]]
+                resources = [resource for resource in resources if resource.get(field, None) in f["Values"]]
+            return {key: [dict(resource) for resource in resources]}
+        return self.cloud.call(operation, self.region, describe_resources)
+
+    def delete(self, operation, resource_type, resource_id, error_code):
+        def delete_resource():
+            self.cloud.get_resource(self.region, resource_id, resource_type, error_code)
+            if any(resource_id in resource.get("depends_on", ())
+                   for resource in self.cloud.get_region(self.region).values()):
+                raise self.cloud.error("DependencyViolation", operation,
+                                       "The resource '{}' has dependencies".format(resource_id))
+            self.cloud.remove(self.region, resource_id)
+            return {}
+        return self.cloud.call(operation, self.region, delete_resource)
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator(object):
+            def paginate(self, **kwargs):
+                yield getattr(client, operation_name)(**kwargs)
+        return Paginator()
+
+    def get_waiter(self, waiter_name):
+        client = self
+
+        class Waiter(object):
+            def wait(self, InstanceIds=None, Filters=None, WaiterConfig=None):
+                if InstanceIds is not None:
+                    Filters = [{"Name": "instance-id", "Values": InstanceIds}]
+                client.wait_instances(waiter_name, Filters)
+        return Waiter()
+
+    def wait_instances(self, waiter_name, filters):
+        configuration = self.cloud.configuration
+        if waiter_name == "instance_running":
+            sleep(configuration["instance_boot_time"])
+            states = ("pending", "running")
+            new_state = "running"
+        elif waiter_name == "instance_terminated":
+            sleep(configuration["instance_termination_time"])
+            states = ("shutting-down", "terminated")
+            new_state = "terminated"
+        else:
+            raise ValueError("Waiter {} does not exist".format(waiter_name))
+
+        instances = [instance for reservation in self.describe_instances(Filters=filters)["Reservations"]
+                     for instance in reservation["Instances"]]
+        with self.cloud._lock:
+            for instance in instances:
+                if instance["state"] not in states:
+                    raise self.cloud.error("WaiterError", waiter_name,
+                                           "Instance {} is {}".format(instance["id"], instance["state"]))
+                resource = self.cloud.get_region(self.region)[instance["id"]]
+                resource["state"] = new_state
+                resource["State"] = {"Name": new_state}
+                if new_state == "terminated":
+                    # a terminated instance does not block the deletion of its subnet and security group
+                    resource["vpc_id"] = None
+                    resource["depends_on"] = []
+
+    def boot_instances(self):
+        """
+        Move to running the pending instances whose boot time is elapsed
+        """
+        now = time()
+        with self.cloud._lock:
+            for instance in self.cloud.find(self.region, "instance", state="pending"):
+                if now >= instance["running_at"]:
+                    instance["state"] = "running"
+                    instance["State"] = {"Name": "running"}
+
+    def describe_instances(self, Filters=None, **kwargs):
+        self.boot_instances()
+        instances = self.describe("DescribeInstances", "instance", "Instances", Filters)["Instances"]
+        return {"Reservations": [{"Instances": instances}]}
+
+    def terminate_instances(self, InstanceIds):
+        def terminate():
+            for instance_id in InstanceIds:
+                instance = self.cloud.get_resource(self.region, instance_id, "instance", "InvalidInstanceID.NotFound")
+                instance["state"] = "shutting-down"
+                instance["State"] = {"Name": "shutting-down"}
+            return {}
+        return self.cloud.call("TerminateInstances", self.region, terminate)
+
+    def associate_dhcp_options(self, DhcpOptionsId, VpcId):
+        return self.cloud.call("AssociateDhcpOptions", self.region, dict)
+
+    def describe_nat_gateways(self, Filter=None):
+        return self.describe("DescribeNatGateways", "nat_gateway", "NatGateways", Filter)
+
+    def describe_vpc_endpoints(self, Filters=None):
+        return self.describe("DescribeVpcEndpoints", "vpc_endpoint", "VpcEndpoints", Filters)
+
+    def describe_vpc_peering_connections(self, Filters=None):
+        return self.describe("DescribeVpcPeeringConnections", "vpc_peering_connection", "VpcPeeringConnections",
+                             Filters)
+
+    def delete_vpc_peering_connection(self, VpcPeeringConnectionId):
+        def delete_peering():
+            # the peering connection is visible in both the regions
+            for region in FAKE_REGIONS:
+                self.cloud.remove(region, VpcPeeringConnectionId)
+            return {}
+        return self.cloud.call("DeleteVpcPeeringConnection", self.region, delete_peering)
+
+    def describe_route_tables(self, Filters=None):
+        return self.describe("DescribeRouteTables", "route_table", "RouteTables", Filters)
+
+    def disassociate_route_table(self, AssociationId):
+        def disassociate():
+            for rt in self.cloud.find(self.region, "route_table"):
+                rt["Associations"] = [association for association in rt["Associations"]
+                                      if association["RouteTableAssociationId"] != AssociationId]
+            return {}
+        return self.cloud.call("DisassociateRouteTable", self.region, disassociate)
+
+    def delete_route_table(self, RouteTableId):
+        return self.delete("DeleteRouteTable", "route_table", RouteTableId, "InvalidRouteTableID.NotFound")
+
+    def describe_internet_gateways(self, Filters=None):
+        return self.describe("DescribeInternetGateways", "internet_gateway", "InternetGateways", Filters)
+
+    def detach_internet_gateway(self, InternetGatewayId, VpcId):
+        def detach():
+            gateway = self.cloud.get_resource(self.region, InternetGatewayId, "internet_gateway",
+                                              "InvalidInternetGatewayID.NotFound")
+            gateway["vpc_id"] = None
+            return {}
+        return self.cloud.call("DetachInternetGateway", self.region, detach)
+
+    def delete_internet_gateway(self, InternetGatewayId):
+        return self.delete("DeleteInternetGateway", "internet_gateway", InternetGatewayId,
+                           "InvalidInternetGatewayID.NotFound")
+
+    def describe_network_interfaces(self, Filters=None):
+        return self.describe("DescribeNetworkInterfaces", "network_interface", "NetworkInterfaces", Filters)
+
+    def describe_security_groups(self, Filters=None):
+        return self.describe("DescribeSecurityGroups", "security_group", "SecurityGroups", Filters)
+
+    def delete_security_group(self, GroupId):
+        return self.delete("DeleteSecurityGroup", "security_group", GroupId, "InvalidGroup.NotFound")
+
+    def describe_subnets(self, Filters=None):
+        return self.describe("DescribeSubnets", "subnet", "Subnets", Filters)
+
+    def delete_subnet(self, SubnetId):
+        return self.delete("DeleteSubnet", "subnet", SubnetId, "InvalidSubnetID.NotFound")
+
+    def describe_network_acls(self, Filters=None):
+        return self.describe("DescribeNetworkAcls", "network_acl", "NetworkAcls", Filters)
+
+    def delete_vpc(self, VpcId):
+        def delete():
+            self.cloud.get_resource(self.region, VpcId, "vpc", "InvalidVpcID.NotFound")
+            dependencies = [resource for resource in self.cloud.get_region(self.region).values()
+                            if resource.get("vpc_id", None) == VpcId and not resource.get("default", False)]
+            if dependencies:
+                raise self.cloud.error("DependencyViolation", "DeleteVpc",
+                                       "The vpc '{}' has dependencies".format(VpcId))
+            for resource in self.cloud.find(self.region, "route_table", vpc_id=VpcId) + \
+                    self.cloud.find(self.region, "security_group", vpc_id=VpcId) + \
+                    self.cloud.find(self.region, "network_acl", vpc_id=VpcId):
+                self.cloud.remove(self.region, resource["id"])
+            self.cloud.remove(self.region, VpcId)
+            return {}
+        return self.cloud.call("DeleteVpc", self.region, delete)
@@ -0,0 +1,755 @@
+import ipaddress
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from json import load
+from os import environ
+from time import time
+
+from botocore.exceptions import ClientError
+
+from CloudMeasurement.experiments.awsUtils import AWSUtils
+from CloudMeasurement.experiments.awsUtils.awsUtils import TRANSIT_GATEWAY_TIMEOUT
+from CloudMeasurement.experiments.awsUtils.polling import poll_until
+from CloudMeasurement.experiments.awsUtils.vpcTeardown import VpcTeardown
+from .fakeCloud import FakeCloud, FakeEc2Client, FAKE_REGIONS, FAKE_AZS, INSTANCE_TYPE_VCPUS
+
+# json file with the configuration of the fake cloud, used when the fake cloud is selected from cm
+CONFIGURATION_ENV = "CM_FAKE_CONFIG"
+# instance families without the Elastic Network Adapter
+ENA_UNSUPPORTED_FAMILIES = ("t1", "t2", "m1", "m2", "m3", "c1", "c3", "r3", "i2")
+DESCRIBE_OPERATIONS_TYPES = {"describe_vpcs": "vpc", "describe_subnets": "subnet",
+                             "describe_route_tables": "route_table", "describe_security_groups": "security_group",
+                             "describe_internet_gateways": "internet_gateway", "describe_instances": "instance"}
+
+
+def load_configuration():
+    path = environ.get(CONFIGURATION_ENV, None)
+    if path is None:
+        return dict()
+    with open(path, "r") as f:
+        return load(f)
+
+
+FAKE_CLOUD = FakeCloud(**load_configuration())
+
+
+class FakeUtils(object):
+    """
+    Offline cloud utils with the same interface of AWSUtils, the resources live in memory in FAKE_CLOUD.
+    It is used to benchmark and test the experiments without network and without an aws account.
+    """
+    def __init__(self, region="eu-central-1"):
+        self.ec2_client = FakeUtils.get_client(region=region)
+
+    @staticmethod
+    def configure(**configuration):
+        """
+        Reset the fake cloud with a new configuration: per operation latency, throttling and failures injection.
+        See fakeCloud.DEFAULT_CONFIGURATION for the keys.
+        :return: None
+        """
+        FAKE_CLOUD.configure(**configuration)
+
+    @staticmethod
+    def get_client(region, service="ec2"):
+        if service != "ec2":
+            raise ValueError("The fake cloud has only the ec2 service, got {}".format(service))
+        return FakeEc2Client(cloud=FAKE_CLOUD, region=region)
+
+    @staticmethod
+    def get_rate_limiter_metrics():
+        return FAKE_CLOUD.get_metrics()
+
+    @staticmethod
+    def get_api_calls():
+        return FAKE_CLOUD.get_api_calls()
+
+    @staticmethod
+    def set_api_phase(phase):
+        FAKE_CLOUD.recorder.set_phase(phase)
+
+    @staticmethod
+    def bind_api_phase(function):
+        return FAKE_CLOUD.recorder.bind_phase(function)
+
+    @staticmethod
+    def get_api_records():
+        return FAKE_CLOUD.recorder.get_records()
+
+    @staticmethod
+    def clear_api_records():
+        FAKE_CLOUD.recorder.clear()
+
+    @staticmethod
+    def get_tag_specifications(resource_type, name, tags=None):
+        return AWSUtils.get_tag_specifications(resource_type=resource_type, name=name, tags=tags)
+
+    @staticmethod
+    def get_pool_stats():
+        return dict()
+
+    @staticmethod
+    def check_if_region_exists(region):
+        if region not in FAKE_REGIONS:
+            raise ValueError("The region that you specified '{}' does not exists,"
+                             " possible regions are: {}".format(region, list(FAKE_REGIONS)))
+
+    @staticmethod
+    def check_if_az_exists_in_region(az, region):
+        azs = FakeUtils.get_az_in_the_region(region=region)
+        if az not in azs:
+            raise ValueError("The Availability Zone that you specified '{}' does not exists in region {},"
+                             "possible az in the region are: {}".format(az, region, azs))
+
+    @staticmethod
+    def trust_resource(region, resource_id):
+        pass
+
+    @staticmethod
+    def check_if_resource_id_exists_in_region(resource_id, region, describe_operation, ids_parameter, description):
+        resource_type = DESCRIBE_OPERATIONS_TYPES[describe_operation]
+        resource = FAKE_CLOUD.get_region(region).get(resource_id, None)
+        if resource is None or resource["type"] != resource_type:
+            raise ValueError("The {} that you specified '{}' does not exists in region {}"
+                             "".format(description, resource_id, region))
+
+    @staticmethod
+    def check_if_route_table_id_exists_in_region(route_table_id, region):
+        FakeUtils.check_if_resource_id_exists_in_region(resource_id=route_table_id, region=region,
+                                                        describe_operation="describe_route_tables",
+                                                        ids_parameter="RouteTableIds", description="Route Table id")
+
+    @staticmethod
+    def check_if_subnet_id_exists_in_region(subnet_id, region):
+        FakeUtils.check_if_region_exists(region=region)
+        FakeUtils.check_if_resource_id_exists_in_region(resource_id=subnet_id, region=region,
+                                                        describe_operation="describe_subnets",
+                                                        ids_parameter="SubnetIds", description="Subnet id")
+
+    @staticmethod
+    def get_route_table_ids_in_the_region(region):
+        return [rt["RouteTableId"] for rt in FakeUtils.get_client(region).describe_route_tables()["RouteTables"]]
+
+    @staticmethod
+    def create_vpc_peering(region, vpc_id, peer_region, peer_vpc_id):
+        peering_id = FakeUtils.request_vpc_peering(region=region, vpc_id=vpc_id, peer_region=peer_region,
+                                                   peer_vpc_id=peer_vpc_id)
+        response = FakeUtils.accept_vpc_peerings(region=peer_region, peering_ids=[peering_id])[0]
+        if region != peer_region or vpc_id != peer_vpc_id:
+            peering = response["VpcPeeringConnection"]
+            FakeUtils.add_peer_route(region=region,
+                                     route_table_id=FakeUtils.get_main_route_table_id(region=region, vpc_id=vpc_id),
+                                     peer_id=peering_id,
+                                     destination_cidr_block=peering["AccepterVpcInfo"]["CidrBlock"])
+            FakeUtils.add_peer_route(region=peer_region,
+                                     route_table_id=FakeUtils.get_main_route_table_id(region=peer_region,
+                                                                                      vpc_id=peer_vpc_id),
+                                     peer_id=peering_id,
+                                     destination_cidr_block=peering["RequesterVpcInfo"]["CidrBlock"])
+        return response
+
+    @staticmethod
+    def request_vpc_peering(region, vpc_id, peer_region, peer_vpc_id):
+        def request():
+            vpc = FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            peer_vpc = FAKE_CLOUD.get_resource(peer_region, peer_vpc_id, "vpc", "InvalidVpcID.NotFound")
+            peering_id = FAKE_CLOUD.new_id("pcx")
+            peering = {"id": peering_id, "type": "vpc_peering_connection", "VpcPeeringConnectionId": peering_id,
+                       "vpc_id": vpc_id, "peer_vpc_id": peer_vpc_id, "Status": {"Code": "pending-acceptance"},
+                       "RequesterVpcInfo": {"VpcId": vpc_id, "CidrBlock": vpc["CidrBlock"], "Region": region},
+                       "AccepterVpcInfo": {"VpcId": peer_vpc_id, "CidrBlock": peer_vpc["CidrBlock"],
+                                           "Region": peer_region}}
+            # the same object is visible from both the regions
+            FAKE_CLOUD.get_region(region)[peering_id] = peering
+            FAKE_CLOUD.get_region(peer_region)[peering_id] = peering
+            return peering_id
+        return FAKE_CLOUD.call("CreateVpcPeeringConnection", region, request)
+
+    @staticmethod
+    def accept_vpc_peerings(region, peering_ids):
+        def describe():
+            return [FAKE_CLOUD.get_resource(region, peering_id, "vpc_peering_connection",
+                                            "InvalidVpcPeeringConnectionID.NotFound") for peering_id in peering_ids]
+
+        def accept(peering):
+            peering["Status"] = {"Code": "active"}
+            return {"VpcPeeringConnection": dict(peering)}
+
+        peerings = FAKE_CLOUD.call("DescribeVpcPeeringConnections", region, describe)
+        for peering in peerings:
+            if peering["Status"]["Code"] != "pending-acceptance":
+                raise ValueError("status code for peering request {} in {} is {}"
+                                 "".format(peering["id"], region, peering["Status"]["Code"]))
+        return [FAKE_CLOUD.call("AcceptVpcPeeringConnection", region, accept, peering) for peering in peerings]
+
+    @staticmethod
+    def add_peer_routes(region, route_table_id, routes):
+        return [FakeUtils.add_peer_route(region=region, route_table_id=route_table_id, peer_id=peering_id,
+                                         destination_cidr_block=destination_cidr_block)
+                for destination_cidr_block, peering_id in routes.items()]
+
+    @staticmethod
+    def get_main_route_table_id(region, vpc_id):
+        return FAKE_CLOUD.find(region, "route_table", vpc_id=vpc_id, default=True)[0]["id"]
+
+    @staticmethod
+    def get_all_regions(region="eu-central-1", refresh=False):
+        return FAKE_CLOUD.call("DescribeRegions", region, lambda: sorted(FAKE_REGIONS))
+
+    @staticmethod
+    def get_az_in_the_region(region="eu-central-1"):
+        FakeUtils.check_if_region_exists(region=region)
+        return FAKE_CLOUD.call("DescribeAvailabilityZones", region, lambda: [region + az for az in FAKE_AZS])
+
+    @staticmethod
+    def invalidate_metadata(kind=None, region=None):
+        pass
+
+    @staticmethod
+    def get_all_az(region="eu-central-1"):
+        list_az = []
+        for region in FakeUtils.get_all_regions(region=region):
+            list_az += FakeUtils.get_az_in_the_region(region=region)
+        return sorted(list_az)
+
+    @staticmethod
+    def create_vpc(vpc_name, region='eu-central-1', cidr_block='10.0.0.0/16', **kwargs):
+        def create():
+            vpc_id = FAKE_CLOUD.add_resource(region, "vpc", "vpc", CidrBlock=cidr_block, Name=vpc_name,
+                                             attributes=dict())
+            FAKE_CLOUD.get_region(region)[vpc_id]["VpcId"] = vpc_id
+            # the default resources created by aws with every vpc
+            rt_id = FAKE_CLOUD.add_resource(region, "route_table", "rtb", vpc_id=vpc_id, default=True, Routes=[])
+            FAKE_CLOUD.get_region(region)[rt_id].update(RouteTableId=rt_id, Associations=[
+                {"Main": True, "RouteTableAssociationId": FAKE_CLOUD.new_id("rtbassoc")}])
+            sg_id = FAKE_CLOUD.add_resource(region, "security_group", "sg", vpc_id=vpc_id, default=True,
+                                            GroupName="default")
+            FAKE_CLOUD.get_region(region)[sg_id]["GroupId"] = sg_id
+            acl_id = FAKE_CLOUD.add_resource(region, "network_acl", "acl", vpc_id=vpc_id, default=True,
+                                             IsDefault=True)
+            FAKE_CLOUD.get_region(region)[acl_id]["NetworkAclId"] = acl_id
+            return vpc_id
+        return FAKE_CLOUD.call("CreateVpc", region, create)
+
+    @staticmethod
+    def modify_vpc_attribute(vpc_id, region, attribute, value):
+        def modify():
+            vpc = FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            vpc["attributes"][attribute] = value
+            return {}
+        return FAKE_CLOUD.call("ModifyVpcAttribute", region, modify)
+
+    @staticmethod
+    def modify_EnableDnsSupport(vpc_id, region, value=True):
+        return FakeUtils.modify_vpc_attribute(vpc_id=vpc_id, region=region, attribute="EnableDnsSupport",
+                                              value=value)
+
+    @staticmethod
+    def modify_EnableDnsHostnames(vpc_id, region, value=True):
+        return FakeUtils.modify_vpc_attribute(vpc_id=vpc_id, region=region, attribute="EnableDnsHostnames",
+                                              value=value)
+
+    @staticmethod
+    def modify_MapPublicIpOnLaunch(subnet_id, region, value=True):
+        def modify():
+            subnet = FAKE_CLOUD.get_resource(region, subnet_id, "subnet", "InvalidSubnetID.NotFound")
+            subnet["MapPublicIpOnLaunch"] = value
+            return {}
+        return FAKE_CLOUD.call("ModifySubnetAttribute", region, modify)
+
+    @staticmethod
+    def create_subnet(vpc_id, region, az, subnet_name, cidr_block, route_table_id, map_public_ip_on_launch=False,
+                      **kwargs):
+        FakeUtils.check_if_az_exists_in_region(az=az, region=region)
+
+        def create():
+            FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            subnet_id = FAKE_CLOUD.add_resource(region, "subnet", "subnet", vpc_id=vpc_id, Name=subnet_name,
+                                                CidrBlock=cidr_block, AvailabilityZone=az,
+                                                hosts=ipaddress.ip_network(cidr_block).hosts())
+            FAKE_CLOUD.get_region(region)[subnet_id]["SubnetId"] = subnet_id
+            return subnet_id
+
+        def associate(subnet_id):
+            route_table = FAKE_CLOUD.get_resource(region, route_table_id, "route_table",
+                                                  "InvalidRouteTableID.NotFound")
+            route_table["Associations"].append({"Main": False, "SubnetId": subnet_id,
+                                                "RouteTableAssociationId": FAKE_CLOUD.new_id("rtbassoc")})
+            return {}
+
+        subnet_id = FAKE_CLOUD.call("CreateSubnet", region, create)
+        FAKE_CLOUD.call("AssociateRouteTable", region, associate, subnet_id)
+        if map_public_ip_on_launch:
+            FakeUtils.modify_MapPublicIpOnLaunch(subnet_id=subnet_id, region=region, value=True)
+        return subnet_id
+
+    @staticmethod
+    def create_internet_gateway(region, gateway_name=None, **kwargs):
+        def create():
+            gateway_id = FAKE_CLOUD.add_resource(region, "internet_gateway", "igw", vpc_id=None, Name=gateway_name)
+            FAKE_CLOUD.get_region(region)[gateway_id]["InternetGatewayId"] = gateway_id
+            return gateway_id
+        return FAKE_CLOUD.call("CreateInternetGateway", region, create)
+
+    @staticmethod
+    def create_route_table(vpc_id, region, table_name, **kwargs):
+        def create():
+            FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            rt_id = FAKE_CLOUD.add_resource(region, "route_table", "rtb", vpc_id=vpc_id, Name=table_name,
+                                            Routes=[], Associations=[])
+            FAKE_CLOUD.get_region(region)[rt_id]["RouteTableId"] = rt_id
+            return rt_id
+        return FAKE_CLOUD.call("CreateRouteTable", region, create)
+
+    @staticmethod
+    def get_vpc_obj_from_vpc_id(vpc_id, region):
+        FakeUtils.check_if_region_exists(region=region)
+        try:
+            return dict(FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound"))
+        except ClientError:
+            raise ValueError("The Vpc id that you specified '{}' does not exists in region {}"
+                             "".format(vpc_id, region))
+
+    @staticmethod
+    def add_route(region, route_table_id, gateway_id, destination_cidr_block, **kwargs):
+        def add():
+            route_table = FAKE_CLOUD.get_resource(region, route_table_id, "route_table",
+                                                  "InvalidRouteTableID.NotFound")
+            route_table["Routes"].append({"GatewayId": gateway_id, "DestinationCidrBlock": destination_cidr_block})
+            return {"Return": True}
+        return FAKE_CLOUD.call("CreateRoute", region, add)
+
+    @staticmethod
+    def add_peer_route(region, route_table_id, peer_id, destination_cidr_block, **kwargs):
+        def add():
+            route_table = FAKE_CLOUD.get_resource(region, route_table_id, "route_table",
+                                                  "InvalidRouteTableID.NotFound")
+            route_table["Routes"].append({"VpcPeeringConnectionId": peer_id,
+                                          "DestinationCidrBlock": destination_cidr_block})
+            return {"Return": True}
+        return FAKE_CLOUD.call("CreateRoute", region, add)
+
+    @staticmethod
+    def attach_internet_gateway_to_vpc(vpc_id, region, internet_gateway_id, **kwargs):
+        def attach():
+            FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            gateway = FAKE_CLOUD.get_resource(region, internet_gateway_id, "internet_gateway",
+                                              "InvalidInternetGatewayID.NotFound")
+            gateway["vpc_id"] = vpc_id
+            return {}
+        return FAKE_CLOUD.call("AttachInternetGateway", region, attach)
+
+    @staticmethod
+    def run_instances(region, subnet_id, instance_type, key_name, image_id, number_of_instances=1,
+                      security_group_ids=None, instance_name=None, **kwargs):
+        def run():
+            subnet = FAKE_CLOUD.get_resource(region, subnet_id, "subnet", "InvalidSubnetID.NotFound")
+            placement = dict(kwargs.get("Placement", {}), AvailabilityZone=subnet["AvailabilityZone"])
+            if "GroupName" in placement and not FAKE_CLOUD.find(region, "placement_group",
+                                                                GroupName=placement["GroupName"]):
+                raise FAKE_CLOUD.error("InvalidPlacementGroup.Unknown", "RunInstances")
+            configuration = FAKE_CLOUD.configuration
+            instances_ids = []
+            for _ in range(number_of_instances):
+                with FAKE_CLOUD._lock:
+                    running_at = time() + configuration["instance_boot_time"] + \
+                        FAKE_CLOUD.random.uniform(0, configuration["instance_boot_jitter"])
+                instance_id = FAKE_CLOUD.add_resource(
+                    region, "instance", "i", vpc_id=subnet["vpc_id"],
+                    depends_on=[subnet_id] + list(security_group_ids or []), state="pending",
+                    State={"Name": "pending"}, InstanceType=instance_type, KeyName=key_name, ImageId=image_id,
+                    Name=instance_name, Placement=placement,
+                    PrivateIpAddress=str(next(subnet["hosts"])),
+                    PublicIpAddress=FAKE_CLOUD.next_public_address() if subnet.get("MapPublicIpOnLaunch") else None,
+                    running_at=running_at, status_ok_at=running_at + configuration["instance_status_time"],
+                    ssh_at=running_at + configuration["instance_ssh_time"])
+                FAKE_CLOUD.get_region(region)[instance_id]["InstanceId"] = instance_id
+                instances_ids.append(instance_id)
+            return instances_ids
+        return FAKE_CLOUD.call("RunInstances", region, run)
+
+    @staticmethod
+    def wait_instances_running(region, instances_id_list):
+        FakeUtils.get_client(region=region).get_waiter("instance_running").wait(
+            Filters=[{"Name": "instance-id", "Values": instances_id_list}])
+
+    @staticmethod
+    def get_instances_status(region, instances_id_list):
+        def describe_status():
+            now = time()
+            statuses = dict()
+            for instance_id in instances_id_list:
+                instance = FAKE_CLOUD.get_resource(region, instance_id, "instance", "InvalidInstanceID.NotFound")
+                statuses[instance_id] = "ok" if instance["state"] == "running" and now >= instance["status_ok_at"] \
+                    else "initializing"
+            return statuses
+        FakeUtils.get_client(region=region).boot_instances()
+        return FAKE_CLOUD.call("DescribeInstanceStatus", region, describe_status)
+
+    @staticmethod
+    def probe_ssh(addresses, port=22, timeout=3):
+        """
+        The sshd of a fake instance answers instance_ssh_time seconds after the instance is running
+        :return: dict {address: reachable}
+        """
+        now = time()
+        instances = dict()
+        for region in FAKE_REGIONS:
+            for instance in FAKE_CLOUD.find(region, "instance", state="running"):
+                instances[instance["PublicIpAddress"]] = instance
+                instances[instance["PrivateIpAddress"]] = instance
+        return {address: address in instances and now >= instances[address]["ssh_at"] for address in addresses}
+
+    @staticmethod
+    def create_security_group(vpc_id, region, security_group_name, description="", **kwargs):
+        def create():
+            FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            sg_id = FAKE_CLOUD.add_resource(region, "security_group", "sg", vpc_id=vpc_id,
+                                            GroupName=security_group_name, Description=description,
+                                            IpPermissions=[])
+            FAKE_CLOUD.get_region(region)[sg_id]["GroupId"] = sg_id
+            return sg_id
+        return FAKE_CLOUD.call("CreateSecurityGroup", region, create)
+
+    @staticmethod
+    def authorize_security_group_traffic(region, security_group_id, ip_permissions, directions=[]):
+        if ("ingress" not in directions) and ("egress" not in directions):
+            raise ValueError("Directions not correct")
+
+        def authorize():
+            sg = FAKE_CLOUD.get_resource(region, security_group_id, "security_group", "InvalidGroup.NotFound")
+            sg["IpPermissions"] += ip_permissions
+            return {"Return": True}
+
+        ingress_data, egress_data = None, None
+        if "ingress" in directions:
+            ingress_data = FAKE_CLOUD.call("AuthorizeSecurityGroupIngress", region, authorize)
+        if "egress" in directions:
+            egress_data = FAKE_CLOUD.call("AuthorizeSecurityGroupEgress", region, authorize)
+        return ingress_data, egress_data
+
+    @staticmethod
+    def modify_group_id(region, instances_id, security_groups, **kwargs):
+        def modify(instance_id):
+            instance = FAKE_CLOUD.get_resource(region, instance_id, "instance", "InvalidInstanceID.NotFound")
+            instance["depends_on"] = instance["depends_on"][:1] + list(security_groups)
+            return {}
+        return [FAKE_CLOUD.call("ModifyInstanceAttribute", region, modify, instance_id)
+                for instance_id in instances_id]
+
+    @staticmethod
+    def generate_experiment_id():
+        return str(uuid.uuid4()).split("-")[0].upper()
+
+    @staticmethod
+    def get_service_quota(region, service_code, quota_code, default=None):
+        quotas = {"vpc": FAKE_CLOUD.configuration["vpc_quota"], "ec2": FAKE_CLOUD.configuration["vcpus_quota"]}
+        return FAKE_CLOUD.call("GetServiceQuota", region, lambda: quotas.get(service_code, default))
+
+    @staticmethod
+    def count_vpcs(region):
+        return FAKE_CLOUD.call("DescribeVpcs", region, lambda: len(FAKE_CLOUD.find(region, "vpc")))
+
+    @staticmethod
+    def count_running_standard_vcpus(region):
+        def count():
+            return sum(INSTANCE_TYPE_VCPUS.get(instance["InstanceType"], 2)
+                       for instance in FAKE_CLOUD.find(region, "instance")
+                       if instance["state"] in ("pending", "running"))
+        return FAKE_CLOUD.call("DescribeInstances", region, count)
+
+    @staticmethod
+    def get_instance_type_vcpus(region, instance_type):
+        return INSTANCE_TYPE_VCPUS.get(instance_type, 2)
+
+    @staticmethod
+    def get_ena_support(region, instance_type):
+        return instance_type.split(".")[0] not in ENA_UNSUPPORTED_FAMILIES
+
+    @staticmethod
+    def get_capacity_report(region, vpc_needed=1, instances_needed=1, instance_type="t3.small"):
+        vpcs_limit = FakeUtils.get_service_quota(region=region, service_code="vpc", quota_code=None)
+        vcpus_limit = FakeUtils.get_service_quota(region=region, service_code="ec2", quota_code=None)
+        vcpus_needed = instances_needed * FakeUtils.get_instance_type_vcpus(region=region,
+                                                                            instance_type=instance_type)
+        report = {"region": region,
+                  "vpcs_used": FakeUtils.count_vpcs(region=region), "vpcs_needed": vpc_needed,
+                  "vpcs_limit": int(vpcs_limit),
+                  "vcpus_used": FakeUtils.count_running_standard_vcpus(region=region), "vcpus_needed": vcpus_needed,
+                  "vcpus_limit": int(vcpus_limit)}
+        enough_vpcs = report["vpcs_used"] + vpc_needed <= report["vpcs_limit"]
+        enough_vcpus = report["vcpus_used"] + vcpus_needed <= report["vcpus_limit"]
+        report["ok"] = enough_vpcs and enough_vcpus
+        return report
+
+    @staticmethod
+    def preflight(requirements, max_workers=16):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {region: executor.submit(FakeUtils.get_capacity_report, region=region, **requirement)
+                       for region, requirement in requirements.items()}
+            return {region: future.result() for region, future in futures.items()}
+
+    @staticmethod
+    def check_if_it_is_possible_to_create_a_new_vpc_in_the_region(region, vpc_needed=1):
+        report = FakeUtils.get_capacity_report(region=region, vpc_needed=vpc_needed, instances_needed=0)
+        if report["vpcs_used"] + vpc_needed > report["vpcs_limit"]:
+            raise PermissionError(f"You dont have enough free Vpcs in {region}: Required={vpc_needed},"
+                                  f" used={report['vpcs_used']}, limit={report['vpcs_limit']}")
+
+    @staticmethod
+    def check_if_maximum_it_possible_to_run_instances_in_the_region(region, instances_needed=1,
+                                                                    instance_type="t3.small"):
+        report = FakeUtils.get_capacity_report(region=region, vpc_needed=0, instances_needed=instances_needed,
+                                               instance_type=instance_type)
+        if report["vcpus_used"] + report["vcpus_needed"] > report["vcpus_limit"]:
+            raise PermissionError(f"You dont have enough free vCPUs in {region}: Required={report['vcpus_needed']},"
+                                  f" used={report['vcpus_used']}, limit={report['vcpus_limit']}")
+
+    @staticmethod
+    def get_image_AMI_from_region(region, image_name):
+        return FAKE_CLOUD.call("DescribeImages", region,
+                               lambda: "ami-{}".format(uuid.uuid5(uuid.NAMESPACE_DNS, region + image_name).hex[:17]))
+
+    @staticmethod
+    def create_image(region, instance_id, name):
+        def create():
+            FAKE_CLOUD.get_resource(region, instance_id, "instance", "InvalidInstanceID.NotFound")
+            return FAKE_CLOUD.add_resource(region, "image", "ami", Name=name, State="available",
+                                           SourceInstanceId=instance_id)
+        return FAKE_CLOUD.call("CreateImage", region, create)
+
+    @staticmethod
+    def copy_image(region, source_region, source_image_id, name):
+        def copy():
+            FAKE_CLOUD.get_resource(source_region, source_image_id, "image", "InvalidAMIID.NotFound")
+            return FAKE_CLOUD.add_resource(region, "image", "ami", Name=name, State="available",
+                                           SourceImageId=source_image_id)
+        return FAKE_CLOUD.call("CopyImage", region, copy)
+
+    @staticmethod
+    def deregister_image(region, image_id):
+        def deregister():
+            FAKE_CLOUD.get_resource(region, image_id, "image", "InvalidAMIID.NotFound")
+            del FAKE_CLOUD.get_region(region)[image_id]
+            return {}
+        return FAKE_CLOUD.call("DeregisterImage", region, deregister)
+
+    @staticmethod
+    def describe_instances_data(region, instances_id_list):
+        reservations = FakeUtils.get_client(region=region).describe_instances(
+            Filters=[{"Name": "instance-id", "Values": instances_id_list}])["Reservations"]
+        return {instance["InstanceId"]: {"public_address": instance["PublicIpAddress"],
+                                         "private_address": instance["PrivateIpAddress"],
+                                         "availability_zone": instance["Placement"]["AvailabilityZone"],
+                                         "state": instance["State"]["Name"]}
+                for reservation in reservations for instance in reservation["Instances"]}
+
+    @staticmethod
+    def get_instance_private_ip(region, instance_id):
+        return FakeUtils.describe_instances_data(region=region, instances_id_list=[instance_id])[
+            instance_id]["private_address"]
+
+    @staticmethod
+    def get_instance_public_ip(region, instance_id):
+        return FakeUtils.describe_instances_data(region=region, instances_id_list=[instance_id])[
+            instance_id]["public_address"]
+
+    @staticmethod
+    def modify_security_group(region, instance_ids, groups, **kwargs):
+        FakeUtils.modify_group_id(region=region, instances_id=instance_ids, security_groups=groups)
+
+    @staticmethod
+    def get_account_id(region="eu-central-1"):
+        return "000000000000"
+
+    @staticmethod
+    def wait_for_state(region, describe_operation, ids_parameter, result_key, resource_ids, states, description,
+                       timeout=TRANSIT_GATEWAY_TIMEOUT):
+        """
+        Same of AWSUtils.wait_for_state, the fake resources without a State are available. A resource that is not
+        found is considered deleted.
+        :return: list of the resources
+        """
+        operation = "".join(word.capitalize() for word in describe_operation.split("_"))
+
+        def describe():
+            resources = FAKE_CLOUD.get_region(region)
+            return [dict(resources[resource_id]) for resource_id in resource_ids if resource_id in resources]
+
+        def in_state():
+            resources = FAKE_CLOUD.call(operation, region, describe)
+            if len(resources) < len(resource_ids) and "deleted" not in states:
+                return None
+            if all(resource.get("State", "available") in states for resource in resources):
+                return resources
+            return None
+
+        return poll_until(in_state, timeout=timeout, delay=0.01, description=description)
+
+    @staticmethod
+    def create_transit_gateway(region, name):
+        def create():
+            transit_gateway_id = FAKE_CLOUD.add_resource(region, "transit_gateway", "tgw", Name=name)
+            route_table_id = FAKE_CLOUD.add_resource(region, "transit_gateway_route_table", "tgw-rtb",
+                                                     depends_on=[transit_gateway_id], Routes=[])
+            return {"transit_gateway_id": transit_gateway_id, "route_table_id": route_table_id}
+        return FAKE_CLOUD.call("CreateTransitGateway", region, create)
+
+    @staticmethod
+    def attach_vpc_to_transit_gateway(region, transit_gateway_id, vpc_id, subnet_ids, name):
+        def attach():
+            FAKE_CLOUD.get_resource(region, transit_gateway_id, "transit_gateway",
+                                    "InvalidTransitGatewayID.NotFound")
+            FAKE_CLOUD.get_resource(region, vpc_id, "vpc", "InvalidVpcID.NotFound")
+            # the attachment has a network interface in every subnet
+            return FAKE_CLOUD.add_resource(region, "transit_gateway_attachment", "tgw-attach", vpc_id=vpc_id,
+                                           depends_on=[transit_gateway_id] + list(subnet_ids), Name=name)
+        return FAKE_CLOUD.call("CreateTransitGatewayVpcAttachment", region, attach)
+
+    @staticmethod
+    def request_transit_gateway_peering(region, transit_gateway_id, peer_region, peer_transit_gateway_id, name):
+        def request():
+            FAKE_CLOUD.get_resource(region, transit_gateway_id, "transit_gateway",
+                                    "InvalidTransitGatewayID.NotFound")
+            FAKE_CLOUD.get_resource(peer_region, peer_transit_gateway_id, "transit_gateway",
+                                    "InvalidTransitGatewayID.NotFound")
+            attachment_id = FAKE_CLOUD.add_resource(region, "transit_gateway_attachment", "tgw-attach",
+                                                    depends_on=[transit_gateway_id], State="pendingAcceptance",
+                                                    Name=name)
+            # the same object is visible from both the regions
+            attachment = FAKE_CLOUD.get_region(region)[attachment_id]
+            FAKE_CLOUD.get_region(peer_region)[attachment_id] = dict(attachment,
+                                                                     depends_on=[peer_transit_gateway_id])
+            return attachment_id
+        return FAKE_CLOUD.call("CreateTransitGatewayPeeringAttachment", region, request)
+
+    @staticmethod
+    def accept_transit_gateway_peerings(region, attachment_ids):
+        def accept(attachment_id):
+            attachment = FAKE_CLOUD.get_resource(region, attachment_id, "transit_gateway_attachment",
+                                                 "InvalidTransitGatewayAttachmentID.NotFound")
+            if attachment["State"] != "pendingAcceptance":
+                raise ValueError("state of the transit gateway peering {} in {} is {}"
+                                 "".format(attachment_id, region, attachment["State"]))
+            attachment["State"] = "available"
+            return {}
+        for attachment_id in attachment_ids:
+            FAKE_CLOUD.call("AcceptTransitGatewayPeeringAttachment", region, accept, attachment_id)
+
+    @staticmethod
+    def add_transit_gateway_routes(region, route_table_id, routes):
+        def add(destination_cidr_block, attachment_id):
+            route_table = FAKE_CLOUD.get_resource(region, route_table_id, "transit_gateway_route_table",
+                                                  "InvalidRouteTableID.NotFound")
+            route_table["Routes"].append({"DestinationCidrBlock": destination_cidr_block,
+                                          "TransitGatewayAttachmentId": attachment_id})
+            return {}
+        return [FAKE_CLOUD.call("CreateTransitGatewayRoute", region, add, destination_cidr_block, attachment_id)
+                for destination_cidr_block, attachment_id in routes.items()]
+
+    @staticmethod
+    def add_vpc_route_to_transit_gateway(region, route_table_id, transit_gateway_id, destination_cidr_block):
+        def add():
+            route_table = FAKE_CLOUD.get_resource(region, route_table_id, "route_table",
+                                                  "InvalidRouteTableID.NotFound")
+            route_table["Routes"].append({"DestinationCidrBlock": destination_cidr_block,
+                                          "TransitGatewayId": transit_gateway_id})
+            return {"Return": True}
+        return FAKE_CLOUD.call("CreateRoute", region, add)
+
+    @staticmethod
+    def delete_route(region, route_table_id, destination_cidr_block):
+        def delete():
+            route_table = FAKE_CLOUD.get_region(region).get(route_table_id, None)
+            if route_table is not None:
+                route_table["Routes"] = [route for route in route_table["Routes"]
+                                         if route["DestinationCidrBlock"] != destination_cidr_block]
+            return {}
+        return FAKE_CLOUD.call("DeleteRoute", region, delete)
+
+    @staticmethod
+    def delete_transit_gateway_peering(region, attachment_id):
+        def delete():
+            for peering_region in FAKE_REGIONS:
+                FAKE_CLOUD.remove(peering_region, attachment_id)
+            return {}
+        return FAKE_CLOUD.call("DeleteTransitGatewayPeeringAttachment", region, delete)
+
+    @staticmethod
+    def delete_transit_gateway_vpc_attachment(region, attachment_id):
+        return FakeUtils.get_client(region=region).delete("DeleteTransitGatewayVpcAttachment",
+                                                          "transit_gateway_attachment", attachment_id,
+                                                          "InvalidTransitGatewayAttachmentID.NotFound")
+
+    @staticmethod
+    def delete_transit_gateway(region, transit_gateway_id):
+        def delete():
+            for route_table in FAKE_CLOUD.find(region, "transit_gateway_route_table"):
+                if transit_gateway_id in route_table["depends_on"]:
+                    FAKE_CLOUD.remove(region, route_table["id"])
+            return {}
+        FAKE_CLOUD.call("DeleteTransitGatewayRouteTables", region, delete)
+        return FakeUtils.get_client(region=region).delete("DeleteTransitGateway", "transit_gateway",
+                                                          transit_gateway_id, "InvalidTransitGatewayID.NotFound")
+
+    @staticmethod
+    def get_vpcs_by_name(region, name):
+        return FAKE_CLOUD.call("DescribeVpcs", region,
+                               lambda: [vpc["id"] for vpc in FAKE_CLOUD.find(region, "vpc", Name=name)])
+
+    @staticmethod
+    def create_placement_group(region, name, group_name, strategy="cluster"):
+        def create():
+            if not FAKE_CLOUD.find(region, "placement_group", GroupName=name):
+                FAKE_CLOUD.add_resource(region, "placement_group", "pg", GroupName=name, Strategy=strategy,
+                                        Name=group_name)
+            return name
+        return FAKE_CLOUD.call("CreatePlacementGroup", region, create)
+
+    @staticmethod
+    def remove_placement_groups(region, group_name):
+        def remove():
+            for placement_group in FAKE_CLOUD.find(region, "placement_group", Name=group_name):
+                del FAKE_CLOUD.get_region(region)[placement_group["id"]]
+        return FAKE_CLOUD.call("DeletePlacementGroup", region, remove)
+
+    @staticmethod
+    def tag_resources(region, resource_ids, name):
+        def tag():
+            resources = FAKE_CLOUD.get_region(region)
+            for resource_id in resource_ids:
+                if resource_id not in resources:
+                    raise FAKE_CLOUD.error("InvalidID", "CreateTags", "The id '{}' does not exist".format(resource_id))
+            for resource_id in resource_ids:
+                resources[resource_id]["Name"] = name
+            return {}
+        return FAKE_CLOUD.call("CreateTags", region, tag)
+
+    @staticmethod
+    def remove_vpc_instances(region, vpc_id):
+        VpcTeardown(ec2_client=FakeUtils.get_client(region=region), vpc_id=vpc_id).delete_instances()
+
+    @staticmethod
+    def remove_vpc_peerings(region, vpc_id):
+        VpcTeardown(ec2_client=FakeUtils.get_client(region=region), vpc_id=vpc_id).delete_peerings()
+
+    @staticmethod
+    def remove_transit_gateway_peerings(region, transit_gateway_id):
+        attachments = FAKE_CLOUD.call("DescribeTransitGatewayPeeringAttachments", region, lambda: [
+            attachment["id"] for attachment in FAKE_CLOUD.find(region, "transit_gateway_attachment")
+            if "State" in attachment and transit_gateway_id in attachment["depends_on"]])
+        for attachment_id in attachments:
+            FakeUtils.delete_transit_gateway_peering(region=region, attachment_id=attachment_id)
+
+    @staticmethod
+    def remove_vpc(region, vpc_id, max_workers=8):
+        """
+        Remove the vpc with the same VpcTeardown used by AWSUtils, on a fake ec2 client
+        :param region: region where the vpc is located
+        :param vpc_id: Id of the Vpc
+        :param max_workers: maximum number of resources types deleted at the same time
+        :return: client response
+        """
+        teardown = VpcTeardown(ec2_client=FakeUtils.get_client(region=region), vpc_id=vpc_id,
+                               max_workers=max_workers)
+        return teardown.run()
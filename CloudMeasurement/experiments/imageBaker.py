@@ -0,0 +1,73 @@
+from CloudMeasurement.experiments.awsUtils import AWSUtils
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace, DEFAULT_MACHINE_TYPE, \
+    DEFAULT_MAX_WORKERS
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_NAME_PREFIX = "cm-probe-"
+BUILDER_CIDR_BLOCK = "10.0.0.0/24"
+
+
+class ImageBaker(object):
+    def __init__(self, cloud_util=AWSUtils, key_pair_id="id_rsa", machine_type=DEFAULT_MACHINE_TYPE,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Build the probe image once, from a builder instance with the tools installed, and copy it to the regions,
+        so the probes of the experiments start with the tools already installed
+        :param cloud_util: cloud utils class
+        :param key_pair_id: key pair of the builder instance
+        :param machine_type: machine type of the builder instance
+        :param max_workers: maximum number of regions copied at the same time
+        """
+        self.cloud_util = cloud_util
+        self.cloud_utils = cloud_util()
+        self.key_pair_id = key_pair_id
+        self.machine_type = machine_type
+        self.max_workers = max_workers
+
+    def bake(self, source_region, regions, provision):
+        """
+        Create the image in source_region, then copy it to the other regions concurrently. The builder vpc is
+        removed when the image is created, even if the creation fails.
+        :param source_region: region of the builder instance
+        :param regions: list of the regions where the image is needed
+        :param provision: callable (instance_dict), installs the tools in the builder once its sshd answers
+        :return: tuple (image name, dict {region: image id})
+        """
+        name = IMAGE_NAME_PREFIX + self.cloud_utils.generate_experiment_id()
+        trace = MultiregionalTrace(list_of_regions=[source_region], machine_type_mapping={
+            source_region: self.machine_type}, cloud_util=self.cloud_util)
+        try:
+            vpc_data = trace.create_region_vpc(region=source_region, experiment_id=name,
+                                               subnet_pool=BUILDER_CIDR_BLOCK)
+            trace.vpcs_data = {"experiment_id": name, "cidr_block": BUILDER_CIDR_BLOCK,
+                               source_region: [dict(vpc_data)]}
+            trace.create_region_instances(region=source_region, key_pair_id=self.key_pair_id,
+                                          ready_stage="ssh_reachable")
+            builder = trace.vpcs_data[source_region][0]
+            provision(builder)
+            image_id = self.cloud_utils.create_image(region=source_region, instance_id=builder["instance_id"],
+                                                     name=name)
+        finally:
+            for vpc_id in self.cloud_utils.get_vpcs_by_name(region=source_region, name=name):
+                self.cloud_utils.remove_vpc(source_region, vpc_id)
+
+        images = {source_region: image_id}
+        other_regions = [region for region in regions if region != source_region]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(other_regions)))) as executor:
+            futures = {region: executor.submit(self.cloud_utils.copy_image, region=region,
+                                               source_region=source_region, source_image_id=image_id, name=name)
+                       for region in other_regions}
+        images.update({region: future.result() for region, future in futures.items()})
+        return name, images
+
+    def deregister(self, images):
+        """
+        Deregister concurrently the images of a previous bake
+        :param images: dict {region: image id}
+        :return: None
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(images)))) as executor:
+            futures = [executor.submit(self.cloud_utils.deregister_image, region=region, image_id=image_id)
+                       for region, image_id in images.items()]
+        for future in futures:
+            future.result()
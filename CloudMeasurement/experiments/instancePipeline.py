@@ -0,0 +1,97 @@
+from time import sleep, time
+
+STAGES = ("launched", "running", "status_ok", "ssh_reachable")
+DEFAULT_TIMEOUT = 900
+
+
+class InstancePipeline(object):
+    def __init__(self, cloud_utils, region, instances_id_list, ready_stage="running", on_ready=None,
+                 use_private_ip=False, timeout=DEFAULT_TIMEOUT, delay=0.5, max_delay=5, backoff=1.5):
+        """
+        Move every instance of a region through launched -> running -> status_ok -> ssh_reachable, independently
+        from the other instances. Every round makes at most one describe call and one batch of ssh probes for
+        all the instances waiting in a stage, and an instance can cross many stages in the same round.
+        :param cloud_utils: cloud utils class
+        :param region: region of the instances
+        :param instances_id_list: list of the launched instances ids
+        :param ready_stage: stage where an instance is ready, one of STAGES after launched
+        :param on_ready: optional callable (instance_id, instance_data), called as soon as an instance is ready
+        :param use_private_ip: probe ssh on the private address instead of the public one
+        :param timeout: maximum number of seconds to wait for all the instances
+        :param delay: first delay between two rounds, then multiplied by backoff until max_delay
+        """
+        if ready_stage not in STAGES[1:]:
+            raise ValueError("stage '{}' is not valid. Valid stages: {}".format(ready_stage, STAGES[1:]))
+        self.cloud_utils = cloud_utils
+        self.region = region
+        self.ready_stage = ready_stage
+        self.on_ready = on_ready
+        self.use_private_ip = use_private_ip
+        self.timeout = timeout
+        self.delay = delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.stages = {instance_id: "launched" for instance_id in instances_id_list}
+        self.instances_data = {instance_id: dict() for instance_id in instances_id_list}
+        # seconds from the start of the pipeline to the arrival of every instance in every stage
+        self.timings = {instance_id: dict() for instance_id in instances_id_list}
+
+    def get_instances(self, stage):
+        return [instance_id for instance_id, instance_stage in self.stages.items() if instance_stage == stage]
+
+    def is_ready(self, instance_id):
+        return STAGES.index(self.stages[instance_id]) >= STAGES.index(self.ready_stage)
+
+    def advance(self, instance_id, stage, start):
+        self.stages[instance_id] = stage
+        self.timings[instance_id][stage] = time() - start
+        if stage == self.ready_stage and self.on_ready is not None:
+            self.on_ready(instance_id, self.instances_data[instance_id])
+
+    def run_round(self, start):
+        launched = self.get_instances("launched")
+        if launched:
+            instances_data = self.cloud_utils.describe_instances_data(region=self.region,
+                                                                      instances_id_list=launched)
+            for instance_id in launched:
+                instance_data = instances_data.get(instance_id, None)
+                if instance_data is None or instance_data["state"] == "pending":
+                    continue
+                if instance_data["state"] != "running":
+                    raise RuntimeError("instance {} in {} is {}".format(instance_id, self.region,
+                                                                        instance_data["state"]))
+                self.instances_data[instance_id] = instance_data
+                self.advance(instance_id, "running", start)
+
+        running = [instance_id for instance_id in self.get_instances("running") if not self.is_ready(instance_id)]
+        if running:
+            statuses = self.cloud_utils.get_instances_status(region=self.region, instances_id_list=running)
+            for instance_id in running:
+                if statuses.get(instance_id, None) == "ok":
+                    self.advance(instance_id, "status_ok", start)
+
+        status_ok = [instance_id for instance_id in self.get_instances("status_ok") if not self.is_ready(instance_id)]
+        if status_ok:
+            address_key = "private_address" if self.use_private_ip else "public_address"
+            addresses = {self.instances_data[instance_id][address_key]: instance_id for instance_id in status_ok}
+            reachable = self.cloud_utils.probe_ssh(addresses=list(addresses))
+            for address, instance_id in addresses.items():
+                if reachable[address]:
+                    self.advance(instance_id, "ssh_reachable", start)
+
+    def run(self):
+        """
+        :return: dict {instance_id: instance data of describe_instances_data}
+        """
+        start = time()
+        delay = self.delay
+        while True:
+            self.run_round(start)
+            waiting = [instance_id for instance_id in self.stages if not self.is_ready(instance_id)]
+            if not waiting:
+                return self.instances_data
+            if time() - start + delay > self.timeout:
+                raise TimeoutError("Timeout after {} seconds waiting for the instances {} in {} to be {}"
+                                   "".format(self.timeout, waiting, self.region, self.ready_stage))
+            sleep(delay)
+            delay = min(delay * self.backoff, self.max_delay)
@@ -1,23 +1,36 @@
 from CloudMeasurement.experiments.awsUtils import AWSUtils
-from multiprocessing import Process
+from CloudMeasurement.experiments.instancePipeline import InstancePipeline
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
 from itertools import combinations
 
 import ipaddress
+import re
 
 DEFAULT_MACHINE_TYPE = "t3.small"
+# ENA instance type that can be launched in a cluster placement group, unlike the burstable ones
+NETWORK_OPTIMIZED_MACHINE_TYPE = "c5n.large"
 IP_PERMISSION = [{"IpProtocol": "-1", "FromPort": 1, "ToPort": 65353, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]}]
 IMAGE_NAME = "ubuntu/images/hvm-ssd/ubuntu-bionic-18.04-amd64-server-20190722.1"
 REMOTE_USER = "ubuntu"
+DEFAULT_MAX_WORKERS = 16
+# full mesh of vpc peerings, or transit gateways peered with the transit gateway of the first region
+TOPOLOGIES = ("mesh", "transit_gateway")
 
 
 class MultiregionalTrace(object):
     def __init__(self, list_of_regions=("eu-central-1",), az_mapping=None, machine_type_mapping=None,
-                 cloud_util=AWSUtils, network_optimized=False):
+                 cloud_util=AWSUtils, network_optimized=False, instances_per_az=1, max_workers=DEFAULT_MAX_WORKERS,
+                 topology="mesh"):
         """
         :param list_of_regions: list of regions
         :param az_mapping: dict
         :param machine_type_mapping: dict
         :param cloud_util: cloud utils class
+        :param instances_per_az: number of probes launched in every availability zone
+        :param max_workers: maximum number of regions provisioned at the same time
+        :param topology: topology of the private network, one of TOPOLOGIES
         """
         self.list_of_regions = list_of_regions
         self.cloud_utils = cloud_util()
@@ -31,9 +44,36 @@ class MultiregionalTrace(object):
         if len(set(list_of_regions)) < len(list_of_regions):
             raise ValueError("One or more region are repeated multiple times")
 
+        if topology not in TOPOLOGIES:
+            raise ValueError("topology '{}' is not valid. Valid topologies: {}".format(topology, TOPOLOGIES))
+
         self.az_mapping = self.__get_az_mapping(az_mapping=az_mapping)
-        self.machine_type_mapping = self.__get_machine_type_mapping(machine_type_mapping=machine_type_mapping)
+        default_machine_type = NETWORK_OPTIMIZED_MACHINE_TYPE if network_optimized else DEFAULT_MACHINE_TYPE
+        self.machine_type_mapping = self.__get_machine_type_mapping(machine_type_mapping=machine_type_mapping,
+                                                                    default_machine_type=default_machine_type)
         self.network_optimized = network_optimized
+        self.instances_per_az = instances_per_az
+        self.max_workers = max_workers
+        self.topology = topology
+        self.peering_ids = dict()
+        # {region: transit gateway ids}, and the routes added for the private network
+        self.transit_gateways = dict()
+        self.routes = []
+        # {instance_id: {stage: seconds from the start of the inspection}}
+        self.instance_timings = dict()
+        # {(step, region): data} of the completed provisioning steps, region is None for the global steps.
+        # on_checkpoint(experiment_id, step, region, data) is called for every completed step, data is None
+        # when the step is invalidated by resume
+        self.experiment_id = None
+        self.checkpoints = dict()
+        self.on_checkpoint = None
+        self._checkpoints_lock = Lock()
+        # optional WarmPool, the regions are claimed from it before being provisioned
+        self.warm_pool = None
+        # {region: image id} of the baked probe image, used instead of IMAGE_NAME
+        self.images = dict()
+        # number of api calls made in every provisioning phase
+        self.api_calls = dict()
 
     def __get_az_mapping(self, az_mapping):
         mapping = dict()
@@ -53,145 +93,709 @@ class MultiregionalTrace(object):
                     raise ValueError("Availability Zone '{}' is not valid for region {}".format(map_value, region))
         return mapping
 
-    def __get_machine_type_mapping(self, machine_type_mapping):
+    def __get_machine_type_mapping(self, machine_type_mapping, default_machine_type=DEFAULT_MACHINE_TYPE):
         # TODO: check that all the machine type are valid
         mapping = dict()
         if machine_type_mapping is None:
-            mapping = {region: DEFAULT_MACHINE_TYPE for region in self.list_of_regions}
+            mapping = {region: default_machine_type for region in self.list_of_regions}
         elif type(machine_type_mapping) is str:
             mapping = {region: machine_type_mapping for region in self.list_of_regions}
         else:
             for region in self.list_of_regions:
                 map_value = machine_type_mapping.get(region, None)
                 if map_value is None:
-                    mapping[region] = DEFAULT_MACHINE_TYPE
+                    mapping[region] = default_machine_type
                 else:
                     mapping[region] = map_value
         return mapping
 
+    def get_parameters(self):
+        """
+        :return: dict with the arguments needed to build the same experiment again
+        """
+        return {"list_of_regions": list(self.list_of_regions), "az_mapping": self.az_mapping,
+                "machine_type_mapping": self.machine_type_mapping, "network_optimized": self.network_optimized,
+                "instances_per_az": self.instances_per_az, "topology": self.topology}
+
+    def save_checkpoint(self, step, region=None, data=None):
+        with self._checkpoints_lock:
+            if data is None:
+                self.checkpoints.pop((step, region), None)
+            else:
+                self.checkpoints[(step, region)] = data
+            if self.on_checkpoint is not None:
+                self.on_checkpoint(self.experiment_id, step, region, data)
+
+    def get_checkpoint(self, step, region=None):
+        return self.checkpoints.get((step, region), None)
+
+    def drop_checkpoint(self, step, region=None):
+        if self.get_checkpoint(step, region) is not None:
+            self.save_checkpoint(step, region, None)
+
+    def start_experiment(self, cidr_block, subnet_pools=None):
+        """
+        Generate the experiment id, or reuse the one of the resumed experiment
+        :param cidr_block: cidr block of the experiment
+        :param subnet_pools: optional dict {region: cidr block of the vpc}
+        :return: dict with experiment_id, cidr_block, parameters and subnet_pools if given
+        """
+        experiment = self.get_checkpoint("experiment")
+        if experiment is None:
+            self.experiment_id = self.cloud_utils.generate_experiment_id()
+            experiment = {"experiment_id": self.experiment_id, "cidr_block": cidr_block,
+                          "parameters": self.get_parameters()}
+            if subnet_pools is not None:
+                experiment["subnet_pools"] = subnet_pools
+            self.save_checkpoint("experiment", data=experiment)
+        return experiment
+
+    def resume(self, checkpoints):
+        """
+        Load the checkpoints of an interrupted experiment and reconcile them with the live resources: the steps
+        whose resources are gone are invalidated, and the resources created by the unfinished steps are removed,
+        so the create methods run only the missing steps.
+        :param checkpoints: dict {(step, region): data}
+        :return: None
+        """
+        self.checkpoints = dict(checkpoints)
+        experiment = self.get_checkpoint("experiment")
+        if experiment is None:
+            return
+        self.experiment_id = experiment["experiment_id"]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.list_of_regions))) as executor:
+            futures = [executor.submit(self.cloud_utils.bind_api_phase(self.reconcile_region), region=region)
+                       for region in self.list_of_regions]
+        for future in futures:
+            future.result()
+        if self.get_checkpoint("peering") is None:
+            self.remove_partial_peering()
+
+    def reconcile_region(self, region):
+        vpc = self.get_checkpoint("vpc", region)
+        live_vpcs = self.cloud_utils.get_vpcs_by_name(region=region, name=self.experiment_id)
+        if vpc is not None and vpc["vpc_id"] not in live_vpcs:
+            transit_gateway = self.get_checkpoint("transit_gateway", region)
+            if transit_gateway is not None:
+                # the checkpoint is saved before the peering, so it has no peering attachment
+                self.cloud_utils.remove_transit_gateway_peerings(
+                    region=region, transit_gateway_id=transit_gateway["transit_gateway_id"])
+                self.purge_transit_gateways(transit_gateways={region: transit_gateway},
+                                            cloud_utils=self.cloud_utils)
+            for step in ("vpc", "instances", "transit_gateway"):
+                self.drop_checkpoint(step, region)
+            self.drop_checkpoint("peering")
+            vpc = None
+        for vpc_id in live_vpcs:
+            if vpc is None or vpc_id != vpc["vpc_id"]:
+                # created by a step that did not complete
+                self.cloud_utils.remove_vpc(region, vpc_id)
+        if vpc is None:
+            return
+
+        instances = self.get_checkpoint("instances", region)
+        if instances is not None:
+            instances_ids = [instance_dict["instance_id"] for instance_dict in instances]
+            instances_data = self.cloud_utils.describe_instances_data(region=region, instances_id_list=instances_ids)
+            if all(instances_data.get(instance_id, {}).get("state", None) == "running"
+                   for instance_id in instances_ids):
+                return
+            self.drop_checkpoint("instances", region)
+        self.cloud_utils.remove_vpc_instances(region=region, vpc_id=vpc["vpc_id"])
+
+    def remove_partial_peering(self):
+        """
+        Remove what an unfinished peering step created, so it can run again from the beginning
+        """
+        regions = [region for region in self.list_of_regions if self.get_checkpoint("vpc", region) is not None]
+        if self.topology == "transit_gateway":
+            for region in regions:
+                transit_gateway = self.get_checkpoint("transit_gateway", region)
+                if transit_gateway is not None:
+                    self.cloud_utils.remove_transit_gateway_peerings(
+                        region=region, transit_gateway_id=transit_gateway["transit_gateway_id"])
+            return
+        for region in regions:
+            vpc = self.get_checkpoint("vpc", region)
+            self.cloud_utils.remove_vpc_peerings(region=region, vpc_id=vpc["vpc_id"])
+            for other in regions:
+                if other != region:
+                    self.cloud_utils.delete_route(
+                        region=region, route_table_id=vpc["public_route_table_id"],
+                        destination_cidr_block=self.get_checkpoint("vpc", other)["vpc_cidr_block"])
+
+    def count_api_calls(self):
+        """
+        :return: total number of api calls made by the cloud utils until now
+        """
+        return sum(self.cloud_utils.get_api_calls().values())
+
+    def check_capacity(self, instances_needed):
+        """
+        Check the quotas of all the regions concurrently, before creating any resource
+        :param instances_needed: dict {region: number of instances needed}, for the regions to create
+        :return: dict {region: capacity report}
+        """
+        if self.network_optimized:
+            self.check_enhanced_networking(regions=list(instances_needed))
+        requirements = {region: {"vpc_needed": 1, "instances_needed": instances_needed[region],
+                                 "instance_type": self.machine_type_mapping[region]}
+                        for region in instances_needed}
+        report = self.cloud_utils.preflight(requirements=requirements)
+        failures = [region_report for region_report in report.values() if not region_report["ok"]]
+        if failures:
+            raise PermissionError("You dont have enough free resources: {}".format(failures))
+        return report
+
+    def check_enhanced_networking(self, regions):
+        """
+        The network optimized probes need an instance type with ENA, that can be launched in a cluster placement
+        group, so not a burstable one
+        :param regions: list of regions
+        :return: None
+        """
+        invalid = [(region, self.machine_type_mapping[region]) for region in regions
+                   if re.match(r"t\d", self.machine_type_mapping[region])
+                   or not self.cloud_utils.get_ena_support(region=region,
+                                                           instance_type=self.machine_type_mapping[region])]
+        if invalid:
+            raise ValueError("the machine types {} can not be network optimized, use an ENA type that is not "
+                             "burstable, ex. {}".format(invalid, NETWORK_OPTIMIZED_MACHINE_TYPE))
+
     def create_experiment_environment(self):
         return self.create_multiregional_vpcs()
 
     def create_multiregional_vpcs(self, cidr_block="10.0.0.0/16"):
         if self.vpcs_data is not None:
             raise PermissionError("the experiment vpc is already created: {}".format(self.vpcs_data))
-        for region in self.list_of_regions:
-            # check if the resource are available in all the regions before starting the experiment
-            self.cloud_utils.check_if_it_is_possible_to_create_a_new_vpc_in_the_region(region=region, vpc_needed=1)
-            self.cloud_utils.check_if_maximum_it_possible_to_run_instances_in_the_region(region=region,
-                                                                                         instances_needed=1)
-        subnetwork_pool_generator = ipaddress.ip_network(cidr_block).subnets(new_prefix=24)
-        experiment_id = self.cloud_utils.generate_experiment_id()
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("preflight")
+        # the regions already created by a resumed experiment are skipped
+        missing_regions = [region for region in self.list_of_regions if self.get_checkpoint("vpc", region) is None]
+        # check if the resource are available in all the regions before starting the experiment, the regions
+        # with a ready set in the warm pool are checked only if their claim fails
+        claimable_regions = [region for region in missing_regions
+                             if self.use_warm_pool()
+                             and self.warm_pool.count_ready(region=region,
+                                                            machine_type=self.machine_type_mapping[region],
+                                                            availability_zone=self.az_mapping[region])]
+        new_regions = [region for region in missing_regions if region not in claimable_regions]
+        if new_regions:
+            self.check_capacity(instances_needed={region: self.instances_per_az for region in new_regions})
+        # the cidr blocks are allocated before starting, then every region is provisioned independently
+        experiment = self.start_experiment(cidr_block=cidr_block, subnet_pools=self.get_subnet_pools(cidr_block))
+        experiment_id, cidr_block = experiment["experiment_id"], experiment["cidr_block"]
+        subnet_pools = experiment["subnet_pools"]
+        self.cloud_utils.set_api_phase("vpc_creation")
         vpcs_data = {region: dict() for region in self.list_of_regions}
         vpcs_data["cidr_block"] = cidr_block
         vpcs_data["experiment_id"] = experiment_id
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing_regions)))) as executor:
+            futures = [executor.submit(self.cloud_utils.bind_api_phase(self.claim_or_create_region_vpc), region=region,
+                                       experiment_id=experiment_id, subnet_pool=subnet_pools[region],
+                                       preflight=region in claimable_regions)
+                       for region in missing_regions]
+        for future in futures:
+            future.result()
         for region in self.list_of_regions:
-            subnet_pool = str(next(subnetwork_pool_generator))
-            vpc_id = self.cloud_utils.create_vpc(vpc_name=experiment_id, region=region, cidr_block=subnet_pool)
-            self.cloud_utils.modify_EnableDnsSupport(vpc_id=vpc_id, region=region, value=True)
-            self.cloud_utils.modify_EnableDnsHostnames(vpc_id=vpc_id, region=region, value=True)
-            internet_gateway_id = self.cloud_utils.create_internet_gateway(region=region)
-            self.cloud_utils.attach_internet_gateway_to_vpc(vpc_id=vpc_id, region=region,
-                                                            internet_gateway_id=internet_gateway_id)
-
-            public_route_table_id = self.cloud_utils.create_route_table(vpc_id=vpc_id, region=region,
-                                                                        table_name=experiment_id)
-
-            security_group_id = self.cloud_utils.create_security_group(vpc_id=vpc_id, region=region,
-                                                                       security_group_name=experiment_id,
-                                                                       description=experiment_id)
-
-            self.cloud_utils.authorize_security_group_traffic(region=region, security_group_id=security_group_id,
-                                                              ip_permissions=IP_PERMISSION, directions=["ingress"])
-
-            self.cloud_utils.add_route(region=region, route_table_id=public_route_table_id,
-                                       gateway_id=internet_gateway_id, destination_cidr_block='0.0.0.0/0')
-            az = self.az_mapping[region]
-            public_subnet_id = self.cloud_utils.create_subnet(vpc_id=vpc_id, region=region, az=az,
-                                                              subnet_name="Public Subnet",
-                                                              cidr_block=subnet_pool,
-                                                              route_table_id=public_route_table_id)
-            self.cloud_utils.modify_MapPublicIpOnLaunch(subnet_id=public_subnet_id, region=region, value=True)
-            vpcs_data[region] = [{"vpc_id": vpc_id, "internet_gateway_id": internet_gateway_id,
-                                  "public_route_table_id": public_route_table_id,
-                                  "security_group_id": security_group_id,
-                                  "availability_zone": [az],
-                                  "public_subnet": [public_subnet_id]}]
+            vpcs_data[region] = [dict(self.get_checkpoint("vpc", region))]
 
+        self.vpcs_data = vpcs_data
         if self.network_optimized:
             self.enable_network_optimized()
-
-        self.vpcs_data = vpcs_data
+        self.api_calls["vpcs"] = self.count_api_calls() - api_calls_start
 
         return vpcs_data
 
+    def enable_network_optimized(self):
+        """
+        Create a cluster placement group in every availability zone of the experiment, the probes of the same
+        availability zone are launched in it, on close hosts of the same network
+        :return: list of the placement groups names
+        """
+        experiment_id = self.vpcs_data["experiment_id"]
+        arguments = [{"region": region, "name": self.get_placement_group_name(experiment_id, az),
+                      "group_name": experiment_id}
+                     for region in self.list_of_regions for az in self.vpcs_data[region][0]["availability_zone"]]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(arguments)))) as executor:
+            create_placement_group = self.cloud_utils.bind_api_phase(self.cloud_utils.create_placement_group)
+            futures = [executor.submit(create_placement_group, **kwargs) for kwargs in arguments]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def get_placement_group_name(experiment_id, az):
+        return "{}-{}".format(experiment_id, az)
+
+    def get_subnet_pools(self, cidr_block):
+        """
+        :return: dict {region: cidr block of the vpc}. With a warm pool of the same cidr block, the cidr block of
+                 every region is the one of its warm pool sets.
+        """
+        if self.warm_pool is not None and self.warm_pool.cidr_block == cidr_block:
+            return {region: self.warm_pool.get_cidr_block(region) for region in self.list_of_regions}
+        subnetwork_pool_generator = ipaddress.ip_network(cidr_block).subnets(new_prefix=24)
+        return {region: str(next(subnetwork_pool_generator)) for region in self.list_of_regions}
+
+    def use_warm_pool(self):
+        # the warm pool sets are not in placement groups
+        return self.warm_pool is not None and not self.network_optimized
+
+    def claim_or_create_region_vpc(self, region, experiment_id, subnet_pool, preflight=False):
+        """
+        Claim a set of the warm pool for the region, with its running instances, or create the vpc of the region
+        :param preflight: check the quotas of the region before creating its vpc, for the regions skipped by the
+                          preflight because they had a ready set, that can be claimed by another experiment
+        :return: dict with the ids of the resources of the vpc
+        """
+        if self.use_warm_pool() and self.warm_pool.get_cidr_block(region) == subnet_pool:
+            claimed = self.warm_pool.claim(region=region, machine_type=self.machine_type_mapping[region],
+                                           availability_zone=self.az_mapping[region], experiment_id=experiment_id)
+            if claimed is not None:
+                self.save_checkpoint("vpc", region, claimed["vpc"])
+                self.save_checkpoint("instances", region, claimed["instances"])
+                return claimed["vpc"]
+        if preflight:
+            self.cloud_utils.set_api_phase("preflight")
+            self.check_capacity(instances_needed={region: self.instances_per_az})
+            self.cloud_utils.set_api_phase("vpc_creation")
+        return self.create_region_vpc(region=region, experiment_id=experiment_id, subnet_pool=subnet_pool)
+
+    def create_region_vpc(self, region, experiment_id, subnet_pool):
+        """
+        Create the vpc of a region with its internet gateway, route table, security group and public subnet
+        :param region: region
+        :param experiment_id: experiment id, used as name of the resources
+        :param subnet_pool: cidr block of the vpc and of its subnet
+        :return: dict with the ids of the resources
+        """
+        vpc_id = self.cloud_utils.create_vpc(vpc_name=experiment_id, region=region, cidr_block=subnet_pool)
+        self.cloud_utils.modify_EnableDnsSupport(vpc_id=vpc_id, region=region, value=True)
+        self.cloud_utils.modify_EnableDnsHostnames(vpc_id=vpc_id, region=region, value=True)
+        internet_gateway_id = self.cloud_utils.create_internet_gateway(region=region, gateway_name=experiment_id)
+        self.cloud_utils.attach_internet_gateway_to_vpc(vpc_id=vpc_id, region=region,
+                                                        internet_gateway_id=internet_gateway_id)
+
+        public_route_table_id = self.cloud_utils.create_route_table(vpc_id=vpc_id, region=region,
+                                                                    table_name=experiment_id)
+
+        security_group_id = self.cloud_utils.create_security_group(vpc_id=vpc_id, region=region,
+                                                                   security_group_name=experiment_id,
+                                                                   description=experiment_id)
+
+        self.cloud_utils.authorize_security_group_traffic(region=region, security_group_id=security_group_id,
+                                                          ip_permissions=IP_PERMISSION, directions=["ingress"])
+
+        self.cloud_utils.add_route(region=region, route_table_id=public_route_table_id,
+                                   gateway_id=internet_gateway_id, destination_cidr_block='0.0.0.0/0')
+        az = self.az_mapping[region]
+        public_subnet_id = self.cloud_utils.create_subnet(vpc_id=vpc_id, region=region, az=az,
+                                                          subnet_name="Public Subnet",
+                                                          cidr_block=subnet_pool,
+                                                          route_table_id=public_route_table_id,
+                                                          map_public_ip_on_launch=True)
+        vpc_data = {"vpc_id": vpc_id, "vpc_cidr_block": subnet_pool, "internet_gateway_id": internet_gateway_id,
+                    "public_route_table_id": public_route_table_id,
+                    "security_group_id": security_group_id,
+                    "availability_zone": [az],
+                    "public_subnet": [public_subnet_id]}
+        self.save_checkpoint("vpc", region, vpc_data)
+        return vpc_data
+
     def create_peering_connection(self):
+        """
+        Connect the vpcs privately, with the topology of the experiment
+        :return: dict {(requester, accepter): peering id}
+        """
+        checkpoint = self.get_checkpoint("peering")
+        if checkpoint is not None:
+            self.peering_ids = {(requester, accepter): peering_id
+                                for requester, accepter, peering_id in checkpoint["peering_ids"]}
+            self.transit_gateways = checkpoint["transit_gateways"]
+            self.routes = checkpoint["routes"]
+            return self.peering_ids
+        if self.topology == "transit_gateway":
+            peering_ids = self.create_transit_gateway_topology()
+        else:
+            peering_ids = self.create_peering_mesh()
+        self.save_checkpoint("peering", data={"peering_ids": [[requester, accepter, peering_id] for
+                                                              (requester, accepter), peering_id in peering_ids.items()],
+                                              "transit_gateways": self.transit_gateways, "routes": self.routes})
+        return peering_ids
+
+    def add_route_record(self, region, route_table_id, destination_cidr_block, target_id, kind):
+        """
+        Keep track of a route of the private network, so it can be stored and removed at teardown
+        :param kind: "vpc" for a vpc route table, "transit_gateway" for a transit gateway route table
+        """
+        self.routes.append({"region": region, "route_table_id": route_table_id,
+                            "destination_cidr_block": destination_cidr_block, "target_id": target_id, "kind": kind})
+
+    def create_peering_mesh(self):
+        """
+        Peer all the vpcs in a full mesh: all the peerings are requested concurrently, then they are accepted
+        in bulk by every accepter region, and finally every route table is programmed once with all the
+        destinations
+        :return: dict {(requester, accepter): VpcPeeringConnectionId}
+        """
         vpcs_data = self.vpcs_data
         list_of_regions = self.list_of_regions
         print("* Peering the connections, we will use private Ips for the experiment")
-        for requester, acceptor in combinations(list_of_regions, 2):
-            vpc_id_req = vpcs_data[requester][0]['vpc_id']
-            vpc_id_acc = vpcs_data[acceptor][0]['vpc_id']
-            self.cloud_utils.create_vpc_peering(region=requester, vpc_id=vpc_id_req,
-                                                peer_region=acceptor, peer_vpc_id=vpc_id_acc)
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("peering")
+        pairs = list(combinations(list_of_regions, 2))
+        max_workers = max(1, min(self.max_workers, len(pairs)))
+        # the api calls of the workers are recorded in the phase of this thread
+        bind = self.cloud_utils.bind_api_phase
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {(requester, accepter): executor.submit(bind(self.cloud_utils.request_vpc_peering),
+                                                              region=requester,
+                                                              vpc_id=vpcs_data[requester][0]["vpc_id"],
+                                                              peer_region=accepter,
+                                                              peer_vpc_id=vpcs_data[accepter][0]["vpc_id"])
+                       for requester, accepter in pairs}
+            peering_ids = {pair: future.result() for pair, future in futures.items()}
 
-    def create_instances(self, key_pair_id="id_rsa"):
-        # TODO check that key_pair exists in all the regions
-        for region in self.list_of_regions:
-            for instance_dict in self.vpcs_data[region]:
-                print(self.vpcs_data)
-                public_subnet_id = instance_dict["public_subnet"][0]
-                image_ami = self.cloud_utils.get_image_AMI_from_region(region=region, image_name=IMAGE_NAME)
-                regional_instances_ids = self.cloud_utils.run_instances(region=region, subnet_id=public_subnet_id,
-                                                                        instance_type=self.machine_type_mapping[region],
-                                                                        key_name=key_pair_id, image_id=image_ami,
-                                                                        number_of_instances=1)
-                instance_dict["instance_id"] = regional_instances_ids[0]
+            accepted = defaultdict(list)
+            for (requester, accepter), peering_id in peering_ids.items():
+                accepted[accepter].append(peering_id)
+            futures = [executor.submit(bind(self.cloud_utils.accept_vpc_peerings), region=accepter, peering_ids=ids)
+                       for accepter, ids in accepted.items()]
+            for future in futures:
+                future.result()
+
+            routes = {region: dict() for region in list_of_regions}
+            for (requester, accepter), peering_id in peering_ids.items():
+                routes[requester][vpcs_data[accepter][0]["vpc_cidr_block"]] = peering_id
+                routes[accepter][vpcs_data[requester][0]["vpc_cidr_block"]] = peering_id
+            futures = [executor.submit(bind(self.cloud_utils.add_peer_routes), region=region,
+                                       route_table_id=vpcs_data[region][0]["public_route_table_id"],
+                                       routes=routes[region])
+                       for region in list_of_regions if routes[region]]
+            for future in futures:
+                future.result()
+
+        for region in list_of_regions:
+            for destination_cidr_block, peering_id in routes[region].items():
+                self.add_route_record(region=region, route_table_id=vpcs_data[region][0]["public_route_table_id"],
+                                      destination_cidr_block=destination_cidr_block, target_id=peering_id,
+                                      kind="vpc")
+        self.peering_ids = peering_ids
+        self.api_calls["peering"] = self.count_api_calls() - api_calls_start
+        return peering_ids
 
+    def create_transit_gateway_topology(self):
+        """
+        Connect the vpcs with a hub and spoke of transit gateways: every region has a transit gateway attached
+        to its vpc, the transit gateways of the other regions are peered with the one of the first region (the
+        hub). The spokes route the cidr block of the experiment to the hub, the hub routes the cidr block of
+        every vpc to its spoke, and every vpc has one summary route to its transit gateway.
+        It uses O(n) attachments and routes, instead of the O(n^2) of the mesh.
+        :return: dict {(spoke, hub): TransitGatewayAttachmentId}
+        """
+        vpcs_data = self.vpcs_data
+        list_of_regions = self.list_of_regions
+        experiment_id = vpcs_data["experiment_id"]
+        cidr_block = vpcs_data["cidr_block"]
+        print("* Connecting the vpcs with transit gateways, we will use private Ips for the experiment")
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("peering")
+        hub, spokes = list_of_regions[0], list_of_regions[1:]
+        bind = self.cloud_utils.bind_api_phase
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(list_of_regions))) as executor:
+            # the transit gateways of a resumed experiment are reused
+            futures = {region: executor.submit(bind(self.create_region_transit_gateway), region=region,
+                                               experiment_id=experiment_id, cidr_block=cidr_block)
+                       for region in list_of_regions if self.get_checkpoint("transit_gateway", region) is None}
+            for future in futures.values():
+                future.result()
+            transit_gateways = {region: dict(self.get_checkpoint("transit_gateway", region))
+                                for region in list_of_regions}
+            self.transit_gateways = transit_gateways
+            for region in list_of_regions:
+                self.add_route_record(region=region, route_table_id=vpcs_data[region][0]["public_route_table_id"],
+                                      destination_cidr_block=cidr_block,
+                                      target_id=transit_gateways[region]["transit_gateway_id"], kind="vpc")
+
+            futures = {spoke: executor.submit(bind(self.cloud_utils.request_transit_gateway_peering), region=spoke,
+                                              transit_gateway_id=transit_gateways[spoke]["transit_gateway_id"],
+                                              peer_region=hub,
+                                              peer_transit_gateway_id=transit_gateways[hub]["transit_gateway_id"],
+                                              name=experiment_id)
+                       for spoke in spokes}
+            for spoke in spokes:
+                transit_gateways[spoke]["peering_attachment_id"] = futures[spoke].result()
+            peering_ids = {(spoke, hub): transit_gateways[spoke]["peering_attachment_id"] for spoke in spokes}
+            if spokes:
+                self.cloud_utils.accept_transit_gateway_peerings(region=hub,
+                                                                 attachment_ids=list(peering_ids.values()))
+
+            # the peering attachments do not propagate the routes, so they are static
+            routes = {region: dict() for region in list_of_regions}
+            for spoke in spokes:
+                attachment_id = transit_gateways[spoke]["peering_attachment_id"]
+                routes[spoke][cidr_block] = attachment_id
+                routes[hub][vpcs_data[spoke][0]["vpc_cidr_block"]] = attachment_id
+            futures = [executor.submit(bind(self.cloud_utils.add_transit_gateway_routes), region=region,
+                                       route_table_id=transit_gateways[region]["route_table_id"],
+                                       routes=routes[region])
+                       for region in list_of_regions if routes[region]]
+            for future in futures:
+                future.result()
+
+        for region in list_of_regions:
+            for destination_cidr_block, attachment_id in routes[region].items():
+                self.add_route_record(region=region, route_table_id=transit_gateways[region]["route_table_id"],
+                                      destination_cidr_block=destination_cidr_block, target_id=attachment_id,
+                                      kind="transit_gateway")
+        self.peering_ids = peering_ids
+        self.api_calls["peering"] = self.count_api_calls() - api_calls_start
+        return peering_ids
+
+    def create_region_transit_gateway(self, region, experiment_id, cidr_block):
+        """
+        Create the transit gateway of the region, attach it to the vpc and route the cidr block of the
+        experiment to it
+        :param region: region
+        :param experiment_id: experiment id, used as name of the resources
+        :param cidr_block: cidr block of the experiment
+        :return: dict with transit_gateway_id, route_table_id, vpc_attachment_id and peering_attachment_id
+        """
+        vpc_data = self.vpcs_data[region][0]
+        transit_gateway = self.cloud_utils.create_transit_gateway(region=region, name=experiment_id)
+        # one subnet for every availability zone
+        subnet_ids = sorted(set(self.get_subnet_id(instance_dict) for instance_dict in self.vpcs_data[region]))
+        vpc_attachment_id = self.cloud_utils.attach_vpc_to_transit_gateway(
+            region=region, transit_gateway_id=transit_gateway["transit_gateway_id"], vpc_id=vpc_data["vpc_id"],
+            subnet_ids=subnet_ids, name=experiment_id)
+        self.cloud_utils.add_vpc_route_to_transit_gateway(region=region,
+                                                          route_table_id=vpc_data["public_route_table_id"],
+                                                          transit_gateway_id=transit_gateway["transit_gateway_id"],
+                                                          destination_cidr_block=cidr_block)
+        transit_gateway = dict(transit_gateway, vpc_attachment_id=vpc_attachment_id, peering_attachment_id=None)
+        self.save_checkpoint("transit_gateway", region, transit_gateway)
+        return transit_gateway
+
+    def create_instances(self, key_pair_id="id_rsa", ready_stage="running", on_instance_ready=None):
+        """
+        Launch the instances of all the regions concurrently, every instance is inspected as soon as it is ready,
+        without waiting for the slower ones
+        :param key_pair_id: key pair used by the instances
+        :param ready_stage: stage of instancePipeline.STAGES where an instance is ready
+        :param on_instance_ready: optional callable (region, instance_dict), called as soon as an instance is ready
+        :return: vpcs_data
+        """
+        # TODO check that key_pair exists in all the regions
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("instance_launch")
+        missing_regions = []
         for region in self.list_of_regions:
-            for instance_dict in self.vpcs_data[region]:
-                instance_id = instance_dict["instance_id"]
-                security_group = instance_dict["security_group_id"]
-                self.cloud_utils.wait_instances_running(region=region, instances_id_list=[instance_id])
-                self.cloud_utils.modify_security_group(region=region, instance_ids=[instance_id],
-                                                       groups=[security_group])
-                instance_dict["public_address"] = self.cloud_utils.get_instance_public_ip(
-                    region=region,
-                    instance_id=instance_id)
-                instance_dict["private_address"] = self.cloud_utils.get_instance_private_ip(
-                    region=region,
-                    instance_id=instance_id)
-                # TODO: Correct, now self.az_mapping[region] is a list
-                instance_dict["availability_zone"] = self.az_mapping[region]
-                instance_dict["machine_type"] = self.machine_type_mapping[region]
-                instance_dict["key_pair_id"] = key_pair_id
+            instances = self.get_checkpoint("instances", region)
+            if instances is None:
+                missing_regions.append(region)
+            else:
+                self.vpcs_data[region] = [dict(instance_dict) for instance_dict in instances]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing_regions)))) as executor:
+            futures = [executor.submit(self.cloud_utils.bind_api_phase(self.create_region_instances), region=region,
+                                       key_pair_id=key_pair_id, ready_stage=ready_stage,
+                                       on_instance_ready=on_instance_ready)
+                       for region in missing_regions]
+        for future in futures:
+            future.result()
 
+        self.api_calls["instances"] = self.count_api_calls() - api_calls_start
         return self.vpcs_data
 
+    def create_region_instances(self, region, key_pair_id, ready_stage="running", on_instance_ready=None):
+        self.launch_region_instances(region=region, key_pair_id=key_pair_id)
+        self.inspect_region_instances(region=region, key_pair_id=key_pair_id, ready_stage=ready_stage,
+                                      on_instance_ready=on_instance_ready)
+        self.save_checkpoint("instances", region, self.vpcs_data[region])
+
+    def get_subnet_id(self, instance_dict):
+        return instance_dict["public_subnet"][0]
+
+    def get_availability_zone(self, instance_dict):
+        return instance_dict["availability_zone"][0]
+
+    def launch_region_instances(self, region, key_pair_id):
+        """
+        Launch instances_per_az instances in every subnet of the region, with a single request per subnet.
+        Every entry of vpcs_data[region] is replaced by one entry for every instance launched in its subnet.
+        :param region: region
+        :param key_pair_id: key pair used by the instances
+        :return: list of the instances ids
+        """
+        experiment_id = self.vpcs_data["experiment_id"]
+        baked = region in self.images
+        if baked:
+            image_ami = self.images[region]
+        else:
+            image_ami = self.cloud_utils.get_image_AMI_from_region(region=region, image_name=IMAGE_NAME)
+        instances_data = []
+        for instance_dict in self.vpcs_data[region]:
+            kwargs = dict()
+            if self.network_optimized:
+                kwargs["Placement"] = {"GroupName": self.get_placement_group_name(
+                    experiment_id, self.get_availability_zone(instance_dict))}
+            regional_instances_ids = self.cloud_utils.run_instances(region=region,
+                                                                    subnet_id=self.get_subnet_id(instance_dict),
+                                                                    instance_type=self.machine_type_mapping[region],
+                                                                    key_name=key_pair_id, image_id=image_ami,
+                                                                    number_of_instances=self.instances_per_az,
+                                                                    security_group_ids=[
+                                                                        instance_dict["security_group_id"]],
+                                                                    instance_name=experiment_id, **kwargs)
+            for instance_id in regional_instances_ids:
+                new_data = dict(instance_dict)
+                new_data["instance_id"] = instance_id
+                # the tools of a baked image are already installed
+                new_data["baked"] = baked
+                instances_data.append(new_data)
+        self.vpcs_data[region] = instances_data
+        return [instance_dict["instance_id"] for instance_dict in instances_data]
+
+    def inspect_region_instances(self, region, key_pair_id, ready_stage="running", on_instance_ready=None):
+        """
+        Follow all the instances of the region with an InstancePipeline, every instance is filled with its
+        addresses as soon as it reaches the ready stage
+        :param region: region
+        :param key_pair_id: key pair used by the instances
+        :param ready_stage: stage of instancePipeline.STAGES where an instance is ready
+        :param on_instance_ready: optional callable (region, instance_dict), called as soon as an instance is ready
+        :return: None
+        """
+        instances_dict = {instance_dict["instance_id"]: instance_dict for instance_dict in self.vpcs_data[region]}
+
+        def on_ready(instance_id, instance_data):
+            instance_dict = instances_dict[instance_id]
+            instance_dict["public_address"] = instance_data["public_address"]
+            instance_dict["private_address"] = instance_data["private_address"]
+            instance_dict["availability_zone"] = instance_data["availability_zone"]
+            instance_dict["machine_type"] = self.machine_type_mapping[region]
+            instance_dict["key_pair_id"] = key_pair_id
+            if on_instance_ready is not None:
+                on_instance_ready(region, instance_dict)
+
+        pipeline = InstancePipeline(cloud_utils=self.cloud_utils, region=region,
+                                    instances_id_list=list(instances_dict), ready_stage=ready_stage,
+                                    on_ready=on_ready)
+        pipeline.run()
+        self.instance_timings.update(pipeline.timings)
+
     def purge(self):
-        proc = []
-        for region in self.list_of_regions:
-            # enable parallel removal
-            vpc_id = self.vpcs_data[region]["vpc_id"]
-            p = Process(target=self.cloud_utils.remove_vpc, args=(region, vpc_id))
-            p.start()
-            proc.append(p)
+        # every entry of vpcs_data[region] has the vpc of the region
+        dict_region_vpc = {region: self.vpcs_data[region][0]["vpc_id"] for region in self.list_of_regions}
+        self.purge_experiment(dict_region_vpc=dict_region_vpc, cloud_utils=self.cloud_utils,
+                              max_workers=self.max_workers, transit_gateways=self.transit_gateways,
+                              routes=self.routes,
+                              placement_groups_name=self.experiment_id if self.network_optimized else None)
 
-        for p in proc:
-            p.join()
+    @staticmethod
+    def remove_region(cloud_utils, region, vpc_id, placement_groups_name=None):
+        """
+        Remove the vpc of the region, then the placement groups of its instances
+        """
+        cloud_utils.remove_vpc(region, vpc_id)
+        if placement_groups_name is not None:
+            cloud_utils.remove_placement_groups(region=region, group_name=placement_groups_name)
 
     @staticmethod
-    def purge_experiment(dict_region_vpc, cloud_utils=AWSUtils):
-        proc = []
-        for region in dict_region_vpc.keys():
-            # enable parallel removal
-            vpc_id = dict_region_vpc[region]
-            p = Process(target=cloud_utils.remove_vpc, args=(region, vpc_id))
-            p.start()
-            proc.append(p)
-
-        for p in proc:
-            p.join()
+    def purge_transit_gateways(transit_gateways, routes=(), cloud_utils=AWSUtils, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Remove the transit gateway topology: the vpc routes to the transit gateways, the peering attachments,
+        the vpc attachments and finally the transit gateways. Every step runs concurrently over the regions.
+        :param transit_gateways: dict {region: dict with transit_gateway_id, vpc_attachment_id and
+                                 peering_attachment_id}
+        :param routes: list of the routes of the experiment, the transit gateway routes are removed with their
+                       transit gateway
+        :param cloud_utils: cloud utils class
+        :param max_workers: maximum number of concurrent calls
+        :return: None
+        """
+        transit_gateway_ids = set(data["transit_gateway_id"] for data in transit_gateways.values())
+
+        def run_all(function, arguments):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(arguments)))) as executor:
+                futures = [executor.submit(cloud_utils.bind_api_phase(function), **kwargs) for kwargs in arguments]
+            for future in futures:
+                future.result()
+
+        run_all(cloud_utils.delete_route, [{"region": route["region"], "route_table_id": route["route_table_id"],
+                                            "destination_cidr_block": route["destination_cidr_block"]}
+                                           for route in routes
+                                           if route["kind"] == "vpc" and route["target_id"] in transit_gateway_ids])
+        run_all(cloud_utils.delete_transit_gateway_peering,
+                [{"region": region, "attachment_id": data["peering_attachment_id"]}
+                 for region, data in transit_gateways.items() if data["peering_attachment_id"]])
+        run_all(cloud_utils.delete_transit_gateway_vpc_attachment,
+                [{"region": region, "attachment_id": data["vpc_attachment_id"]}
+                 for region, data in transit_gateways.items() if data["vpc_attachment_id"]])
+        run_all(cloud_utils.delete_transit_gateway,
+                [{"region": region, "transit_gateway_id": data["transit_gateway_id"]}
+                 for region, data in transit_gateways.items()])
+
+    @staticmethod
+    def purge_experiment(dict_region_vpc, cloud_utils=AWSUtils, max_workers=DEFAULT_MAX_WORKERS,
+                         transit_gateways=None, routes=(), placement_groups_name=None):
+        cloud_utils.set_api_phase("teardown")
+        # the vpc attachments of the transit gateways keep network interfaces in the subnets
+        if transit_gateways:
+            MultiregionalTrace.purge_transit_gateways(transit_gateways=transit_gateways, routes=routes,
+                                                      cloud_utils=cloud_utils, max_workers=max_workers)
+        # the regions are removed in threads, so the api calls are recorded in this process
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(dict_region_vpc)))) as executor:
+            futures = [executor.submit(cloud_utils.bind_api_phase(MultiregionalTrace.remove_region),
+                                       cloud_utils=cloud_utils, region=region, vpc_id=vpc_id,
+                                       placement_groups_name=placement_groups_name)
+                       for region, vpc_id in dict_region_vpc.items()]
+        for future in futures:
+            future.result()
+
+    @staticmethod
+    def purge_experiments(experiments, max_workers=DEFAULT_MAX_WORKERS, on_region_removed=None):
+        """
+        Remove many experiments with a single pool of workers shared by all their regions, so the workers are
+        never idle while there is a vpc left to remove. An error in a region does not stop the others.
+        :param experiments: dict {experiment_id: dict with cloud_utils, dict_region_vpc, and optional
+                            transit_gateways, routes and placement_groups_name}
+        :param max_workers: maximum number of vpcs removed at the same time
+        :param on_region_removed: optional callable (experiment_id, region, vpc_id, error), called in this thread
+                                  as soon as the removal of a region ends, error is None if the vpc is removed
+        :return: dict {experiment_id: list of the regions not removed}
+        """
+        failed = {experiment_id: [] for experiment_id in experiments}
+
+        def notify(experiment_id, region, vpc_id, error):
+            if error is not None:
+                failed[experiment_id].append(region)
+            if on_region_removed is not None:
+                on_region_removed(experiment_id, region, vpc_id, error)
+
+        for experiment in experiments.values():
+            experiment["cloud_utils"].set_api_phase("teardown")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # the vpc attachments of the transit gateways keep network interfaces in the subnets
+            purge_transit_gateways = MultiregionalTrace.purge_transit_gateways
+            futures = {executor.submit(experiment["cloud_utils"].bind_api_phase(purge_transit_gateways),
+                                       transit_gateways=experiment["transit_gateways"],
+                                       routes=experiment.get("routes", ()), cloud_utils=experiment["cloud_utils"],
+                                       max_workers=len(experiment["transit_gateways"])): experiment_id
+                       for experiment_id, experiment in experiments.items() if experiment.get("transit_gateways")}
+            for future in as_completed(futures):
+                experiment_id = futures[future]
+                if future.exception() is not None:
+                    for region, vpc_id in experiments[experiment_id]["dict_region_vpc"].items():
+                        notify(experiment_id, region, vpc_id, future.exception())
+
+            futures = {executor.submit(experiment["cloud_utils"].bind_api_phase(MultiregionalTrace.remove_region),
+                                       cloud_utils=experiment["cloud_utils"], region=region, vpc_id=vpc_id,
+                                       placement_groups_name=experiment.get("placement_groups_name", None)):
+                       (experiment_id, region, vpc_id)
+                       for experiment_id, experiment in experiments.items() if not failed[experiment_id]
+                       for region, vpc_id in experiment["dict_region_vpc"].items()}
+            for future in as_completed(futures):
+                notify(*futures[future], future.exception())
+        return failed
 
 
 if __name__ == '__main__':
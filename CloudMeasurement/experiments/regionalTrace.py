@@ -1,5 +1,5 @@
 from CloudMeasurement.experiments.awsUtils import AWSUtils
-from .multiregionalTrace import MultiregionalTrace
+from .multiregionalTrace import MultiregionalTrace, DEFAULT_MAX_WORKERS
 
 import ipaddress
 
@@ -11,18 +11,24 @@ REMOTE_USER = "ubuntu"
 
 class RegionalTrace(MultiregionalTrace):
     def __init__(self, list_of_regions=("eu-central-1",), az_mapping=None, machine_type_mapping=None,
-                 cloud_util=AWSUtils, network_optimized=False):
+                 cloud_util=AWSUtils, network_optimized=False, instances_per_az=1, max_workers=DEFAULT_MAX_WORKERS,
+                 topology="mesh"):
         """
         A regional Trace is a particular case fo the Multiregional,
         :param region: region
         :param list_of_az: dict
         :param machine_type_mapping: dict
+        :param instances_per_az: number of probes launched in every availability zone
+        :param max_workers: maximum number of regions provisioned at the same time
+        :param topology: topology of the private network, one of TOPOLOGIES
         """
         if len(list_of_regions) > 1:
             raise ValueError("for Regional Trace you have to pass just one Region")
-        super(RegionalTrace, self).__init__(list_of_regions=list_of_regions, az_mapping=az_mapping,
+        # the az_mapping of a regional trace has a list of azs, it is validated below
+        super(RegionalTrace, self).__init__(list_of_regions=list_of_regions, az_mapping=None,
                                             machine_type_mapping=machine_type_mapping, cloud_util=cloud_util,
-                                            network_optimized=network_optimized)
+                                            network_optimized=network_optimized, instances_per_az=instances_per_az,
+                                            max_workers=max_workers, topology=topology)
 
         # Overrides the previus az_mapping with the new function
         self.az_mapping = self.__get_az_mapping(az_mapping=az_mapping)
@@ -45,6 +51,7 @@ class RegionalTrace(MultiregionalTrace):
             for val in map_value:
                 if val not in az_list:
                     raise ValueError("Availability Zone '{}' is not valid for region {}".format(map_value, region))
+            mapping[region] = list(map_value)
         return mapping
 
     def create_experiment_environment(self):
@@ -53,21 +60,45 @@ class RegionalTrace(MultiregionalTrace):
     def create_regional_vpc(self, cidr_block="10.0.0.0/16"):
         if self.vpcs_data is not None:
             raise PermissionError("the experiment vpc is already created: {}".format(self.vpcs_data))
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("preflight")
         region = self.list_of_regions[0]
-        # check if the resource are available in all the regions before starting the experiment
-        self.cloud_utils.check_if_it_is_possible_to_create_a_new_vpc_in_the_region(region=region, vpc_needed=1)
-        self.cloud_utils.check_if_maximum_it_possible_to_run_instances_in_the_region(region=region,
-                                                                                     instances_needed=1)
-        subnetwork_pool_generator = ipaddress.ip_network(cidr_block).subnets(new_prefix=24)
-        experiment_id = self.cloud_utils.generate_experiment_id()
+        # the vpc of a resumed experiment is not created again
+        if self.get_checkpoint("vpc", region) is None:
+            # check if the resource are available in the region before starting the experiment
+            self.check_capacity(instances_needed={region: self.instances_per_az * len(self.az_mapping[region])})
+        experiment = self.start_experiment(cidr_block=cidr_block)
+        experiment_id, cidr_block = experiment["experiment_id"], experiment["cidr_block"]
+        self.cloud_utils.set_api_phase("vpc_creation")
         vpcs_data = {region: dict() for region in self.list_of_regions}
         vpcs_data["cidr_block"] = cidr_block
         vpcs_data["experiment_id"] = experiment_id
 
-        vpc_id = self.cloud_utils.create_vpc(vpc_name=experiment_id, region=region, cidr_block=cidr_block)
+        if self.get_checkpoint("vpc", region) is None:
+            self.create_region_vpc(region=region, experiment_id=experiment_id, subnet_pool=cidr_block)
+        vpcs_data[region] = [dict(self.get_checkpoint("vpc", region))]
+
+        self.vpcs_data = vpcs_data
+        if self.network_optimized:
+            self.enable_network_optimized()
+        self.api_calls["vpcs"] = self.count_api_calls() - api_calls_start
+
+        return vpcs_data
+
+    def create_region_vpc(self, region, experiment_id, subnet_pool):
+        """
+        Create the vpc of the region with its internet gateway, route table, security group and a public subnet
+        in every availability zone
+        :param region: region
+        :param experiment_id: experiment id, used as name of the resources
+        :param subnet_pool: cidr block of the vpc, split in a /24 for every subnet
+        :return: dict with the ids of the resources
+        """
+        subnetwork_pool_generator = ipaddress.ip_network(subnet_pool).subnets(new_prefix=24)
+        vpc_id = self.cloud_utils.create_vpc(vpc_name=experiment_id, region=region, cidr_block=subnet_pool)
         self.cloud_utils.modify_EnableDnsSupport(vpc_id=vpc_id, region=region, value=True)
         self.cloud_utils.modify_EnableDnsHostnames(vpc_id=vpc_id, region=region, value=True)
-        internet_gateway_id = self.cloud_utils.create_internet_gateway(region=region)
+        internet_gateway_id = self.cloud_utils.create_internet_gateway(region=region, gateway_name=experiment_id)
         self.cloud_utils.attach_internet_gateway_to_vpc(vpc_id=vpc_id, region=region,
                                                         internet_gateway_id=internet_gateway_id)
 
@@ -87,34 +118,36 @@ class RegionalTrace(MultiregionalTrace):
         public_subnet_ids = []
         print("MAPPING", self.az_mapping)
         for az in self.az_mapping[region]:
-            subnet_pool = str(next(subnetwork_pool_generator))
+            subnet_cidr_block = str(next(subnetwork_pool_generator))
 
             public_subnet_id = self.cloud_utils.create_subnet(vpc_id=vpc_id, region=region, az=az,
                                                               subnet_name="Subnet_{}".format(az),
-                                                              cidr_block=subnet_pool,
-                                                              route_table_id=public_route_table_id)
+                                                              cidr_block=subnet_cidr_block,
+                                                              route_table_id=public_route_table_id,
+                                                              map_public_ip_on_launch=True)
             public_subnet_ids.append(public_subnet_id)
-            self.cloud_utils.modify_MapPublicIpOnLaunch(subnet_id=public_subnet_id, region=region, value=True)
 
-        vpcs_data[region] = [{"vpc_id": vpc_id, "internet_gateway_id": internet_gateway_id,
-                              "public_route_table_id": public_route_table_id,
-                              "security_group_id": security_group_id,
-                              "availability_zone": self.az_mapping[region],
-                              "public_subnet": public_subnet_ids}]
-
-        if self.network_optimized:
-            self.enable_network_optimized()
-
-        self.vpcs_data = vpcs_data
-
-        return vpcs_data
+        vpc_data = {"vpc_id": vpc_id, "vpc_cidr_block": subnet_pool, "internet_gateway_id": internet_gateway_id,
+                    "public_route_table_id": public_route_table_id,
+                    "security_group_id": security_group_id,
+                    "availability_zone": self.az_mapping[region],
+                    "public_subnet": public_subnet_ids}
+        self.save_checkpoint("vpc", region, vpc_data)
+        return vpc_data
 
     def create_peering_connection(self):
         pass
 
-    def create_instances(self, key_pair_id="id_rsa"):
+    def create_instances(self, key_pair_id="id_rsa", ready_stage="running", on_instance_ready=None):
         # TODO check that key_pair exists in all the regions
+        api_calls_start = self.count_api_calls()
+        self.cloud_utils.set_api_phase("instance_launch")
         region = self.list_of_regions[0]
+        instances = self.get_checkpoint("instances", region)
+        if instances is not None:
+            self.vpcs_data[region] = [dict(instance_dict) for instance_dict in instances]
+            self.api_calls["instances"] = self.count_api_calls() - api_calls_start
+            return self.vpcs_data
         refactored_data = []
 
         for az, subnet in zip(self.vpcs_data[region][0]["availability_zone"],
@@ -126,28 +159,16 @@ class RegionalTrace(MultiregionalTrace):
 
         self.vpcs_data[region] = refactored_data
 
-        for instance_dict in self.vpcs_data[region]:
-            public_subnet_id = instance_dict["public_subnet"]
-            image_ami = self.cloud_utils.get_image_AMI_from_region(region=region, image_name=IMAGE_NAME)
-            regional_instances_ids = self.cloud_utils.run_instances(region=region, subnet_id=public_subnet_id,
-                                                                    instance_type=self.machine_type_mapping[region],
-                                                                    key_name=key_pair_id, image_id=image_ami,
-                                                                    number_of_instances=1)
-            instance_dict["instance_id"] = regional_instances_ids[0]
-
-        for instance_dict in self.vpcs_data[region]:
-            instance_id = instance_dict["instance_id"]
-            security_group = instance_dict["security_group_id"]
-            self.cloud_utils.wait_instances_running(region=region, instances_id_list=[instance_id])
-            self.cloud_utils.modify_security_group(region=region, instance_ids=[instance_id],
-                                                   groups=[security_group])
-            instance_dict["public_address"] = self.cloud_utils.get_instance_public_ip(
-                region=region,
-                instance_id=instance_id)
-            instance_dict["private_address"] = self.cloud_utils.get_instance_private_ip(
-                region=region,
-                instance_id=instance_id)
-            instance_dict["machine_type"] = self.machine_type_mapping[region]
-            instance_dict["key_pair_id"] = key_pair_id
+        self.launch_region_instances(region=region, key_pair_id=key_pair_id)
+        self.inspect_region_instances(region=region, key_pair_id=key_pair_id, ready_stage=ready_stage,
+                                      on_instance_ready=on_instance_ready)
+        self.save_checkpoint("instances", region, self.vpcs_data[region])
 
+        self.api_calls["instances"] = self.count_api_calls() - api_calls_start
         return self.vpcs_data
+
+    def get_subnet_id(self, instance_dict):
+        return instance_dict["public_subnet"]
+
+    def get_availability_zone(self, instance_dict):
+        return instance_dict["availability_zone"]
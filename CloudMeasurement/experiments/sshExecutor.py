@@ -0,0 +1,170 @@
+from pathlib import Path
+from time import time
+import asyncio
+import shlex
+
+# maximum number of hosts driven at the same time
+DEFAULT_CONCURRENCY = 100
+# seconds allowed to a single command
+DEFAULT_COMMAND_TIMEOUT = 600
+# exit status of ssh when the host is unreachable or the authentication fails
+SSH_UNREACHABLE = 255
+# the control sockets are the same of the ansible.cfg of the inventories, the connections opened by ansible are
+# reused by the executor and vice versa
+CONTROL_PATH_DIR = Path.home() / ".ansible" / "cp"
+SSH_OPTIONS = ["-o", "ControlMaster=auto", "-o", "ControlPersist=30m",
+               "-o", "ControlPath={}".format(CONTROL_PATH_DIR / "%C"),
+               "-o", "BatchMode=yes", "-o", "ServerAliveInterval=30"]
+MODULES = ("raw", "shell", "command", "copy", "fetch", "archive")
+
+
+class SshExecutor(object):
+    def __init__(self, known_hosts_path, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_COMMAND_TIMEOUT,
+                 ssh_command="ssh"):
+        """
+        Run the simple modules used by cm (raw commands, copy, fetch and archive) on many hosts at the same time,
+        with one OpenSSH process per host driven by asyncio, instead of a whole ansible run
+        :param known_hosts_path: known hosts of the inventory, the key of a new host is added to it, a changed key
+                                 is refused
+        :param concurrency: maximum number of hosts driven at the same time
+        :param timeout: seconds allowed to a single command
+        :param ssh_command: ssh client
+        """
+        self.known_hosts_path = known_hosts_path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ssh_command = ssh_command
+        self.results = dict()
+        self.durations = dict()
+
+    @staticmethod
+    def parse_module_args(module_args):
+        """
+        :param module_args: ansible key=value arguments, ex. "src=/a dest=/b mode=666"
+        :return: dict of the arguments
+        """
+        return dict(arg.split("=", 1) for arg in shlex.split(module_args))
+
+    @staticmethod
+    def get_command(module, module_args, become=False):
+        """
+        :return: tuple (shell command run in the host, local file sent to its stdin, local file written with its
+                 stdout), the files are None when not used
+        """
+        if module not in MODULES:
+            raise ValueError("module {} is not supported by the ssh executor, use one of: {}".format(module, MODULES))
+        sudo = "sudo " if become else ""
+        if module in ("raw", "shell", "command"):
+            if become:
+                return "sudo sh -c {}".format(shlex.quote(module_args)), None, None
+            return module_args, None, None
+        args = SshExecutor.parse_module_args(module_args)
+        if module == "copy":
+            dest = shlex.quote(args["dest"])
+            command = "{}tee {} > /dev/null".format(sudo, dest)
+            if "mode" in args:
+                command += " && {}chmod {} {}".format(sudo, args["mode"], dest)
+            return command, args["src"], None
+        if module == "fetch":
+            return "{}cat {}".format(sudo, shlex.quote(args["src"])), None, args["dest"]
+        path = Path(args["path"])
+        command = "cd {} && {}python3 -m zipfile -c {} {}".format(
+            shlex.quote(str(path.parent)), sudo, shlex.quote(args["dest"]), shlex.quote(path.name))
+        return command, None, None
+
+    @staticmethod
+    def get_host_key_options(known_hosts_path):
+        """
+        :return: ssh options accepting the key of a new host and refusing a changed one
+        """
+        return ["-o", "StrictHostKeyChecking=accept-new", "-o", "UserKnownHostsFile={}".format(known_hosts_path)]
+
+    def get_args(self, host, user, command):
+        if host == "localhost":
+            return ["sh", "-c", command]
+        destination = host if user is None else "{}@{}".format(user, host)
+        return ([self.ssh_command] + SSH_OPTIONS + self.get_host_key_options(self.known_hosts_path)
+                + [destination, command])
+
+    @staticmethod
+    def get_fetch_path(dest, host, src):
+        """
+        :return: local path of a fetched file, dest/host/src as the fetch module of ansible
+        """
+        return Path(dest) / host / Path(src).relative_to("/")
+
+    async def run_host(self, host, user, module, module_args, become):
+        command, stdin_path, stdout_path = self.get_command(module, module_args, become=become)
+        stdin = open(stdin_path, "rb") if stdin_path is not None else None
+        stdout = None
+        if stdout_path is not None:
+            fetch_path = self.get_fetch_path(stdout_path, host, self.parse_module_args(module_args)["src"])
+            fetch_path.parent.mkdir(parents=True, exist_ok=True)
+            stdout = open(str(fetch_path), "wb")
+        try:
+            process = await asyncio.create_subprocess_exec(*self.get_args(host, user, command), stdin=stdin,
+                                                           stdout=stdout or asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE)
+            try:
+                out, err = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return host, SSH_UNREACHABLE, "", "timeout after {} seconds".format(self.timeout)
+            return host, process.returncode, (out or b"").decode(errors="replace"), err.decode(errors="replace")
+        finally:
+            for f in (stdin, stdout):
+                if f is not None:
+                    f.close()
+
+    async def run_all(self, hosts, module, module_args, become):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded_run(host, user):
+            async with semaphore:
+                start = time()
+                result = await self.run_host(host, user, module, module_args, become)
+                self.durations[host] = time() - start
+                return result
+
+        return await asyncio.gather(*[bounded_run(host, user) for host, user in hosts])
+
+    def run(self, hosts, module, module_args, become=False):
+        """
+        Run the module on all the hosts, in a new event loop so it can be called from any thread
+        :param hosts: list of tuples (host, user), the host localhost runs the command without ssh
+        :param module: one of MODULES
+        :param module_args: arguments of the module, as for ansible
+        :param become: run the command with sudo
+        :return: dict of the stats, with the same keys of the stats of ansible-runner
+        """
+        if not hosts:
+            return self.get_stats([])
+        CONTROL_PATH_DIR.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(self.run_all(list(hosts), module, module_args, become))
+        finally:
+            loop.close()
+        self.results = {host: (rc, out, err) for host, rc, out, err in results}
+        return self.get_stats(results)
+
+    @staticmethod
+    def get_stats(results):
+        """
+        :param results: list of tuples (host, exit status, stdout, stderr)
+        :return: dict {"ok", "changed", "failures", "dark", "skipped", "ignored", "rescued", "processed"}, every
+                 value is a dict {host: number of tasks}
+        """
+        stats = {key: dict() for key in ("ok", "changed", "failures", "dark", "skipped", "ignored", "rescued",
+                                         "processed")}
+        for host, rc, _, _ in results:
+            stats["processed"][host] = 1
+            if rc == 0:
+                stats["ok"][host] = 1
+                stats["changed"][host] = 1
+            elif rc == SSH_UNREACHABLE and host != "localhost":
+                stats["dark"][host] = 1
+            else:
+                stats["failures"][host] = 1
+        return stats
@@ -0,0 +1,69 @@
+import asyncio
+
+SSH_PORT = 22
+# seconds allowed to open the connection and to read the banner of a single host
+DEFAULT_PROBE_TIMEOUT = 3
+# maximum number of connections opened at the same time
+DEFAULT_CONCURRENCY = 64
+
+
+class SshProbe(object):
+    """
+    Check that sshd answers on many hosts at the same time, reading the ssh banner with asyncio. The probe does
+    not authenticate, so it does not need the private key and it does not leave sessions open.
+    """
+
+    @staticmethod
+    async def probe(address, port=SSH_PORT, timeout=DEFAULT_PROBE_TIMEOUT):
+        """
+        :param address: ip address of the host
+        :param port: ssh port
+        :param timeout: seconds allowed to connect and to read the banner
+        :return: True if the host answers with an ssh banner
+        """
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout=timeout)
+            banner = await asyncio.wait_for(reader.readline(), timeout=timeout)
+            return banner.startswith(b"SSH-")
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+
+    @staticmethod
+    async def probe_all(addresses, port=SSH_PORT, timeout=DEFAULT_PROBE_TIMEOUT, concurrency=DEFAULT_CONCURRENCY,
+                        on_result=None):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded_probe(address):
+            async with semaphore:
+                reachable = await SshProbe.probe(address, port=port, timeout=timeout)
+            if on_result is not None:
+                on_result(address, reachable)
+            return reachable
+
+        results = await asyncio.gather(*[bounded_probe(address) for address in addresses])
+        return dict(zip(addresses, results))
+
+    @staticmethod
+    def probe_many(addresses, port=SSH_PORT, timeout=DEFAULT_PROBE_TIMEOUT, concurrency=DEFAULT_CONCURRENCY,
+                   on_result=None):
+        """
+        Probe all the addresses concurrently, in a new event loop so it can be called from any thread
+        :param addresses: list of ip addresses
+        :param port: ssh port
+        :param timeout: seconds allowed to every probe
+        :param concurrency: maximum number of connections opened at the same time
+        :param on_result: optional callable (address, reachable), called as soon as a probe is completed
+        :return: dict {address: reachable}
+        """
+        if not addresses:
+            return dict()
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(SshProbe.probe_all(list(addresses), port=port, timeout=timeout,
+                                                              concurrency=concurrency, on_result=on_result))
+        finally:
+            loop.close()
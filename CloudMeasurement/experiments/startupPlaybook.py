@@ -0,0 +1,201 @@
+from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration, DEFAULT_BACKOFF
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from time import time
+import ansible_runner
+import yaml
+
+DEFAULT_FORKS = 50
+CRONTAB_CFG_PATH = Path("/home/ubuntu/crontab.cfg")
+TRACEROUTE_SCRIPT_PATH = Path("/home/ubuntu/traceroute.sh")
+EXPERIMENT_REMOTE_DIR = Path("/home/ubuntu/experiments/")
+EXPERIMENT_BK_REMOTE_DIR = Path("/home/ubuntu/experiments_bk/")
+# low latency settings of the network optimized probes: busy polling of the sockets, and no interrupt coalescing
+# on the default interface
+NETWORK_TUNING_CMD = ("sysctl -w net.core.busy_poll=50 net.core.busy_read=50 net.core.netdev_max_backlog=5000 && "
+                      "(ethtool -C $(ip -o -4 route show to default | awk '{print $5}') adaptive-rx off rx-usecs 0"
+                      " || true)")
+TRACEROUTE_TEMPLATE = """#!/bin/bash
+{% for ip in destinations %}
+{% set ip_name = ("ip_" ~ ip ~ "date_") | replace(".", "_") %}
+{% for src_port in range(src_start, src_end) %}
+{% for dst_port in range(dst_start, dst_end) %}
+sudo paris-traceroute -n -s {{ src_port }} -p {{ dst_port }} -U -m 60 {{ ip }} | \
+tee {{ experiment_dir }}/{{ ip_name }}$(date +"%M_%k_%d_%m_%Y" | tr -d ' ').log > \
+{{ experiment_bk_dir }}/{{ ip_name }}$(date +"%M_%k_%d_%m_%Y" | tr -d ' ')_s{{ src_port }}_p{{ dst_port }}.log
+{% endfor %}
+{% endfor %}
+{% endfor %}
+"""
+
+
+class StartupPlaybook(object):
+    def __init__(self, playbook_dir):
+        """
+        Configure all the probes of an experiment with a single playbook: every task runs on all the hosts in
+        parallel, and the traceroute script of every host is rendered from its host_vars
+        :param playbook_dir: directory of the playbook, of its host_vars and of the ansible-runner artifacts
+        """
+        if not isinstance(playbook_dir, Path):
+            raise TypeError("playbook_dir should be Path or PosixPath type, got: {}".format(type(playbook_dir)))
+        self.playbook_dir = playbook_dir
+        self.hosts = dict()
+
+    def add_host(self, ip, destinations, baked=False, network_optimized=False):
+        """
+        :param ip: ip of the host in the inventory
+        :param destinations: list of the ips traced by the host
+        :param baked: the host is launched from the baked image, the tools are not installed again
+        :param network_optimized: apply NETWORK_TUNING_CMD to the host
+        """
+        self.hosts[ip] = {"destinations": list(destinations), "baked": baked, "network_optimized": network_optimized}
+
+    @staticmethod
+    def get_tasks():
+        tools = ["tools"]
+        return [
+            {"name": "install the traceroute tools", "tags": tools, "when": "not baked | default(false)",
+             "apt": {"update_cache": True, "name": ["traceroute", "paris-traceroute"]}},
+            {"name": "create the experiment directories", "tags": tools, "when": "not baked | default(false)",
+             "file": {"path": "{{ item }}", "state": "directory"},
+             "loop": [str(EXPERIMENT_REMOTE_DIR), str(EXPERIMENT_BK_REMOTE_DIR)]},
+            {"name": "tune the network stack", "when": "network_optimized | default(false)",
+             "shell": NETWORK_TUNING_CMD},
+            {"name": "copy the crontab", "copy": {"content": "*/1 * * * * {}\n\n".format(TRACEROUTE_SCRIPT_PATH),
+                                                  "dest": str(CRONTAB_CFG_PATH), "mode": "0777"}},
+            {"name": "render the traceroute script", "template": {"src": "traceroute.sh.j2",
+                                                                  "dest": str(TRACEROUTE_SCRIPT_PATH), "mode": "0777"}},
+            {"name": "install the crontab", "command": "crontab {}".format(CRONTAB_CFG_PATH)}]
+
+    def make_playbook(self, src_ports="33434-33435", dst_ports="33434-33435"):
+        """
+        Write the playbook, the host_vars of every host and the traceroute template
+        :param src_ports: range of source ports, ex. 33434-33435
+        :param dst_ports: range of destination ports, ex. 33434-33435
+        :return: path of the playbook
+        """
+        src_start, src_end = [int(i) for i in src_ports.split("-")]
+        dst_start, dst_end = [int(i) for i in dst_ports.split("-")]
+        host_vars_dir = self.playbook_dir / "host_vars"
+        host_vars_dir.mkdir(parents=True, exist_ok=True)
+        for ip, host_vars in self.hosts.items():
+            with open(str(host_vars_dir / "{}.yml".format(ip)), "w") as host_vars_file:
+                yaml.safe_dump(host_vars, host_vars_file)
+        with open(str(self.playbook_dir / "traceroute.sh.j2"), "w") as template_file:
+            template_file.write(TRACEROUTE_TEMPLATE)
+
+        play = {"name": "start the probes", "hosts": "all", "become": True, "gather_facts": False,
+                "vars": {"src_start": src_start, "src_end": src_end, "dst_start": dst_start, "dst_end": dst_end,
+                         "experiment_dir": str(EXPERIMENT_REMOTE_DIR).rstrip("/"),
+                         "experiment_bk_dir": str(EXPERIMENT_BK_REMOTE_DIR).rstrip("/")},
+                "tasks": self.get_tasks()}
+        playbook_path = self.playbook_dir / "start.yml"
+        with open(str(playbook_path), "w") as playbook_file:
+            yaml.safe_dump([play], playbook_file, default_flow_style=False, sort_keys=False)
+        return playbook_path
+
+    @staticmethod
+    def run(playbook_path, inventory_path, forks=DEFAULT_FORKS, tags=None, limit=None, envvars=None, retries=0,
+            backoff=DEFAULT_BACKOFF, on_host_task=None):
+        """
+        Run the playbook with a single ansible-runner process, then run it again only on the failed and on the
+        unreachable hosts
+        :param playbook_path: path of the playbook
+        :param inventory_path: path of the inventory, or a dict inventory
+        :param forks: number of hosts configured at the same time
+        :param tags: optional comma separated tags, ex. "tools"
+        :param limit: optional host pattern
+        :param envvars: optional environment of the ansible run, the one of the inventory otherwise
+        :param retries: number of times the failed and the unreachable hosts are run again
+        :param backoff: seconds before the first retry, doubled at every retry
+        :param on_host_task: optional callable (dict with host, task, status, duration, attempt and timestamp),
+                             called as soon as a task is completed in a host
+        :return: tuple (stats, list of (task name, seconds)), the seconds of a task are counted from its start to
+                 the start of the next one
+        """
+        if envvars is None:
+            envvars = InventoryConfiguration.get_envvars(inventory_path)
+        if not isinstance(inventory_path, dict):
+            inventory_path = str(inventory_path)
+        timings = []
+
+        def run_attempt(hosts, attempt):
+            task_starts = []
+            host_event_handler = InventoryConfiguration.get_event_handler(on_host_task, attempt)
+
+            def event_handler(event):
+                if event.get("event") == "playbook_on_task_start":
+                    task_starts.append((event["event_data"]["task"], time()))
+                return host_event_handler(event)
+
+            kwargs = dict()
+            if hosts is not None:
+                kwargs["limit"] = ":".join(hosts)
+            elif limit is not None:
+                kwargs["limit"] = limit
+            if tags is not None:
+                kwargs["tags"] = tags
+            r = ansible_runner.run(private_data_dir=str(Path(playbook_path).parent), playbook=str(playbook_path),
+                                   inventory=inventory_path, forks=forks, event_handler=event_handler,
+                                   envvars=envvars, **kwargs)
+            end = time()
+            ends = [task_start for _, task_start in task_starts[1:]] + [end]
+            suffix = "" if attempt == 0 else " (retry {})".format(attempt)
+            timings.extend((task + suffix, task_end - task_start)
+                           for (task, task_start), task_end in zip(task_starts, ends))
+            return r.stats
+
+        start = time()
+        stats = InventoryConfiguration.run_with_retries(run_attempt, retries=retries, backoff=backoff)
+        timings.append(("total", time() - start))
+        return stats, timings
+
+
+class PlaybookBatches(object):
+    def __init__(self, run_batch):
+        """
+        Run the start-up playbook on the hosts as soon as they are reachable. The hosts that become reachable while
+        a batch is running form the next batch, so a slow host does not block the others and a single playbook
+        runs at a time.
+        :param run_batch: callable (list of hosts) returning the stats of the playbook limited to the hosts
+        """
+        self.run_batch = run_batch
+        self.pending = []
+        self.batches = []
+        self._lock = Lock()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def add(self, host):
+        """
+        :param host: host reachable, it is configured by the next batch
+        """
+        with self._lock:
+            self.pending.append(host)
+            self._futures.append(self._executor.submit(self.run_pending))
+
+    def run_pending(self):
+        with self._lock:
+            hosts, self.pending = self.pending, []
+        if hosts:
+            self.batches.append((hosts, self.run_batch(hosts)))
+
+    def join(self):
+        """
+        Wait for the batches of all the hosts added
+        :return: merged stats of the batches
+        """
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        stats = dict()
+        for hosts, batch_stats in self.batches:
+            stats = InventoryConfiguration.merge_stats(stats, batch_stats, hosts)
+        return stats
+
+    def get_hosts(self):
+        """
+        :return: list of the hosts configured by the batches
+        """
+        return [host for hosts, _ in self.batches for host in hosts]
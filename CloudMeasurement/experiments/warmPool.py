@@ -0,0 +1,171 @@
+from CloudMeasurement.experiments.awsUtils import AWSUtils
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace, DEFAULT_MAX_WORKERS
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import ipaddress
+
+POOL_NAME_PREFIX = "cm-pool-"
+DEFAULT_CIDR_BLOCK = "10.0.0.0/16"
+# a set still provisioning after this number of seconds is considered failed, and it is provisioned again
+PROVISIONING_TIMEOUT = 3600
+
+
+class WarmPool(object):
+    def __init__(self, db_path, cloud_util=AWSUtils, key_pair_id="id_rsa", instances_per_az=1,
+                 cidr_block=DEFAULT_CIDR_BLOCK, max_workers=DEFAULT_MAX_WORKERS, images=None):
+        """
+        Keep ready sets of a vpc with its probe instances already running, tracked in the WARM_POOL table.
+        An experiment claims a set of its region and availability zone and renames its resources, instead of
+        provisioning the region.
+        Every region has a fixed /24 of cidr_block, so the sets of different regions can always be peered: the
+        /24 of a region is the one at the index of the region in the sorted list of all the regions of the cloud
+        (see get_cidr_block).
+        :param db_path: path of the db
+        :param cloud_util: cloud utils class
+        :param key_pair_id: key pair of the instances, only the experiments with the same key claim the sets
+        :param instances_per_az: number of probes of every set
+        :param cidr_block: cidr block of the experiments that use the pool
+        :param max_workers: maximum number of sets provisioned or removed at the same time
+        :param images: optional dict {region: image id} of the baked probe image
+        """
+        self.db_path = db_path
+        self.cloud_util = cloud_util
+        self.cloud_utils = cloud_util()
+        self.key_pair_id = key_pair_id
+        self.instances_per_az = instances_per_az
+        self.cidr_block = cidr_block
+        self.max_workers = max_workers
+        self.images = images or dict()
+
+    def get_cidr_block(self, region):
+        """
+        The layout is fixed: the /24 of a region is the one at the index of the region in the sorted list of all
+        the regions of the cloud, ex. with 10.0.0.0/16 the first region has 10.0.0.0/24. A region added to the
+        cloud moves the /24 of the regions that follow it, their sets are not claimed anymore and should be
+        drained.
+        :return: cidr block of the vpcs of the region, the same for all the sets and the experiments
+        """
+        index = sorted(self.cloud_utils.get_all_regions()).index(region)
+        subnets = list(ipaddress.ip_network(self.cidr_block).subnets(new_prefix=24))
+        if index >= len(subnets):
+            raise ValueError("{} has no /24 for the region number {}, {}".format(self.cidr_block, index, region))
+        return str(subnets[index])
+
+    def count_ready(self, region, machine_type, availability_zone):
+        return len([row for row in CloudMeasurementDB.get_warm_pool(db_path=self.db_path, status="READY")
+                    if row[1:5] == (region, machine_type, self.instances_per_az, self.key_pair_id)
+                    and row[9] == availability_zone])
+
+    def refill(self, machine_type_mapping, size, az_mapping=None):
+        """
+        Provision concurrently the sets missing to have size sets in every region
+        :param machine_type_mapping: dict {region: machine type}
+        :param size: number of sets wanted in every region, the sets being provisioned are counted
+        :param az_mapping: optional dict {region: availability zone}, the first availability zone of the region
+                           otherwise, as for the experiments
+        :return: list of the new pool ids
+        """
+        provisioning_since = time() - PROVISIONING_TIMEOUT
+        az_mapping = az_mapping or dict()
+        missing = []
+        for region, machine_type in machine_type_mapping.items():
+            availability_zone = az_mapping.get(region, None) or self.cloud_utils.get_az_in_the_region(region=region)[0]
+            count = CloudMeasurementDB.count_warm_pool_sets(db_path=self.db_path, region=region,
+                                                            machine_type=machine_type,
+                                                            instances_per_az=self.instances_per_az,
+                                                            key_pair_id=self.key_pair_id,
+                                                            availability_zone=availability_zone,
+                                                            provisioning_since=provisioning_since)
+            for _ in range(size - count):
+                # registered before starting, so a refill running at the same time does not provision it again
+                pool_id = POOL_NAME_PREFIX + self.cloud_utils.generate_experiment_id()
+                CloudMeasurementDB.add_warm_pool_set(db_path=self.db_path, pool_id=pool_id, region=region,
+                                                     machine_type=machine_type,
+                                                     instances_per_az=self.instances_per_az,
+                                                     key_pair_id=self.key_pair_id,
+                                                     availability_zone=availability_zone, creation_date=time())
+                missing.append((pool_id, region, machine_type, availability_zone))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing)))) as executor:
+            futures = [executor.submit(self.cloud_utils.bind_api_phase(self.provision_set), pool_id=pool_id,
+                                       region=region, machine_type=machine_type,
+                                       availability_zone=availability_zone)
+                       for pool_id, region, machine_type, availability_zone in missing]
+        return [future.result() for future in futures]
+
+    def provision_set(self, pool_id, region, machine_type, availability_zone):
+        """
+        Create the vpc and the instances of a set, with the same steps of an experiment
+        :return: pool id
+        """
+        trace = MultiregionalTrace(list_of_regions=[region], az_mapping={region: availability_zone},
+                                   machine_type_mapping={region: machine_type}, cloud_util=self.cloud_util,
+                                   instances_per_az=self.instances_per_az)
+        trace.images = self.images
+        try:
+            vpc_data = trace.create_region_vpc(region=region, experiment_id=pool_id,
+                                               subnet_pool=self.get_cidr_block(region))
+            trace.vpcs_data = {"experiment_id": pool_id, "cidr_block": self.cidr_block, region: [dict(vpc_data)]}
+            trace.create_region_instances(region=region, key_pair_id=self.key_pair_id)
+        except Exception:
+            self.remove_set(pool_id=pool_id, region=region)
+            raise
+        CloudMeasurementDB.set_warm_pool_set_ready(db_path=self.db_path, pool_id=pool_id,
+                                                   data={"vpc": vpc_data, "instances": trace.vpcs_data[region]})
+        return pool_id
+
+    def claim(self, region, machine_type, availability_zone, experiment_id):
+        """
+        Claim a ready set of the region and availability zone, and rename all its resources with the experiment
+        id. The sets whose instances are not running anymore, or whose /24 is not the one of the region anymore,
+        are removed.
+        :return: dict with the vpc data and the instances list, None if the pool of the region is empty
+        """
+        while True:
+            claimed = CloudMeasurementDB.claim_warm_pool_set(db_path=self.db_path, region=region,
+                                                             machine_type=machine_type,
+                                                             instances_per_az=self.instances_per_az,
+                                                             key_pair_id=self.key_pair_id,
+                                                             availability_zone=availability_zone,
+                                                             experiment_id=experiment_id)
+            if claimed is None:
+                return None
+            pool_id, data = claimed
+            vpc = data["vpc"]
+            instances_ids = [instance_dict["instance_id"] for instance_dict in data["instances"]]
+            if vpc["vpc_cidr_block"] == self.get_cidr_block(region) and vpc["availability_zone"] == [availability_zone]:
+                instances_data = self.cloud_utils.describe_instances_data(region=region,
+                                                                          instances_id_list=instances_ids)
+                if all(instances_data.get(instance_id, {}).get("state", None) == "running"
+                       for instance_id in instances_ids):
+                    break
+            self.remove_set(pool_id=pool_id, region=region)
+
+        resource_ids = [vpc["vpc_id"], vpc["internet_gateway_id"], vpc["public_route_table_id"],
+                        vpc["security_group_id"]] + vpc["public_subnet"] + instances_ids
+        self.cloud_utils.tag_resources(region=region, resource_ids=resource_ids, name=experiment_id)
+        return data
+
+    def remove_set(self, pool_id, region):
+        for vpc_id in self.cloud_utils.get_vpcs_by_name(region=region, name=pool_id):
+            self.cloud_utils.remove_vpc(region, vpc_id)
+        CloudMeasurementDB.delete_warm_pool_set(db_path=self.db_path, pool_id=pool_id)
+
+    def drain(self, regions=None):
+        """
+        Remove concurrently the ready sets, and the sets whose provisioning failed
+        :param regions: optional list of regions, all the regions otherwise
+        :return: list of the removed pool ids
+        """
+        provisioning_since = time() - PROVISIONING_TIMEOUT
+        rows = [row for row in CloudMeasurementDB.get_warm_pool(db_path=self.db_path)
+                if (regions is None or row[1] in regions)
+                and (row[5] == "READY" or (row[5] == "PROVISIONING" and row[8] < provisioning_since))]
+        self.cloud_utils.set_api_phase("teardown")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(rows)))) as executor:
+            futures = [executor.submit(self.cloud_utils.bind_api_phase(self.remove_set), pool_id=row[0], region=row[1])
+                       for row in rows]
+        for future in futures:
+            future.result()
+        return [row[0] for row in rows]
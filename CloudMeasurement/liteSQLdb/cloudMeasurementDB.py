@@ -1,4 +1,5 @@
 import sqlite3
+from json import dumps, loads
 from sqlite3 import Error
 
 from pathlib import Path, PosixPath
@@ -29,6 +30,42 @@ class CloudMeasurementDB(object):
           [KEYPAIR_ID] TEXT, PRIMARY KEY (INSTANCE_ID)) ''')
 
         conn.commit()
+        CloudMeasurementDB.upgrade_db(db_path)
+
+    @staticmethod
+    def upgrade_db(db_path):
+        """
+        Create the tables added after the first release, so the dbs created by an older version keep working
+        :param db_path: path of the db
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS API_CALLS ([EXPERIMENT_ID] TEXT, [PHASE] TEXT, [OPERATION] TEXT,
+         [REGION] TEXT, [LATENCY] REAL, [RETRIES] INTEGER, [ERROR] TEXT, [TIMESTAMP] REAL) ''')
+        c.execute('''CREATE TABLE IF NOT EXISTS TRANSIT_GATEWAYS ([EXPERIMENT_ID] TEXT, [REGION] TEXT,
+         [TRANSIT_GATEWAY_ID] TEXT, [ROUTE_TABLE_ID] TEXT, [VPC_ATTACHMENT_ID] TEXT, [PEERING_ATTACHMENT_ID] TEXT,
+         PRIMARY KEY (REGION, EXPERIMENT_ID)) ''')
+        c.execute('''CREATE TABLE IF NOT EXISTS ROUTES ([EXPERIMENT_ID] TEXT, [REGION] TEXT, [ROUTE_TABLE_ID] TEXT,
+         [DESTINATION_CIDR_BLOCK] TEXT, [TARGET_ID] TEXT, [KIND] TEXT) ''')
+        # REGION is '' for the steps of the whole experiment
+        c.execute('''CREATE TABLE IF NOT EXISTS CHECKPOINTS ([EXPERIMENT_ID] TEXT, [STEP] TEXT, [REGION] TEXT,
+         [DATA] TEXT, [TIMESTAMP] date, PRIMARY KEY (EXPERIMENT_ID, STEP, REGION)) ''')
+        # STATUS is PROVISIONING, READY or CLAIMED, EXPERIMENT_ID is set when the set is claimed
+        c.execute('''CREATE TABLE IF NOT EXISTS WARM_POOL ([POOL_ID] TEXT PRIMARY KEY, [REGION] TEXT,
+         [MACHINE_TYPE] TEXT, [INSTANCES_PER_AZ] INTEGER, [KEYPAIR_ID] TEXT, [STATUS] TEXT, [EXPERIMENT_ID] TEXT,
+         [DATA] TEXT, [CREATION_DATE] REAL, [AVAILABILITY_ZONE] TEXT) ''')
+        # the sets of a WARM_POOL without AVAILABILITY_ZONE keep it NULL, so they are never claimed
+        c.execute('''SELECT NAME FROM pragma_table_info("WARM_POOL") ''')
+        if "AVAILABILITY_ZONE" not in [row[0] for row in c.fetchall()]:
+            c.execute('''ALTER TABLE WARM_POOL ADD COLUMN [AVAILABILITY_ZONE] TEXT''')
+        c.execute('''CREATE TABLE IF NOT EXISTS IMAGES ([CLOUD] TEXT, [REGION] TEXT, [IMAGE_ID] TEXT, [IMAGE_NAME] TEXT,
+         [CREATION_DATE] date, PRIMARY KEY (CLOUD, REGION)) ''')
+        # STATUS is ok, failed, unreachable or skipped, ATTEMPT is 0 for the first run and n for the n-th retry
+        c.execute('''CREATE TABLE IF NOT EXISTS HOST_TASKS ([EXPERIMENT_ID] TEXT, [COMMAND] TEXT, [HOST] TEXT,
+         [TASK] TEXT, [STATUS] TEXT, [DURATION] REAL, [ATTEMPT] INTEGER, [TIMESTAMP] REAL) ''')
+        conn.commit()
+        c.close()
 
     @staticmethod
     def remove_db(db_path):
@@ -122,12 +159,32 @@ class CloudMeasurementDB(object):
     def add_region(db_path, experiment_id, region, vpc_id, status):
         conn = sqlite3.connect(str(db_path))
         c = conn.cursor()
-        c.execute('''INSERT INTO REGIONS VALUES ('{}', '{}', '{}','{}')'''.format(experiment_id, region,
-                                                                                  vpc_id, status))
+        # a resumed experiment can create again the vpc of a region
+        c.execute('''INSERT OR REPLACE INTO REGIONS VALUES (?, ?, ?, ?)''', (experiment_id, region, vpc_id, status))
 
         conn.commit()
         c.close()
 
+    @staticmethod
+    def update_region_status(db_path, experiment_id, region, status):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''UPDATE REGIONS SET STATUS=? WHERE EXPERIMENT_ID=? AND REGION=?''', (status, experiment_id, region))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def delete_region(db_path, experiment_id, region):
+        """
+        Remove a region of the experiment and its instances, when its vpc is removed
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''DELETE FROM INSTANCES WHERE EXPERIMENT_ID=? AND REGION=?''', (experiment_id, region))
+        c.execute('''DELETE FROM REGIONS WHERE EXPERIMENT_ID=? AND REGION=?''', (experiment_id, region))
+        conn.commit()
+        c.close()
+
     @staticmethod
     def add_instance(db_path, instance_id, machine_type, experiment_id, region, availability_zone,
                      vpc_id, status, public_address, private_address, key_pair_id):
@@ -135,13 +192,74 @@ class CloudMeasurementDB(object):
         conn = sqlite3.connect(str(db_path))
         c = conn.cursor()
 
-        c.execute('''INSERT INTO INSTANCES VALUES ('{}', '{}', '{}','{}','{}', '{}', '{}','{}','{}', '{}')'''.format(
-            instance_id, machine_type, experiment_id, region, availability_zone,
-            vpc_id, status, public_address, private_address, key_pair_id))
+        try:
+            c.execute('''INSERT INTO INSTANCES VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (instance_id, machine_type, experiment_id, region, availability_zone, vpc_id, status,
+                       public_address, private_address, key_pair_id))
+        except sqlite3.Error:
+            # the open transaction would keep the db locked for the next writes
+            conn.rollback()
+            raise
 
         conn.commit()
         c.close()
 
+    @staticmethod
+    def delete_region_instances(db_path, experiment_id, region):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''DELETE FROM INSTANCES WHERE EXPERIMENT_ID=? AND REGION=?''', (experiment_id, region))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def add_checkpoint(db_path, experiment_id, step, region, data, timestamp):
+        """
+        Store a completed provisioning step, replacing the previous one
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :param step: name of the step
+        :param region: region of the step, None for the steps of the whole experiment
+        :param data: json serializable data of the step
+        :param timestamp: completion date
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO CHECKPOINTS VALUES (?, ?, ?, ?, ?)''',
+                  (experiment_id, step, region or "", dumps(data), timestamp))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def delete_checkpoint(db_path, experiment_id, step, region):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''DELETE FROM CHECKPOINTS WHERE EXPERIMENT_ID=? AND STEP=? AND REGION=?''',
+                  (experiment_id, step, region or ""))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_checkpoints(experiment_id, db_path):
+        """
+        :return: dict {(step, region): data}, region is None for the steps of the whole experiment
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT STEP, REGION, DATA FROM CHECKPOINTS WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        rows = c.fetchall()
+        c.close()
+        return {(step, region or None): loads(data) for step, region, data in rows}
+
+    @staticmethod
+    def update_experiment_status(experiment_id, db_path, status):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''UPDATE EXPERIMENTS SET STATUS=? WHERE EXPERIMENT_ID=?''', (status, experiment_id))
+        conn.commit()
+        c.close()
+
     @staticmethod
     def add_configuration(db_path, utils_path, private_key_path):
         conn = sqlite3.connect(str(db_path))
@@ -152,12 +270,283 @@ class CloudMeasurementDB(object):
         conn.commit()
         c.close()
 
+    @staticmethod
+    def add_api_calls(db_path, experiment_id, records):
+        """
+        Store the api calls recorded during a phase of the experiment
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :param records: list of dict with phase, operation, region, latency, retries, error and timestamp
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.executemany('''INSERT INTO API_CALLS VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                      [(experiment_id, r["phase"], r["operation"], r["region"], r["latency"], r["retries"],
+                        r["error"], r["timestamp"]) for r in records])
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_api_calls_stats(experiment_id, db_path):
+        """
+        Aggregate the api calls of the experiment by phase and operation, the slowest first
+        :param experiment_id: experiment id
+        :param db_path: path of the db
+        :return: list of rows (PHASE, OPERATION, CALLS, TOTAL_LATENCY, AVG_LATENCY, MAX_LATENCY, RETRIES, ERRORS)
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT PHASE, OPERATION, COUNT(*), SUM(LATENCY), AVG(LATENCY), MAX(LATENCY), SUM(RETRIES),
+         COUNT(ERROR) FROM API_CALLS WHERE EXPERIMENT_ID=? GROUP BY PHASE, OPERATION
+         ORDER BY SUM(LATENCY) DESC''', (experiment_id,))
+        rows = c.fetchall()
+        c.close()
+        return rows
+
+    @staticmethod
+    def add_host_tasks(db_path, experiment_id, command, records):
+        """
+        Store the duration of the ansible tasks of every host
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :param command: cm command of the tasks, ex. start_experiment
+        :param records: list of dict with host, task, status, duration, attempt and timestamp
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.executemany('''INSERT INTO HOST_TASKS VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                      [(experiment_id, command, r["host"], r["task"], r["status"], r["duration"], r["attempt"],
+                        r["timestamp"]) for r in records])
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_host_tasks_stats(experiment_id, db_path):
+        """
+        Aggregate the tasks of the experiment by command and host, the slowest host first
+        :param experiment_id: experiment id
+        :param db_path: path of the db
+        :return: list of rows (COMMAND, HOST, TASKS, TOTAL_DURATION, MAX_DURATION, ATTEMPTS, FAILED, UNREACHABLE)
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT COMMAND, HOST, COUNT(*), SUM(DURATION), MAX(DURATION), MAX(ATTEMPT) + 1,
+         SUM(STATUS = 'failed'), SUM(STATUS = 'unreachable') FROM HOST_TASKS WHERE EXPERIMENT_ID=?
+         GROUP BY COMMAND, HOST ORDER BY SUM(DURATION) DESC''', (experiment_id,))
+        rows = c.fetchall()
+        c.close()
+        return rows
+
+    @staticmethod
+    def add_transit_gateways(db_path, experiment_id, transit_gateways):
+        """
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :param transit_gateways: dict {region: dict with transit_gateway_id, route_table_id, vpc_attachment_id
+                                 and peering_attachment_id}
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.executemany('''INSERT INTO TRANSIT_GATEWAYS VALUES (?, ?, ?, ?, ?, ?)''',
+                      [(experiment_id, region, t["transit_gateway_id"], t["route_table_id"], t["vpc_attachment_id"],
+                        t["peering_attachment_id"]) for region, t in transit_gateways.items()])
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_transit_gateways_dict(experiment_id, db_path):
+        """
+        :return: dict {region: dict with transit_gateway_id, route_table_id, vpc_attachment_id and
+                 peering_attachment_id}
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT REGION, TRANSIT_GATEWAY_ID, ROUTE_TABLE_ID, VPC_ATTACHMENT_ID, PEERING_ATTACHMENT_ID
+         FROM TRANSIT_GATEWAYS WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        rows = c.fetchall()
+        c.close()
+        return {r[0]: {"transit_gateway_id": r[1], "route_table_id": r[2], "vpc_attachment_id": r[3],
+                       "peering_attachment_id": r[4]} for r in rows}
+
+    @staticmethod
+    def add_routes(db_path, experiment_id, routes):
+        """
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :param routes: list of dict with region, route_table_id, destination_cidr_block, target_id and kind
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.executemany('''INSERT INTO ROUTES VALUES (?, ?, ?, ?, ?, ?)''',
+                      [(experiment_id, r["region"], r["route_table_id"], r["destination_cidr_block"], r["target_id"],
+                        r["kind"]) for r in routes])
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def delete_private_network(db_path, experiment_id):
+        """
+        Remove the transit gateways and the routes of the experiment, saved again by its next peering step
+        :param db_path: path of the db
+        :param experiment_id: experiment id
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''DELETE FROM TRANSIT_GATEWAYS WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        c.execute('''DELETE FROM ROUTES WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_routes(experiment_id, db_path):
+        """
+        :return: list of dict with region, route_table_id, destination_cidr_block, target_id and kind
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT REGION, ROUTE_TABLE_ID, DESTINATION_CIDR_BLOCK, TARGET_ID, KIND FROM ROUTES
+         WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        rows = c.fetchall()
+        c.close()
+        return [{"region": r[0], "route_table_id": r[1], "destination_cidr_block": r[2], "target_id": r[3],
+                 "kind": r[4]} for r in rows]
+
+    @staticmethod
+    def add_warm_pool_set(db_path, pool_id, region, machine_type, instances_per_az, key_pair_id, availability_zone,
+                          creation_date):
+        """
+        Register a warm pool set that is being provisioned
+        :param creation_date: timestamp in seconds, used to ignore the sets whose provisioning died
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''INSERT INTO WARM_POOL VALUES (?, ?, ?, ?, ?, 'PROVISIONING', NULL, NULL, ?, ?)''',
+                  (pool_id, region, machine_type, instances_per_az, key_pair_id, creation_date, availability_zone))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def set_warm_pool_set_ready(db_path, pool_id, data):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''UPDATE WARM_POOL SET STATUS='READY', DATA=? WHERE POOL_ID=?''', (dumps(data), pool_id))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def claim_warm_pool_set(db_path, region, machine_type, instances_per_az, key_pair_id, availability_zone,
+                            experiment_id):
+        """
+        Claim the oldest ready set that matches the experiment. The set is claimed by a single UPDATE, so two
+        experiments started at the same time can not claim the same set.
+        :return: tuple (pool_id, data), None if there is no ready set
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''UPDATE WARM_POOL SET STATUS='CLAIMED', EXPERIMENT_ID=? WHERE POOL_ID=(
+         SELECT POOL_ID FROM WARM_POOL WHERE STATUS='READY' AND REGION=? AND MACHINE_TYPE=? AND INSTANCES_PER_AZ=?
+         AND KEYPAIR_ID=? AND AVAILABILITY_ZONE=? ORDER BY CREATION_DATE LIMIT 1)''',
+                  (experiment_id, region, machine_type, instances_per_az, key_pair_id, availability_zone))
+        conn.commit()
+        c.execute('''SELECT POOL_ID, DATA FROM WARM_POOL WHERE STATUS='CLAIMED' AND EXPERIMENT_ID=? AND REGION=?''',
+                  (experiment_id, region))
+        row = c.fetchone()
+        c.close()
+        if row is None:
+            return None
+        return row[0], loads(row[1])
+
+    @staticmethod
+    def count_warm_pool_sets(db_path, region, machine_type, instances_per_az, key_pair_id, availability_zone,
+                             provisioning_since):
+        """
+        :param provisioning_since: the sets still provisioning that were created before this timestamp are not
+                                   counted
+        :return: number of the ready sets and of the sets being provisioned
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT COUNT(*) FROM WARM_POOL WHERE REGION=? AND MACHINE_TYPE=? AND INSTANCES_PER_AZ=?
+         AND KEYPAIR_ID=? AND AVAILABILITY_ZONE=? AND (STATUS='READY' OR (STATUS='PROVISIONING'
+         AND CREATION_DATE>=?))''',
+                  (region, machine_type, instances_per_az, key_pair_id, availability_zone, provisioning_since))
+        count = c.fetchone()[0]
+        c.close()
+        return count
+
+    @staticmethod
+    def get_warm_pool(db_path, status=None):
+        """
+        :return: list of rows (POOL_ID, REGION, MACHINE_TYPE, INSTANCES_PER_AZ, KEYPAIR_ID, STATUS, EXPERIMENT_ID,
+                 DATA, CREATION_DATE, AVAILABILITY_ZONE), DATA is decoded
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        if status is None:
+            c.execute('''SELECT * FROM WARM_POOL ORDER BY REGION, CREATION_DATE''')
+        else:
+            c.execute('''SELECT * FROM WARM_POOL WHERE STATUS=? ORDER BY REGION, CREATION_DATE''', (status,))
+        rows = c.fetchall()
+        c.close()
+        return [row[:7] + (loads(row[7]) if row[7] is not None else None,) + row[8:] for row in rows]
+
+    @staticmethod
+    def delete_warm_pool_set(db_path, pool_id):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''DELETE FROM WARM_POOL WHERE POOL_ID=?''', (pool_id,))
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def add_images(db_path, cloud_util, images, image_name, creation_date):
+        """
+        Store the baked probe image of every region, replacing the previous ones
+        :param cloud_util: name of the cloud utils
+        :param images: dict {region: image id}
+        :return: None
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.executemany('''INSERT OR REPLACE INTO IMAGES VALUES (?, ?, ?, ?, ?)''',
+                      [(cloud_util, region, image_id, image_name, creation_date) for region, image_id in images.items()])
+        conn.commit()
+        c.close()
+
+    @staticmethod
+    def get_images(db_path):
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT * FROM IMAGES ORDER BY CLOUD, REGION''')
+        rows = c.fetchall()
+        c.close()
+        return rows
+
+    @staticmethod
+    def get_images_dict(db_path, cloud_util):
+        """
+        :return: dict {region: image id} of the baked probe images of the cloud utils
+        """
+        conn = sqlite3.connect(str(db_path))
+        c = conn.cursor()
+        c.execute('''SELECT REGION, IMAGE_ID FROM IMAGES WHERE CLOUD=?''', (cloud_util,))
+        rows = c.fetchall()
+        c.close()
+        return dict(rows)
+
     @staticmethod
     def get_experiment(experiment_id, db_path):
         conn = sqlite3.connect(str(db_path))
         c = conn.cursor()
-        c.execute('''SELECT * FROM EXPERIMENTS WHERE EXPERIMENT_ID='{}' '''.format(experiment_id))
+        c.execute('''SELECT * FROM EXPERIMENTS WHERE EXPERIMENT_ID=?''', (experiment_id,))
         rows = c.fetchall()
+        c.close()
         if not rows:
             return None
         return rows[0]
@@ -183,6 +572,11 @@ class CloudMeasurementDB(object):
         c = conn.cursor()
         c.execute('''DELETE FROM INSTANCES WHERE EXPERIMENT_ID='{}' '''.format(experiment_id))
         c.execute('''DELETE FROM REGIONS WHERE EXPERIMENT_ID='{}' '''.format(experiment_id))
+        c.execute('''DELETE FROM TRANSIT_GATEWAYS WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        c.execute('''DELETE FROM ROUTES WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        c.execute('''DELETE FROM CHECKPOINTS WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        c.execute('''DELETE FROM WARM_POOL WHERE EXPERIMENT_ID=?''', (experiment_id,))
+        c.execute('''DELETE FROM HOST_TASKS WHERE EXPERIMENT_ID=?''', (experiment_id,))
         c.execute('''DELETE FROM EXPERIMENTS WHERE EXPERIMENT_ID='{}' '''.format(experiment_id))
         conn.commit()
         c.close()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Provisioning benchmark
+
+Run the provisioning phases of the experiments against the offline fake cloud, over a matrix of regions,
+availability zones and instances per availability zone, and report wall time, api calls and peak memory
+of every phase as JSON. The report can be compared with a stored baseline.
+
+python -m benchmarks.provisioningBenchmark --output report.json
+python -m benchmarks.provisioningBenchmark --baseline report.json
+"""
+
+import sys
+import tracemalloc
+from json import dump, load
+from optparse import OptionParser
+from time import perf_counter
+
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.fakeUtils.fakeCloud import FAKE_REGIONS
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+from CloudMeasurement.experiments.regionalTrace import RegionalTrace
+
+PHASES = ("create_experiment_environment", "create_instances", "create_peering_connection", "purge_experiment")
+DEFAULT_REGIONS = (1, 5, 10, 20)
+DEFAULT_AZS = (1, 2, 3)
+DEFAULT_INSTANCES = (1, 4)
+# latency of every fake api call in seconds, and time needed by an instance to boot or to terminate
+DEFAULT_LATENCY = 0.005
+DEFAULT_INSTANCE_TIME = 0.05
+# a phase is a regression when its wall time or its api calls exceed the baseline by more than this fraction
+DEFAULT_TOLERANCE = 0.2
+
+
+def get_scenarios(regions=DEFAULT_REGIONS, azs=DEFAULT_AZS, instances=DEFAULT_INSTANCES):
+    """
+    Build the matrix of the scenarios, a multiregional experiment uses one az per region, so the az
+    dimension is covered by the regional experiment
+    :return: list of dict with experiment, regions, azs and instances_per_az
+    """
+    scenarios = []
+    for instances_per_az in instances:
+        for number_of_regions in regions:
+            scenarios.append({"experiment": "multiregional", "regions": number_of_regions, "azs": 1,
+                              "instances_per_az": instances_per_az})
+        for number_of_azs in azs:
+            scenarios.append({"experiment": "regional", "regions": 1, "azs": number_of_azs,
+                              "instances_per_az": instances_per_az})
+    return scenarios
+
+
+def get_scenario_name(scenario):
+    return "{experiment}-r{regions}-az{azs}-i{instances_per_az}".format(**scenario)
+
+
+def measure(function):
+    """
+    Run the function measuring wall time, api calls made in the fake cloud and peak of the traced memory
+    :return: dict with wall_time, api_calls and peak_memory
+    """
+    api_calls_start = sum(FakeUtils.get_api_calls().values())
+    tracemalloc.start()
+    start = perf_counter()
+    try:
+        function()
+        wall_time = perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"wall_time": wall_time, "api_calls": sum(FakeUtils.get_api_calls().values()) - api_calls_start,
+            "peak_memory": peak_memory}
+
+
+def run_scenario(scenario, latency=DEFAULT_LATENCY, instance_time=DEFAULT_INSTANCE_TIME):
+    """
+    Run all the phases of a scenario on a new fake cloud
+    :param scenario: dict with experiment, regions, azs and instances_per_az
+    :param latency: latency of every api call
+    :param instance_time: boot and termination time of the instances
+    :return: dict {phase: measures}
+    """
+    FakeUtils.configure(latency=latency, instance_boot_time=instance_time, instance_termination_time=instance_time,
+                        vpc_quota=scenario["regions"], vcpus_quota=10 ** 6, seed=0)
+    list_of_regions = list(FAKE_REGIONS[:scenario["regions"]])
+    if scenario["experiment"] == "regional":
+        region = list_of_regions[0]
+        az_mapping = {region: FakeUtils.get_az_in_the_region(region=region)[:scenario["azs"]]}
+        experiment = RegionalTrace(list_of_regions=list_of_regions, az_mapping=az_mapping, cloud_util=FakeUtils,
+                                   instances_per_az=scenario["instances_per_az"])
+    else:
+        experiment = MultiregionalTrace(list_of_regions=list_of_regions, cloud_util=FakeUtils,
+                                        instances_per_az=scenario["instances_per_az"])
+
+    results = dict()
+    results["create_experiment_environment"] = measure(experiment.create_experiment_environment)
+    results["create_instances"] = measure(experiment.create_instances)
+    results["create_peering_connection"] = measure(experiment.create_peering_connection)
+    dict_region_vpc = {region: experiment.vpcs_data[region][0]["vpc_id"] for region in list_of_regions}
+    results["purge_experiment"] = measure(lambda: experiment.purge_experiment(dict_region_vpc=dict_region_vpc,
+                                                                              cloud_utils=FakeUtils))
+    return results
+
+
+def run_benchmark(scenarios, latency=DEFAULT_LATENCY, instance_time=DEFAULT_INSTANCE_TIME):
+    report = {"configuration": {"latency": latency, "instance_time": instance_time}, "scenarios": dict()}
+    for scenario in scenarios:
+        name = get_scenario_name(scenario)
+        print("* {}".format(name), file=sys.stderr)
+        report["scenarios"][name] = dict(scenario, phases=run_scenario(scenario, latency=latency,
+                                                                       instance_time=instance_time))
+    return report
+
+
+def compare_with_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the wall time and the api calls of every phase with the baseline
+    :param report: current benchmark report
+    :param baseline: stored benchmark report
+    :param tolerance: allowed increase of wall time and api calls, as a fraction of the baseline
+    :return: list of the regressions, every regression is a dict with scenario, phase, metric, baseline, current
+    """
+    regressions = []
+    for name, scenario in report["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        for phase, measures in scenario["phases"].items():
+            baseline_measures = baseline["scenarios"][name]["phases"].get(phase, None)
+            if baseline_measures is None:
+                continue
+            if measures["wall_time"] > baseline_measures["wall_time"] * (1 + tolerance):
+                regressions.append({"scenario": name, "phase": phase, "metric": "wall_time",
+                                    "baseline": baseline_measures["wall_time"], "current": measures["wall_time"]})
+            if measures["api_calls"] > baseline_measures["api_calls"] * (1 + tolerance):
+                regressions.append({"scenario": name, "phase": phase, "metric": "api_calls",
+                                    "baseline": baseline_measures["api_calls"], "current": measures["api_calls"]})
+    return regressions
+
+
+def parse_list(value):
+    return tuple(int(v) for v in value.split(","))
+
+
+def main():
+    opts = OptionParser(description="Benchmark of the provisioning phases on the offline fake cloud",
+                        usage="%prog [options]")
+    opts.add_option('--regions', type='string', default=",".join(map(str, DEFAULT_REGIONS)),
+                    help='comma separated numbers of regions of the multiregional experiments')
+    opts.add_option('--azs', type='string', default=",".join(map(str, DEFAULT_AZS)),
+                    help='comma separated numbers of availability zones of the regional experiments')
+    opts.add_option('--instances', type='string', default=",".join(map(str, DEFAULT_INSTANCES)),
+                    help='comma separated numbers of instances per availability zone')
+    opts.add_option('--latency', type='float', default=DEFAULT_LATENCY, help='latency of every api call')
+    opts.add_option('--instance_time', type='float', default=DEFAULT_INSTANCE_TIME,
+                    help='boot and termination time of the instances')
+    opts.add_option('--output', '-o', type='string', default=None, help='write the report in this json file')
+    opts.add_option('--baseline', '-b', type='string', default=None, help='compare with this json report')
+    opts.add_option('--tolerance', type='float', default=DEFAULT_TOLERANCE,
+                    help='allowed increase of wall time and api calls compared with the baseline')
+    options, _ = opts.parse_args()
+
+    scenarios = get_scenarios(regions=parse_list(options.regions), azs=parse_list(options.azs),
+                              instances=parse_list(options.instances))
+    report = run_benchmark(scenarios, latency=options.latency, instance_time=options.instance_time)
+
+    if options.output is None:
+        dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.output, "w") as f:
+            dump(report, f, indent=2)
+
+    if options.baseline is not None:
+        with open(options.baseline, "r") as f:
+            baseline = load(f)
+        regressions = compare_with_baseline(report, baseline, tolerance=options.tolerance)
+        for regression in regressions:
+            print("REGRESSION {scenario} {phase} {metric}: {baseline} -> {current}".format(**regression),
+                  file=sys.stderr)
+        if regressions:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
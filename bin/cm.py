@@ -7,19 +7,29 @@ author: Giuseppe Di Lena (giuseppedilena92@gmail.com)
 """
 
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from json import load, dump
 from os import system, makedirs, umask, getcwd
+from subprocess import Popen, DEVNULL, STDOUT
 from optparse import OptionParser
 from pathlib import Path
 from re import match
 import termtables as tt
 
 
-from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace, TOPOLOGIES
 from CloudMeasurement.experiments.regionalTrace import RegionalTrace
 from CloudMeasurement.liteSQLdb import CloudMeasurementDB
-from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration
+from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration, EXECUTORS
+from CloudMeasurement.experiments.dynamicInventory import DynamicInventory
+from CloudMeasurement.experiments.instancePipeline import InstancePipeline
+from CloudMeasurement.experiments.warmPool import WarmPool
+from CloudMeasurement.experiments.imageBaker import ImageBaker
+from CloudMeasurement.experiments.startupPlaybook import StartupPlaybook, PlaybookBatches, DEFAULT_FORKS, \
+    EXPERIMENT_REMOTE_DIR
 from CloudMeasurement.experiments.awsUtils.awsUtils import AWSUtils
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
 from CloudMeasurement.cmplotter.cmplotter import Plotter
 
 from sqlite3 import OperationalError
@@ -27,7 +37,7 @@ from datetime import datetime, timedelta
 
 
 EXPERIMENTS = {"multiregional": MultiregionalTrace, "regional": RegionalTrace}
-CLOUDUTILS = {"aws": AWSUtils}
+CLOUDUTILS = {"aws": AWSUtils, "fake": FakeUtils}
 
 home = Path.home()
 UTILS_PATH = home / ".CloudMeasurement"
@@ -35,11 +45,8 @@ ANSIBLE_PATH = UTILS_PATH / "ansible"
 EXPERIMENTS_PATH = UTILS_PATH / "experiments"
 DB_PATH = UTILS_PATH / "CloudMeasurementDB.db"
 PRIVATE_KEY_PATH = home / ".ssh" / "id_rsa"
+WARM_POOL_LOG_PATH = UTILS_PATH / "warm_pool.log"
 
-CRONTAB_CFG_PATH = Path("/home/ubuntu/crontab.cfg")
-TRACEROUTE_SCRIPT_PATH = Path("/home/ubuntu/traceroute.sh")
-EXPERIMENT_REMOTE_DIR = Path("/home/ubuntu/experiments/")
-EXPERIMENT_BK_REMOTE_DIR = Path("/home/ubuntu/experiments_bk/")
 
 class CloudMeasurementRunner(object):
     def __init__(self):
@@ -70,6 +77,9 @@ class CloudMeasurementRunner(object):
 
         opts.add_option('--purge', action='store_true', default=None, help='purge all the active experiments')
 
+        opts.add_option('--invalidate_metadata', action='store_true', default=None,
+                        help='invalidate the cached regions, availability zones and AMI ids')
+
         opts.add_option('--ls_experiments', '-e', action='store_true', default=None, help='list the experiments')
 
         opts.add_option('--ls_regions', '-r', action='store_true', default=None, help='list the regions')
@@ -80,6 +90,27 @@ class CloudMeasurementRunner(object):
 
         opts.add_option('--delete_experiment', '-d', type='string', default=None, help='delete experiment')
 
+        opts.add_option('--resume', type='string', default=None,
+                        help='resume the creation of an experiment, running only the missing steps')
+
+        opts.add_option('--refill_pool', action='store_true', default=None,
+                        help='provision the warm pool sets missing in --regions, up to --warm_pool sets per region')
+
+        opts.add_option('--drain_pool', action='store_true', default=None,
+                        help='remove the ready sets of the warm pool')
+
+        opts.add_option('--bake_image', '--bake-image', action='store_true', default=None,
+                        help='build the probe image with the tools installed in the first of --regions, and copy '
+                             'it to all the --regions')
+
+        opts.add_option('--ls_pool', action='store_true', default=None, help='list the warm pool sets')
+
+        opts.add_option('--api_stats', '--api-stats', type='string', default=None,
+                        help='show the api calls of the experiment, aggregated by phase and operation')
+
+        opts.add_option('--host_stats', '--host-stats', type='string', default=None,
+                        help='show the ansible tasks of the experiment, aggregated by command and probe')
+
         opts.add_option('--retrieve_data', '-R', type='string', default=None, help='retrieve data')
 
         opts.add_option('--save_data', '-S', type='string', default=None, help='save data, EXP_ID,[PATH]')
@@ -99,13 +130,39 @@ class CloudMeasurementRunner(object):
         opts.add_option('--machine_type_mapping', type='string', default=None, help='optional Json, describing'
                                                                                     ' the machine type mapping')
 
-        opts.add_option('--cloud_util', type='string', default="aws", help='retrieve data')
+        opts.add_option('--cloud_util', type='string', default="aws",
+                        help="possible cloud utils: \n" + "|".join(CLOUDUTILS.keys()))
 
         opts.add_option('--private_ip', default=False, action="store_true", help='use private ips'
                                                                                  ' for the experiments')
 
+        opts.add_option('--network_optimized', default=False, action="store_true",
+                        help='launch the probes with ENA in cluster placement groups, and tune their network stack')
+
         opts.add_option('--key_pair_id', type='string', default="id_rsa", help='public key id')
 
+        opts.add_option('--instances_per_az', type='int', default=1, help='number of probes in every'
+                                                                          ' availability zone')
+
+        opts.add_option('--topology', type='choice', choices=TOPOLOGIES, default="mesh",
+                        help='topology of the private network used with --private_ip: ' + "|".join(TOPOLOGIES))
+
+        opts.add_option('--warm_pool', type='int', default=0,
+                        help='number of ready vpc and probes sets kept in every region. With -c multiregional the '
+                             'regions are claimed from the pool, then the pool is refilled in background')
+
+        opts.add_option('--forks', type='int', default=DEFAULT_FORKS,
+                        help='number of probes driven at the same time by -s and -R')
+
+        opts.add_option('--retries', type='int', default=0,
+                        help='number of times -s and -R run again only the failed and the unreachable probes, '
+                             'with exponential backoff')
+
+        opts.add_option('--executor', type='choice', choices=EXECUTORS, default="ansible",
+                        help='executor of the commands of -R and -S: ' + "|".join(EXECUTORS) + ', ssh runs the '
+                             'commands of the probes of -R with parallel OpenSSH processes, and the local ones of '
+                             '-R and -S with sh, instead of ansible')
+
         opts.add_option('--verbose', '-v', default=None, action='store_true', help='Shows more details')
 
         opts.add_option('--interactive', '-I', default=None, type='string', help='Use interactive Dash'
@@ -130,13 +187,23 @@ class CloudMeasurementRunner(object):
         dict_opts.pop("cloud_util")
         dict_opts.pop("az_mapping")
         dict_opts.pop("private_ip")
+        dict_opts.pop("network_optimized")
         dict_opts.pop("machine_type_mapping")
         dict_opts.pop("key_pair_id")
         dict_opts.pop("verbose")
+        dict_opts.pop("instances_per_az")
+        dict_opts.pop("topology")
+        dict_opts.pop("warm_pool")
+        dict_opts.pop("forks")
+        dict_opts.pop("executor")
+        dict_opts.pop("retries")
 
         if len(list(filter(lambda x: x is not None and x is not False, dict_opts.values()))) > 1:
             raise ValueError("you have to pass just one of this options: {}".format(dict_opts.values()))
 
+        if DB_PATH.is_file():
+            CloudMeasurementDB.upgrade_db(db_path=DB_PATH)
+
         if opts.init:
             system("aws configure")
 
@@ -174,9 +241,57 @@ class CloudMeasurementRunner(object):
             exit(0)
 
         if opts.purge:
-            # TODO: purge all the experiment
-            # CloudMeasurementDB.purge()
-            # InventoryConfiguration.purge()
+            experiments = dict()
+            for row in CloudMeasurementDB.get_experiments(db_path=DB_PATH):
+                experiment_id, cloud_util = row[0], row[1]
+                if cloud_util == "fake":
+                    # the resources of a fake experiment lived in the memory of the cm run that created it
+                    print("* SKIPPING THE FAKE CLOUD EXPERIMENT {}".format(experiment_id))
+                    continue
+                experiments[experiment_id] = {
+                    "cloud_utils": CLOUDUTILS[cloud_util],
+                    "dict_region_vpc": CloudMeasurementDB.get_regions_dict(experiment_id=experiment_id,
+                                                                           db_path=DB_PATH) or dict(),
+                    "transit_gateways": CloudMeasurementDB.get_transit_gateways_dict(experiment_id=experiment_id,
+                                                                                     db_path=DB_PATH),
+                    "routes": CloudMeasurementDB.get_routes(experiment_id=experiment_id, db_path=DB_PATH),
+                    "placement_groups_name": experiment_id if row[4] else None}
+            if not experiments:
+                print("NO EXPERIMENTS CREATED")
+                exit(0)
+
+            print("* PURGING {} EXPERIMENTS, {} REGIONS - Please DO NOT close this terminal before it is completed"
+                  "".format(len(experiments), sum(len(e["dict_region_vpc"]) for e in experiments.values())))
+            for experiment_id in experiments:
+                CloudMeasurementDB.update_experiment_status(experiment_id=experiment_id, db_path=DB_PATH,
+                                                            status="DELETING")
+
+            def on_region_removed(experiment_id, region, vpc_id, error):
+                if error is None:
+                    CloudMeasurementDB.delete_region(db_path=DB_PATH, experiment_id=experiment_id, region=region)
+                    print("  {} {} {} REMOVED".format(experiment_id, region, vpc_id))
+                else:
+                    CloudMeasurementDB.update_region_status(db_path=DB_PATH, experiment_id=experiment_id,
+                                                            region=region, status="DELETE FAILED")
+                    print("  {} {} {} FAILED: {}".format(experiment_id, region, vpc_id, error))
+
+            failed = MultiregionalTrace.purge_experiments(experiments=experiments,
+                                                          on_region_removed=on_region_removed)
+            for experiment_id, regions in failed.items():
+                if regions:
+                    CloudMeasurementDB.update_experiment_status(experiment_id=experiment_id, db_path=DB_PATH,
+                                                                status="DELETE FAILED")
+                else:
+                    CloudMeasurementDB.delete_experiment(experiment_id=experiment_id, db_path=DB_PATH)
+            failed = [experiment_id for experiment_id, regions in failed.items() if regions]
+            if failed:
+                print("* {} EXPERIMENTS NOT PURGED: {}, run cm --purge again".format(len(failed), failed))
+                exit(1)
+            print("* ALL THE EXPERIMENTS ARE PURGED")
+            exit(0)
+
+        if opts.invalidate_metadata:
+            CLOUDUTILS[opts.cloud_util].invalidate_metadata()
             exit(0)
 
         if opts.ls_experiments:
@@ -213,7 +328,9 @@ class CloudMeasurementRunner(object):
             exit(0)
 
         if opts.create_experiment:
-            use_private_ips = opts.private_ip
+            if opts.warm_pool and opts.create_experiment != "multiregional":
+                # the regional experiments never claim from the pool, so it would only be refilled
+                raise ValueError("--warm_pool can be used only with -c multiregional")
             list_of_regions = opts.regions
             list_of_regions = list_of_regions.split(",")
             experiments_class = EXPERIMENTS[opts.create_experiment]
@@ -221,32 +338,74 @@ class CloudMeasurementRunner(object):
             machine_type_mapping = convert_json_to_dict(json_path=opts.machine_type_mapping)
             experiment = experiments_class(list_of_regions=list_of_regions, az_mapping=az_mapping,
                                            machine_type_mapping=machine_type_mapping,
-                                           cloud_util=CLOUDUTILS[opts.cloud_util])
+                                           cloud_util=CLOUDUTILS[opts.cloud_util],
+                                           instances_per_az=opts.instances_per_az, topology=opts.topology,
+                                           network_optimized=opts.network_optimized)
+            options = {"experiment": opts.create_experiment, "cloud_util": opts.cloud_util,
+                       "private_ip": opts.private_ip, "key_pair_id": opts.key_pair_id}
+            if opts.warm_pool:
+                experiment.warm_pool = self.get_warm_pool(opts)
+            self.build_experiment(experiment=experiment, options=options, verbose=opts.verbose)
+            if opts.warm_pool:
+                self.start_pool_refill(opts)
+            exit(0)
 
-            print("* CREATING THE VPCS IN {}".format(list_of_regions))
-            experiment_data = experiment.create_experiment_environment()
+        if opts.refill_pool:
+            warm_pool = self.get_warm_pool(opts)
+            trace = MultiregionalTrace(list_of_regions=opts.regions.split(","), cloud_util=CLOUDUTILS[opts.cloud_util],
+                                       az_mapping=convert_json_to_dict(json_path=opts.az_mapping),
+                                       machine_type_mapping=convert_json_to_dict(json_path=opts.machine_type_mapping))
+            pool_ids = warm_pool.refill(machine_type_mapping=trace.machine_type_mapping, size=opts.warm_pool,
+                                        az_mapping=trace.az_mapping)
+            print("* {} WARM POOL SETS PROVISIONED: {}".format(len(pool_ids), pool_ids))
+            exit(0)
 
-            print(experiment_data)
+        if opts.drain_pool:
+            pool_ids = self.get_warm_pool(opts).drain()
+            print("* {} WARM POOL SETS REMOVED: {}".format(len(pool_ids), pool_ids))
+            exit(0)
 
-            experiment_id = experiment_data["experiment_id"]
-            ansible_file = ANSIBLE_PATH / (experiment_id + ".cfg")
-            cidr_block = experiment_data["cidr_block"]
-            creation_date = str(datetime.now())
-            self.save_experiment(db_path=DB_PATH, experiment_id=experiment_id, cloud_util=opts.cloud_util,
-                                 experiment_type=opts.create_experiment, peered=int(use_private_ips),
-                                 network_optimized=0, creation_date=creation_date, starting_date="None",
-                                 status="VPCS CONFIGURED", ansible_file=str(ansible_file), cidr_block=cidr_block)
+        if opts.bake_image:
+            list_of_regions = opts.regions.split(",")
+            baker = ImageBaker(cloud_util=CLOUDUTILS[opts.cloud_util], key_pair_id=opts.key_pair_id)
+            previous_images = CloudMeasurementDB.get_images_dict(db_path=DB_PATH, cloud_util=opts.cloud_util)
+            print("* BAKING THE PROBE IMAGE IN {} FOR {}".format(list_of_regions[0], list_of_regions))
+            image_name, images = baker.bake(source_region=list_of_regions[0], regions=list_of_regions,
+                                            provision=self.provision_image)
+            CloudMeasurementDB.add_images(db_path=DB_PATH, cloud_util=opts.cloud_util, images=images,
+                                          image_name=image_name, creation_date=str(datetime.now()))
+            # the images replaced in the db are not used anymore
+            baker.deregister(images={region: image_id for region, image_id in previous_images.items()
+                                     if region in images})
+            print("* PROBE IMAGE {} READY: {}".format(image_name, images))
+            exit(0)
 
-            self.save_regions(db_path=DB_PATH, experiment_data=experiment_data)
+        if opts.ls_pool:
+            headers_up = ["POOL_ID", "REGION", "AVAILABILITY_ZONE", "MACHINE_TYPE", "INSTANCES_PER_AZ", "KEYPAIR_ID",
+                          "STATUS", "EXPERIMENT_ID", "CREATION_DATE"]
+            rows = [row[:2] + (row[9],) + row[2:7] + (str(datetime.fromtimestamp(row[8])),)
+                    for row in CloudMeasurementDB.get_warm_pool(db_path=DB_PATH)]
+            if len(rows) == 0:
+                print("NO WARM POOL SETS")
+            else:
+                table = tt.to_string(rows, header=headers_up, style=tt.styles.ascii_thin_double)
+                print(table)
+            exit(0)
 
-            print("* CREATING THE INSTANCES {}".format(list_of_regions))
-            experiment_data = experiment.create_instances(key_pair_id=opts.key_pair_id)
-            if use_private_ips:
-                experiment.create_peering_connection()
-            self.save_instances(db_path=DB_PATH, experiment_data=experiment_data)
-            self.save_inventory(ansible_path=ansible_file, experiment_data=experiment_data)
-            print("* EXPERIMENT CORRECTLY CREATED! \n "
-                  " you can start the experiment with: cm -s {}".format(experiment_id))
+        if opts.resume:
+            experiment_id = opts.resume
+            checkpoints = CloudMeasurementDB.get_checkpoints(experiment_id=experiment_id, db_path=DB_PATH)
+            if ("options", None) not in checkpoints:
+                print("NO CHECKPOINTS FOR THE EXPERIMENT {}".format(experiment_id))
+                exit(1)
+            options = checkpoints[("options", None)]
+            parameters = checkpoints[("experiment", None)]["parameters"]
+            cloud_utils = self.get_experiment_cloud_utils(cloud_util=options["cloud_util"], command="--resume")
+            experiment = EXPERIMENTS[options["experiment"]](cloud_util=cloud_utils, **parameters)
+            experiment.on_checkpoint = self.get_checkpoint_saver(db_path=DB_PATH, options=options)
+            print("* RESUMING THE EXPERIMENT {}, reconciling {} checkpoints".format(experiment_id, len(checkpoints)))
+            experiment.resume(checkpoints=checkpoints)
+            self.build_experiment(experiment=experiment, options=options, verbose=opts.verbose)
             exit(0)
 
         if opts.start_experiment:
@@ -257,74 +416,70 @@ class CloudMeasurementRunner(object):
                 print("NO INSTANCES CREATED FOR THE EXPERIMENT {}".format(experiment_id))
                 exit(1)
 
-            ansible_file = CloudMeasurementDB.get_ansible_file(db_path=DB_PATH, experiment_id=experiment_id)
-            if ansible_file is None:
-                raise ValueError("Ansible File not configured in the DB")
-
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="apt",
-                                                       module_args="update_cache=yes name=traceroute",
-                                                       forks=10, cmdline="--become")
-            print(run)
+            experiment_row = CloudMeasurementDB.get_experiment(experiment_id=experiment_id, db_path=DB_PATH)
+            cloud_utils = self.get_experiment_cloud_utils(cloud_util=experiment_row[1], command="-s")
+            inventory, envvars, _ = self.get_inventory(experiment_id=experiment_id)
 
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="apt",
-                                                       module_args="update_cache=yes name=paris-traceroute",
-                                                       forks=10, cmdline="--become")
-            print(run)
             # experiment_class = EXPERIMENTS[CloudMeasurementDB.get_experiment_type(db_path=DB_PATH,
             # experiment_id=experiment_id)]
             data = ["INSTANCE_ID", "MACHINE_TYPE", "REGION", "AVAILABILITY_ZONE", "PUBLIC_IP", "PRIVATE_IP"]
             instances_data = CloudMeasurementDB.get_instances_data(db_path=DB_PATH, experiment_id=experiment_id,
                                                                    db_columns=data)
-
-            crontab_path = "/tmp/crontab.cfg"
-            self.make_crontab_file(crontab_path)
-            copy_args = "src={} dest={} mode=777".format(crontab_path, CRONTAB_CFG_PATH)
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="copy",
-                                                       module_args=copy_args, forks=10, cmdline="--become")
-            print(run)
-
-            mkdir_args = "mkdir -p {} && mkdir -p {}".format(EXPERIMENT_REMOTE_DIR, EXPERIMENT_BK_REMOTE_DIR)
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="raw",
-                                                       module_args=mkdir_args, forks=10, cmdline="--become")
-
-            print(run)
             using_pair_connections = CloudMeasurementDB.get_peered_value(db_path=DB_PATH, experiment_id=experiment_id)
             instances_data_dict = {row[0]: {key.lower(): val for key, val in zip(data, row)} for row in instances_data}
-            for instance in instances_data_dict:
-                ip_type = "public_ip"
-                if using_pair_connections == 1:
-                    ip_type = "private_ip"
-                ip = instances_data_dict[instance]["public_ip"]
-                priv_ip = instances_data_dict[instance]["private_ip"]
-                list_of_destinations = [instances_data_dict[i][ip_type] for i in instances_data_dict]
-
-                if ip in list_of_destinations:
-                    list_of_destinations.remove(ip)
-                if priv_ip in list_of_destinations:
-                    list_of_destinations.remove(priv_ip)
-
-                traceroute_path = "/tmp/traceroute.sh"
-                src_ports = opts.src_ports
-                dst_ports = opts.dst_ports
-                self.make_traceroute(path=traceroute_path, list_of_destinations=list_of_destinations,
-                                     src_ports=src_ports, dst_ports=dst_ports)
-                copy_args = "src={} dest={} mode=777".format(traceroute_path, TRACEROUTE_SCRIPT_PATH)
-                run = InventoryConfiguration.run_inventory(ansible_file, host_pattern=ip, module="copy",
-                                                           module_args=copy_args, forks=1, cmdline="--become")
-                print(run)
+            ip_type = "private_ip" if using_pair_connections == 1 else "public_ip"
+            network_optimized = bool(experiment_row[4])
+            # the instances launched from the baked image have the tools already installed
+            checkpoints = CloudMeasurementDB.get_checkpoints(experiment_id=experiment_id, db_path=DB_PATH)
+            baked_instances = set(instance_dict["instance_id"] for (step, region), data in checkpoints.items()
+                                  if step == "instances" for instance_dict in data if instance_dict.get("baked"))
+
+            # the playbook is written once for all the probes, then it runs on every batch of reachable probes
+            startup_playbook = StartupPlaybook(playbook_dir=ANSIBLE_PATH / experiment_id)
+            for instance_id, instance in instances_data_dict.items():
+                list_of_destinations = [instances_data_dict[i][ip_type] for i in instances_data_dict
+                                        if i != instance_id]
+                startup_playbook.add_host(ip=instance["public_ip"], destinations=list_of_destinations,
+                                          baked=instance_id in baked_instances, network_optimized=network_optimized)
+            playbook_path = startup_playbook.make_playbook(src_ports=opts.src_ports, dst_ports=opts.dst_ports)
+            host_tasks = []
+
+            def run_batch(hosts):
+                stats, timings = StartupPlaybook.run(playbook_path=playbook_path, inventory_path=inventory,
+                                                     forks=opts.forks, limit=":".join(hosts), envvars=envvars,
+                                                     retries=opts.retries,
+                                                     on_host_task=self.get_host_task_recorder(host_tasks))
+                print("* {} PROBES CONFIGURED: {}".format(len(hosts), hosts))
+                rows = [[task, "{:.1f}".format(seconds)] for task, seconds in timings]
+                print(tt.to_string(rows, header=["TASK", "SECONDS"], style=tt.styles.ascii_thin_double))
+                return stats
+
+            batches = PlaybookBatches(run_batch=run_batch)
+
+            def on_ready(instance_id, instance_data):
+                print("* {} IS REACHABLE".format(instances_data_dict[instance_id]["public_ip"]))
+                batches.add(instances_data_dict[instance_id]["public_ip"])
 
-            crontab_cmd = "crontab {}".format(CRONTAB_CFG_PATH)
-            print(crontab_cmd)
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="raw",
-                                                       module_args=crontab_cmd, forks=10, cmdline="--become")
-            print(run)
+            try:
+                self.wait_instances_ready(cloud_utils=cloud_utils, instances_data_dict=instances_data_dict,
+                                          on_ready=on_ready)
+            except TimeoutError as e:
+                print("* ERROR: {}".format(e))
+            stats = batches.join()
+            CloudMeasurementDB.add_host_tasks(db_path=DB_PATH, experiment_id=experiment_id,
+                                              command="start_experiment", records=host_tasks)
+            print(stats)
+            unreachable = [instance["public_ip"] for instance in instances_data_dict.values()
+                           if instance["public_ip"] not in batches.get_hosts()]
+            if unreachable:
+                print("* {} PROBES NOT REACHABLE, NOT CONFIGURED: {}".format(len(unreachable), unreachable))
 
             starting_date = str(datetime.now())
             CloudMeasurementDB.update_experiment_starting_time(experiment_id=experiment_id,
                                                                db_path=DB_PATH,
                                                                date=starting_date)
 
-            exit(0)
+            exit(1 if unreachable else 0)
 
         if opts.retrieve_data:
             experiment_id = opts.retrieve_data
@@ -334,9 +489,7 @@ class CloudMeasurementRunner(object):
                 print("Experiment: {} not in the DB".format(experiment_id))
                 exit(1)
 
-            ansible_file = CloudMeasurementDB.get_ansible_file(db_path=DB_PATH, experiment_id=experiment_id)
-            if ansible_file is None:
-                raise ValueError("Ansible File not configured in the DB")
+            inventory, envvars, known_hosts_path = self.get_inventory(experiment_id=experiment_id)
 
             oringinal_mask = umask(0)
             try:
@@ -344,16 +497,25 @@ class CloudMeasurementRunner(object):
             finally:
                 umask(oringinal_mask)
 
+            host_tasks = []
             zip_path = EXPERIMENT_REMOTE_DIR.parent / "experiment.zip"
             archive_args = "path={} dest={} format=zip".format(EXPERIMENT_REMOTE_DIR, zip_path)
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="archive",
-                                                       module_args=archive_args, forks=10, cmdline="--become")
+            run = InventoryConfiguration.run_inventory(inventory, host_pattern="all", module="archive",
+                                                       module_args=archive_args, forks=opts.forks, cmdline="--become",
+                                                       executor=opts.executor, envvars=envvars, retries=opts.retries,
+                                                       on_host_task=self.get_host_task_recorder(host_tasks),
+                                                       known_hosts_path=known_hosts_path)
             print(run)
 
             fetch_args = "src={} dest={} mode=666".format(zip_path, data_path)
-            run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="all", module="fetch",
-                                                       module_args=fetch_args, forks=10, cmdline="--become")
+            run = InventoryConfiguration.run_inventory(inventory, host_pattern="all", module="fetch",
+                                                       module_args=fetch_args, forks=opts.forks, cmdline="--become",
+                                                       executor=opts.executor, envvars=envvars, retries=opts.retries,
+                                                       on_host_task=self.get_host_task_recorder(host_tasks),
+                                                       known_hosts_path=known_hosts_path)
             print(run)
+            CloudMeasurementDB.add_host_tasks(db_path=DB_PATH, experiment_id=experiment_id, command="retrieve_data",
+                                              records=host_tasks)
             instances_data = CloudMeasurementDB.get_instances_data(db_path=DB_PATH, experiment_id=experiment_id,
                                                                    db_columns=["PUBLIC_IP"])
             instances_ips = [d[0] for d in instances_data]
@@ -363,12 +525,16 @@ class CloudMeasurementRunner(object):
                     EXPERIMENTS_PATH / experiment_id / ip / "home/ubuntu/experiment.zip",
                     EXPERIMENTS_PATH / experiment_id / ip / "experiment.zip")
 
-                run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="localhost", module="copy",
-                                                           module_args=copy_args, forks=1, cmdline="")
+                run = InventoryConfiguration.run_inventory(inventory, host_pattern="localhost", module="copy",
+                                                           module_args=copy_args, forks=1, cmdline="",
+                                                           executor=opts.executor, envvars=envvars,
+                                                           known_hosts_path=known_hosts_path)
                 print(run)
                 raw_args = "rm -rf {}".format(EXPERIMENTS_PATH / experiment_id / ip / "home")
-                run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="localhost", module="raw",
-                                                           module_args=raw_args, forks=1, cmdline="")
+                run = InventoryConfiguration.run_inventory(inventory, host_pattern="localhost", module="raw",
+                                                           module_args=raw_args, forks=1, cmdline="",
+                                                           executor=opts.executor, envvars=envvars,
+                                                           known_hosts_path=known_hosts_path)
                 print(run)
 
             exit(0)
@@ -382,7 +548,8 @@ class CloudMeasurementRunner(object):
 
             raw_args = "cp -R {} {}".format(EXPERIMENTS_PATH / experiment_id, destination_path)
             run = InventoryConfiguration.run_inventory(ansible_file, host_pattern="localhost", module="raw",
-                                                       module_args=raw_args, forks=1, cmdline="")
+                                                       module_args=raw_args, forks=1, cmdline="",
+                                                       executor=opts.executor)
 
             print(run)
             experiment_keys = CloudMeasurementDB.get_experiment_columns(db_path=DB_PATH)
@@ -404,7 +571,7 @@ class CloudMeasurementRunner(object):
             if row is None:
                 raise ValueError("{} does not exists".format(opts.delete_experiment))
 
-            cloud_util = row[1]
+            cloud_utils = self.get_experiment_cloud_utils(cloud_util=row[1], command="-d")
             create_experiment = row[2]
             experiments_class = EXPERIMENTS[create_experiment]
             dict_region_vpc = CloudMeasurementDB.get_regions_dict(experiment_id=experiment_id, db_path=DB_PATH)
@@ -413,10 +580,42 @@ class CloudMeasurementRunner(object):
 
             print("* DELETING THE EXPERIMENT {} - Please DO NOT close this terminal before it is completed"
                   ", you may have inconsistent data otherwise".format(experiment_id))
-            experiments_class.purge_experiment(dict_region_vpc=dict_region_vpc, cloud_utils=CLOUDUTILS[cloud_util])
+            transit_gateways = CloudMeasurementDB.get_transit_gateways_dict(experiment_id=experiment_id,
+                                                                            db_path=DB_PATH)
+            routes = CloudMeasurementDB.get_routes(experiment_id=experiment_id, db_path=DB_PATH)
+            experiments_class.purge_experiment(dict_region_vpc=dict_region_vpc, cloud_utils=cloud_utils,
+                                               transit_gateways=transit_gateways, routes=routes,
+                                               placement_groups_name=experiment_id if row[4] else None)
+            self.save_api_calls(db_path=DB_PATH, experiment_id=experiment_id, cloud_utils=cloud_utils)
             CloudMeasurementDB.delete_experiment(experiment_id=experiment_id, db_path=DB_PATH)
             exit(0)
 
+        if opts.api_stats:
+            experiment_id = opts.api_stats
+            headers_up = ["PHASE", "OPERATION", "CALLS", "TOTAL_LATENCY", "AVG_LATENCY", "MAX_LATENCY", "RETRIES",
+                          "ERRORS"]
+            rows = CloudMeasurementDB.get_api_calls_stats(experiment_id=experiment_id, db_path=DB_PATH)
+            if len(rows) == 0:
+                print("NO API CALLS RECORDED FOR THE EXPERIMENT {}".format(experiment_id))
+            else:
+                rows = [row[:3] + tuple(round(latency, 3) for latency in row[3:6]) + row[6:] for row in rows]
+                table = tt.to_string(rows, header=headers_up, style=tt.styles.ascii_thin_double)
+                print(table)
+            exit(0)
+
+        if opts.host_stats:
+            experiment_id = opts.host_stats
+            headers_up = ["COMMAND", "HOST", "TASKS", "TOTAL_DURATION", "MAX_DURATION", "ATTEMPTS", "FAILED",
+                          "UNREACHABLE"]
+            rows = CloudMeasurementDB.get_host_tasks_stats(experiment_id=experiment_id, db_path=DB_PATH)
+            if len(rows) == 0:
+                print("NO ANSIBLE TASKS RECORDED FOR THE EXPERIMENT {}".format(experiment_id))
+            else:
+                rows = [row[:3] + tuple(round(duration or 0, 3) for duration in row[3:5]) + row[5:] for row in rows]
+                table = tt.to_string(rows, header=headers_up, style=tt.styles.ascii_thin_double)
+                print(table)
+            exit(0)
+
         if opts.plot_data:
             reg_exp = r"\S+(\,\d{1,2}\/\d{1,2}\/\d{4}\-\d{1,2}\:\d{1,2}\:\d{1,2}){2},\d+[mhdw]{1}$"
             if not match(reg_exp, opts.plot_data):
@@ -486,46 +685,225 @@ class CloudMeasurementRunner(object):
 
         return experiment_id, destination_path
 
+    def build_experiment(self, experiment, options, verbose=None):
+        """
+        Create the missing steps of the experiment, every completed step is saved in the db as a checkpoint
+        :param experiment: MultiregionalTrace or RegionalTrace, new or resumed
+        :param options: dict with experiment, cloud_util, private_ip and key_pair_id
+        :param verbose: print the client pool and rate limiter stats
+        :return: None
+        """
+        experiment.on_checkpoint = self.get_checkpoint_saver(db_path=DB_PATH, options=options)
+        experiment.images = CloudMeasurementDB.get_images_dict(db_path=DB_PATH, cloud_util=options["cloud_util"])
+        list_of_regions = experiment.list_of_regions
+        try:
+            print("* CREATING THE VPCS IN {}".format(list_of_regions))
+            experiment_data = experiment.create_experiment_environment()
+            print(experiment_data)
+
+            print("* CREATING THE INSTANCES {}".format(list_of_regions))
+            experiment_data = experiment.create_instances(key_pair_id=options["key_pair_id"])
+            if options["private_ip"]:
+                experiment.create_peering_connection()
+        except Exception:
+            if experiment.experiment_id is not None:
+                print("* THE CREATION OF THE EXPERIMENT {0} FAILED, the completed steps are saved.\n"
+                      "  you can resume it with: cm --resume {0}".format(experiment.experiment_id))
+            raise
+        finally:
+            if experiment.experiment_id is not None:
+                self.save_api_calls(db_path=DB_PATH, experiment_id=experiment.experiment_id,
+                                    cloud_utils=experiment.cloud_utils)
+
+        experiment_id = experiment_data["experiment_id"]
+        ansible_file = ANSIBLE_PATH / (experiment_id + ".cfg")
+        self.save_inventory(ansible_path=ansible_file, experiment_data=experiment_data)
+        CloudMeasurementDB.update_experiment_status(experiment_id=experiment_id, db_path=DB_PATH,
+                                                    status="VPCS CONFIGURED")
+        print("* API CALLS PER PHASE: {}".format(experiment.api_calls))
+        if verbose and hasattr(experiment.cloud_utils, "get_pool_stats"):
+            print("* CLIENT POOL: {}".format(experiment.cloud_utils.get_pool_stats()))
+            print("* RATE LIMITER: {}".format(experiment.cloud_utils.get_rate_limiter_metrics()["total"]))
+        print("* EXPERIMENT CORRECTLY CREATED! \n "
+              " you can start the experiment with: cm -s {}".format(experiment_id))
+
+    @staticmethod
+    def get_experiment_cloud_utils(cloud_util, command):
+        """
+        :param cloud_util: cloud util of an experiment saved in the db
+        :param command: cm command that works on the resources of the experiment, shown in the error
+        :return: cloud utils class of the experiment
+        """
+        if cloud_util == "fake":
+            # the resources of a fake experiment lived in the memory of the cm run that created it
+            raise ValueError("{} can not be used with the experiments of the fake cloud".format(command))
+        return CLOUDUTILS[cloud_util]
+
+    @staticmethod
+    def get_warm_pool(opts):
+        if opts.cloud_util == "fake":
+            # the fake cloud lives in the memory of a single cm run
+            raise ValueError("the warm pool can not be used with the fake cloud")
+        return WarmPool(db_path=DB_PATH, cloud_util=CLOUDUTILS[opts.cloud_util], key_pair_id=opts.key_pair_id,
+                        instances_per_az=opts.instances_per_az,
+                        images=CloudMeasurementDB.get_images_dict(db_path=DB_PATH, cloud_util=opts.cloud_util))
+
+    @staticmethod
+    def start_pool_refill(opts):
+        """
+        Refill the warm pool in a detached cm run, so this one can exit. Its output goes to WARM_POOL_LOG_PATH.
+        """
+        args = [sys.executable, sys.argv[0], "--refill_pool", "--warm_pool", str(opts.warm_pool),
+                "--regions", opts.regions, "--cloud_util", opts.cloud_util, "--key_pair_id", opts.key_pair_id,
+                "--instances_per_az", str(opts.instances_per_az)]
+        if opts.machine_type_mapping is not None:
+            args += ["--machine_type_mapping", opts.machine_type_mapping]
+        if opts.az_mapping is not None:
+            args += ["--az_mapping", opts.az_mapping]
+        with open(str(WARM_POOL_LOG_PATH), "a") as log_file:
+            Popen(args, stdin=DEVNULL, stdout=log_file, stderr=STDOUT, start_new_session=True)
+        print("* REFILLING THE WARM POOL IN BACKGROUND, log: {}".format(WARM_POOL_LOG_PATH))
+
+    def get_checkpoint_saver(self, db_path, options):
+        """
+        :return: callable (experiment_id, step, region, data) that saves the checkpoints of an experiment in the db,
+                 together with the experiment, the regions, the instances and the private network of the steps
+        """
+        def save_checkpoint(experiment_id, step, region, data):
+            if data is None:
+                CloudMeasurementDB.delete_checkpoint(db_path=db_path, experiment_id=experiment_id, step=step,
+                                                     region=region)
+                if step == "instances":
+                    CloudMeasurementDB.delete_region_instances(db_path=db_path, experiment_id=experiment_id,
+                                                               region=region)
+                elif step == "peering":
+                    CloudMeasurementDB.delete_private_network(db_path=db_path, experiment_id=experiment_id)
+                return
+            CloudMeasurementDB.add_checkpoint(db_path=db_path, experiment_id=experiment_id, step=step, region=region,
+                                              data=data, timestamp=str(datetime.now()))
+            if step == "experiment":
+                CloudMeasurementDB.add_checkpoint(db_path=db_path, experiment_id=experiment_id, step="options",
+                                                  region=None, data=options, timestamp=str(datetime.now()))
+                if CloudMeasurementDB.get_experiment(experiment_id=experiment_id, db_path=db_path) is None:
+                    ansible_file = ANSIBLE_PATH / (experiment_id + ".cfg")
+                    self.save_experiment(db_path=db_path, experiment_id=experiment_id, cloud_util=options["cloud_util"],
+                                         experiment_type=options["experiment"], peered=int(options["private_ip"]),
+                                         network_optimized=int(data["parameters"]["network_optimized"]),
+                                         creation_date=str(datetime.now()),
+                                         starting_date="None", status="CREATING", ansible_file=str(ansible_file),
+                                         cidr_block=data["cidr_block"])
+            elif step == "vpc":
+                CloudMeasurementDB.add_region(db_path=db_path, experiment_id=experiment_id, region=region,
+                                              vpc_id=data["vpc_id"], status="VPC UP")
+            elif step == "instances":
+                CloudMeasurementDB.delete_region_instances(db_path=db_path, experiment_id=experiment_id, region=region)
+                self.save_instances(db_path=db_path, experiment_id=experiment_id, region=region, instances=data)
+            elif step == "peering":
+                CloudMeasurementDB.delete_private_network(db_path=db_path, experiment_id=experiment_id)
+                self.save_private_network(db_path=db_path, experiment_id=experiment_id,
+                                          transit_gateways=data["transit_gateways"], routes=data["routes"])
+        return save_checkpoint
+
     @staticmethod
     def save_experiment(**kwargs):
         CloudMeasurementDB.add_experiment(**kwargs)
 
     @staticmethod
-    def save_regions(db_path, experiment_data):
-        list_of_regions = list(experiment_data.keys())
-        list_of_regions.remove("cidr_block")
-        list_of_regions.remove("experiment_id")
+    def save_instances(db_path, experiment_id, region, instances):
+        for instance_dict in instances:
+            instance_id = instance_dict["instance_id"]
+            machine_type = instance_dict["machine_type"]
+            public_address = instance_dict["public_address"]
+            private_address = instance_dict["private_address"]
+            availability_zone = instance_dict["availability_zone"]
+            vpc_id = instance_dict["vpc_id"]
+            status = "RUNNING"
+            key_pair_id = instance_dict["key_pair_id"]
+            CloudMeasurementDB.add_instance(db_path=db_path, instance_id=instance_id, machine_type=machine_type,
+                                            experiment_id=experiment_id, region=region,
+                                            availability_zone=availability_zone, vpc_id=vpc_id, status=status,
+                                            public_address=public_address, private_address=private_address,
+                                            key_pair_id=key_pair_id)
 
-        experiment_id = experiment_data["experiment_id"]
-        for region in list_of_regions:
-            for vpc in experiment_data[region]:
-                vpc_id = vpc["vpc_id"]
-                status = "VPC UP"
-                CloudMeasurementDB.add_region(db_path=db_path, experiment_id=experiment_id, region=region,
-                                              vpc_id=vpc_id, status=status)
+    @staticmethod
+    def get_inventory(experiment_id):
+        """
+        :return: tuple (inventory of the experiment built from the instances in the db, environment of its ansible
+                 runs with the ansible.cfg written by cm -c, known hosts of the experiment)
+        """
+        inventory = DynamicInventory(db_path=DB_PATH).get_inventory(experiment_id=experiment_id)
+        if not inventory["all"]["hosts"]:
+            raise ValueError("no instances with a public ip for the experiment {} in the DB".format(experiment_id))
+        ansible_file = CloudMeasurementDB.get_ansible_file(db_path=DB_PATH, experiment_id=experiment_id)
+        if ansible_file is None:
+            ansible_file = ANSIBLE_PATH / (experiment_id + ".cfg")
+        envvars = InventoryConfiguration.get_envvars(Path(ansible_file))
+        return inventory, envvars, InventoryConfiguration.get_known_hosts_path(ansible_file)
 
     @staticmethod
-    def save_instances(db_path, experiment_data):
-        list_of_regions = list(experiment_data.keys())
-        list_of_regions.remove("cidr_block")
-        list_of_regions.remove("experiment_id")
-        experiment_id = experiment_data["experiment_id"]
+    def get_host_task_recorder(records):
+        """
+        :param records: list, the completed tasks of every host are appended to it
+        :return: callable (dict of the task), it also shows the failed and the unreachable hosts as soon as they fail
+        """
+        def on_host_task(record):
+            records.append(record)
+            if record["status"] in ("failed", "unreachable"):
+                print("* {} {} AT TASK: {} (ATTEMPT {})".format(record["host"], record["status"].upper(),
+                                                                record["task"], record["attempt"]))
+
+        return on_host_task
 
-        for region in list_of_regions:
-            for instance_dict in experiment_data[region]:
-                instance_id = instance_dict["instance_id"]
-                machine_type = instance_dict["machine_type"]
-                public_address = instance_dict["public_address"]
-                private_address = instance_dict["private_address"]
-                availability_zone = instance_dict["availability_zone"]
-                vpc_id = instance_dict["vpc_id"]
-                status = "RUNNING"
-                key_pair_id = instance_dict["key_pair_id"]
-                CloudMeasurementDB.add_instance(db_path=db_path, instance_id=instance_id, machine_type=machine_type,
-                                                experiment_id=experiment_id, region=region,
-                                                availability_zone=availability_zone, vpc_id=vpc_id, status=status,
-                                                public_address=public_address, private_address=private_address,
-                                                key_pair_id=key_pair_id)
+    @staticmethod
+    def wait_instances_ready(cloud_utils, instances_data_dict, on_ready):
+        """
+        Follow the instances of every region with an InstancePipeline, until their sshd answers
+        :param cloud_utils: cloud utils class
+        :param instances_data_dict: dict {instance_id: dict with the region}
+        :param on_ready: callable (instance_id, instance_data), called as soon as an instance is reachable
+        :return: None
+        """
+        regions = defaultdict(list)
+        for instance_id, instance in instances_data_dict.items():
+            regions[instance["region"]].append(instance_id)
+        with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            futures = [executor.submit(InstancePipeline(cloud_utils=cloud_utils, region=region,
+                                                        instances_id_list=instances_id_list,
+                                                        ready_stage="ssh_reachable", on_ready=on_ready).run)
+                       for region, instances_id_list in regions.items()]
+        for future in futures:
+            future.result()
+
+    def provision_image(self, instance_dict):
+        """
+        Install the tools in the builder instance of the probe image
+        """
+        ansible_file = ANSIBLE_PATH / "image_builder.cfg"
+        inventory_configuration = InventoryConfiguration(inventory_path=ansible_file)
+        inventory_configuration.add_host(host_id=instance_dict["instance_id"], region="builder",
+                                         public_ip=instance_dict["public_address"], user="ubuntu", password=None)
+        inventory_configuration.make_inventory()
+        startup_playbook = StartupPlaybook(playbook_dir=ANSIBLE_PATH / "image_builder")
+        startup_playbook.add_host(ip=instance_dict["public_address"], destinations=[])
+        playbook_path = startup_playbook.make_playbook()
+        stats, _ = StartupPlaybook.run(playbook_path=playbook_path, inventory_path=ansible_file, forks=1,
+                                       tags="tools")
+        if not stats or stats.get("failures") or stats.get("dark"):
+            raise RuntimeError("the installation of the tools in the image builder failed: {}".format(stats))
+
+    @staticmethod
+    def save_private_network(db_path, experiment_id, transit_gateways, routes):
+        CloudMeasurementDB.add_transit_gateways(db_path=db_path, experiment_id=experiment_id,
+                                                transit_gateways=transit_gateways)
+        CloudMeasurementDB.add_routes(db_path=db_path, experiment_id=experiment_id, routes=routes)
+
+    @staticmethod
+    def save_api_calls(db_path, experiment_id, cloud_utils):
+        if not hasattr(cloud_utils, "get_api_records"):
+            return
+        CloudMeasurementDB.add_api_calls(db_path=db_path, experiment_id=experiment_id,
+                                         records=cloud_utils.get_api_records())
+        cloud_utils.clear_api_records()
 
     @staticmethod
     def save_inventory(ansible_path, experiment_data):
@@ -542,35 +920,6 @@ class CloudMeasurementRunner(object):
 
         inventory_configuration.make_inventory()
 
-    @staticmethod
-    def make_traceroute(path, list_of_destinations, src_ports, dst_ports):
-        src_start, src_end = [int(i) for i in src_ports.split("-")]
-        dst_start, dst_end = [int(i) for i in dst_ports.split("-")]
-        tr_string = '''#!/bin/bash \n'''
-        for ip in list_of_destinations:
-            ip_name = "ip_" + ip + "date_"
-            ip_name = ip_name.replace(".", "_")
-            for src_port in range(src_start, src_end):
-                for dst_port in range(dst_start, dst_end):
-                    tr_string += 'sudo paris-traceroute -n -s {} -p {} -U -m 60 {} |' \
-                         ' tee {}$(date +"%M_%k_%d_%m_%Y" |' \
-                         ' tr -d \' \').log > {}$(date +"%M_%k_%d_%m_%Y" |' \
-                         ' tr -d \' \')_s{}_p{}.log \n'.format(src_port, dst_port, ip,
-                                                       EXPERIMENT_REMOTE_DIR / ip_name,
-                                                       EXPERIMENT_BK_REMOTE_DIR / ip_name, src_port, dst_port)
-
-        with open(path, "w") as f:
-            f.write(tr_string)
-
-        return path
-
-    @staticmethod
-    def make_crontab_file(path):
-        ct_string = '''*/1 * * * * {}\n\n'''.format(TRACEROUTE_SCRIPT_PATH)
-        with open(path, "w") as f:
-            f.write(ct_string)
-        return path
-
 def convert_json_to_dict(json_path):
     if json_path is None:
         return None
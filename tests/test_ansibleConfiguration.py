@@ -1,5 +1,7 @@
 import unittest
+from configparser import RawConfigParser
 from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration, Path
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
 
 class MyTestCase(unittest.TestCase):
 
@@ -65,6 +67,85 @@ class MyTestCase(unittest.TestCase):
                         'ip_3 ansible_user=user_3 ansible_password=password_2 # host_id=id_3\n'
         self.assertEqual(text, expected_text)
 
+    def test_make_config(self):
+        test_path = Path("/tmp/test.cfg")
+        config_path = InventoryConfiguration.get_config_path(test_path)
+        if config_path.is_file():
+            config_path.unlink()
+        self.assertEqual(InventoryConfiguration.get_envvars(test_path), {})
+        ic = InventoryConfiguration(inventory_path=test_path)
+        ic.add_host(host_id="host_id1", region="region-1", public_ip="0.0.0.0")
+        ic.make_inventory()
+        self.assertEqual(InventoryConfiguration.get_envvars(test_path), {"ANSIBLE_CONFIG": str(config_path)})
+        config = RawConfigParser()
+        config.read(str(config_path))
+        self.assertEqual(config.get("defaults", "gathering"), "explicit")
+        self.assertEqual(config.get("defaults", "fact_caching_connection"), "/tmp/test.facts")
+        self.assertEqual(config.getboolean("ssh_connection", "pipelining"), True)
+        self.assertIn("ControlMaster=auto", config.get("ssh_connection", "ssh_args"))
+        self.assertIn("ControlPersist=", config.get("ssh_connection", "ssh_args"))
+        self.assertEqual(config.getboolean("defaults", "host_key_checking"), True)
+        self.assertIn("StrictHostKeyChecking=accept-new -o UserKnownHostsFile=/tmp/test.known_hosts",
+                      config.get("ssh_connection", "ssh_args"))
+        config_path.unlink()
+
+    def test_event_handler(self):
+        records = []
+        handler = InventoryConfiguration.get_event_handler(records.append, attempt=1)
+        handler({"event": "playbook_on_task_start", "event_data": {"task": "copy the crontab"}})
+        handler({"event": "runner_on_ok", "event_data": {"host": "ip_1", "task": "copy the crontab",
+                                                         "duration": 1.5}})
+        handler({"event": "runner_on_unreachable", "event_data": {"host": "ip_2", "task": "copy the crontab"}})
+        self.assertEqual([(r["host"], r["status"], r["duration"], r["attempt"]) for r in records],
+                         [("ip_1", "ok", 1.5, 1), ("ip_2", "unreachable", None, 1)])
+
+    def test_run_with_retries(self):
+        runs = []
+
+        def run(hosts, attempt):
+            runs.append(hosts)
+            if attempt == 0:
+                return {"ok": {"ip_1": 2}, "failures": {"ip_2": 1}, "dark": {"ip_3": 1},
+                        "processed": {"ip_1": 1, "ip_2": 1, "ip_3": 1}}
+            return {"ok": {"ip_2": 2}, "failures": {}, "dark": {"ip_3": 1}, "processed": {"ip_2": 1, "ip_3": 1}}
+
+        stats = InventoryConfiguration.run_with_retries(run, retries=2, backoff=0)
+        # only the failed and the unreachable hosts are run again
+        self.assertEqual(runs, [None, ["ip_2", "ip_3"], ["ip_3"]])
+        self.assertEqual(stats["ok"], {"ip_1": 2, "ip_2": 2})
+        self.assertEqual(stats["failures"], {})
+        self.assertEqual(stats["dark"], {"ip_3": 1})
+        self.assertEqual(len(stats["processed"]), 3)
+
+    def test_run_inventory_retries(self):
+        flag_path = Path("/tmp/test_ansibleConfiguration.flag")
+        if flag_path.is_file():
+            flag_path.unlink()
+        records = []
+        # the command fails the first time only
+        stats = InventoryConfiguration.run_inventory(Path("/tmp/test.cfg"), host_pattern="localhost", module="raw",
+                                                     module_args="test -f {0} || (touch {0}; exit 1)".format(flag_path),
+                                                     cmdline="", executor="ssh", retries=1, backoff=0,
+                                                     on_host_task=records.append)
+        flag_path.unlink()
+        self.assertEqual(stats["ok"], {"localhost": 1})
+        self.assertEqual(stats["failures"], {})
+        self.assertEqual([(r["status"], r["attempt"]) for r in records], [("failed", 0), ("ok", 1)])
+
+    def test_host_tasks_stats(self):
+        db_path = Path("/tmp/test_ansibleConfiguration.db")
+        CloudMeasurementDB.create_db(db_path)
+        records = [{"host": "ip_1", "task": "task_1", "status": "ok", "duration": 1.0, "attempt": 0, "timestamp": 0},
+                   {"host": "ip_2", "task": "task_1", "status": "failed", "duration": 5.0, "attempt": 0,
+                    "timestamp": 0},
+                   {"host": "ip_2", "task": "task_1", "status": "ok", "duration": 4.0, "attempt": 1, "timestamp": 0}]
+        CloudMeasurementDB.add_host_tasks(db_path=db_path, experiment_id="EXP", command="start_experiment",
+                                          records=records)
+        rows = CloudMeasurementDB.get_host_tasks_stats(experiment_id="EXP", db_path=db_path)
+        db_path.unlink()
+        self.assertEqual(rows, [("start_experiment", "ip_2", 2, 9.0, 5.0, 2, 1, 0),
+                                ("start_experiment", "ip_1", 1, 1.0, 1.0, 1, 0, 0)])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Thread
+from pathlib import Path
+from botocore.stub import Stubber
+from CloudMeasurement.experiments.awsUtils import ApiCallRecorder, ClientPool
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+
+DB_PATH = Path("/tmp/test_apiInstrumentation.db")
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = ApiCallRecorder()
+        self.client = ClientPool(recorder=self.recorder).get_client(region="eu-central-1")
+
+    def tearDown(self):
+        if DB_PATH.is_file():
+            DB_PATH.unlink()
+
+    def test_calls_recorded_with_phase(self):
+        with Stubber(self.client) as stubber:
+            stubber.add_response("describe_vpcs", {"Vpcs": []})
+            stubber.add_client_error("delete_vpc", service_error_code="DependencyViolation")
+            with self.recorder.record_phase("teardown"):
+                self.client.describe_vpcs()
+                with self.assertRaises(Exception):
+                    self.client.delete_vpc(VpcId="vpc-1")
+
+        records = self.recorder.get_records()
+        self.assertEqual([r["operation"] for r in records], ["DescribeVpcs", "DeleteVpc"])
+        self.assertEqual({r["phase"] for r in records}, {"teardown"})
+        self.assertEqual({r["region"] for r in records}, {"eu-central-1"})
+        self.assertIsNone(records[0]["error"])
+        self.assertEqual(records[1]["error"], "DependencyViolation")
+        self.assertEqual(self.recorder.phase, "other")
+
+    def test_phase_per_thread(self):
+        barrier = Barrier(2)
+
+        def record(phase, operation):
+            with self.recorder.record_phase(phase):
+                # both the phases are set before any call is recorded
+                barrier.wait()
+                self.recorder.add_record(operation=operation, region="eu-central-1", phase=self.recorder.phase,
+                                         latency=0)
+
+        threads = [Thread(target=record, args=("teardown", "DeleteVpc")),
+                   Thread(target=record, args=("instance_launch", "RunInstances"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({r["operation"]: r["phase"] for r in self.recorder.get_records()},
+                         {"DeleteVpc": "teardown", "RunInstances": "instance_launch"})
+        self.assertEqual(self.recorder.phase, "other")
+
+    def test_bind_phase(self):
+        with self.recorder.record_phase("peering"):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                bound_phase = executor.submit(self.recorder.bind_phase(lambda: self.recorder.phase)).result()
+                unbound_phase = executor.submit(lambda: self.recorder.phase).result()
+        self.assertEqual((bound_phase, unbound_phase), ("peering", "other"))
+
+    def test_summarize(self):
+        self.recorder.add_record(operation="RunInstances", region="eu-central-1", phase="instance_launch", latency=2)
+        self.recorder.add_record(operation="RunInstances", region="eu-west-1", phase="instance_launch", latency=1,
+                                 retries=2, error="RequestLimitExceeded")
+        summary = ApiCallRecorder.summarize(self.recorder.get_records())
+        self.assertEqual(summary[("instance_launch", "RunInstances")],
+                         {"calls": 2, "latency": 3, "max_latency": 2, "retries": 2, "errors": 1})
+
+    def test_api_calls_stats_in_db(self):
+        CloudMeasurementDB.create_db(DB_PATH)
+        self.recorder.add_record(operation="CreateVpc", region="eu-central-1", phase="vpc_creation", latency=0.5)
+        self.recorder.add_record(operation="RunInstances", region="eu-central-1", phase="instance_launch", latency=3)
+        CloudMeasurementDB.add_api_calls(db_path=DB_PATH, experiment_id="EXP", records=self.recorder.get_records())
+        rows = CloudMeasurementDB.get_api_calls_stats(experiment_id="EXP", db_path=DB_PATH)
+        self.assertEqual([row[:3] for row in rows], [("instance_launch", "RunInstances", 1),
+                                                     ("vpc_creation", "CreateVpc", 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
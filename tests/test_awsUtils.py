@@ -0,0 +1,61 @@
+import unittest
+from botocore.stub import Stubber
+from CloudMeasurement.experiments.awsUtils import AWSUtils
+from CloudMeasurement.experiments.awsUtils.awsUtils import TRUSTED_HANDLES
+
+REGION = "eu-central-1"
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        TRUSTED_HANDLES.clear()
+
+    def test_check_resource_exists(self):
+        with Stubber(AWSUtils.get_client(region=REGION)) as stubber:
+            stubber.add_response("describe_subnets", {"Subnets": [{"SubnetId": "subnet-1"}]},
+                                 {"SubnetIds": ["subnet-1"]})
+            AWSUtils.check_if_resource_id_exists_in_region(resource_id="subnet-1", region=REGION,
+                                                           describe_operation="describe_subnets",
+                                                           ids_parameter="SubnetIds", description="Subnet id")
+            stubber.assert_no_pending_responses()
+
+    def test_check_resource_not_found(self):
+        with Stubber(AWSUtils.get_client(region=REGION)) as stubber:
+            stubber.add_client_error("describe_route_tables", service_error_code="InvalidRouteTableID.NotFound")
+            with self.assertRaises(ValueError):
+                AWSUtils.check_if_route_table_id_exists_in_region(route_table_id="rtb-1", region=REGION)
+
+    def test_trusted_resource_skips_lookup(self):
+        AWSUtils.trust_resource(region=REGION, resource_id="rtb-1")
+        with Stubber(AWSUtils.get_client(region=REGION)):
+            # no response is queued, any call to the api would fail
+            AWSUtils.check_if_route_table_id_exists_in_region(route_table_id="rtb-1", region=REGION)
+
+    def test_describe_instances_data(self):
+        instances = [{"InstanceId": "i-{}".format(n), "PublicIpAddress": "1.1.1.{}".format(n),
+                      "PrivateIpAddress": "10.0.0.{}".format(n), "Placement": {"AvailabilityZone": "eu-central-1a"},
+                      "State": {"Name": "running", "Code": 16}} for n in range(3)]
+        with Stubber(AWSUtils.get_client(region=REGION)) as stubber:
+            stubber.add_response("describe_instances", {"Reservations": [{"Instances": instances}]})
+            data = AWSUtils.describe_instances_data(region=REGION, instances_id_list=["i-0", "i-1", "i-2"])
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data["i-1"]["public_address"], "1.1.1.1")
+        self.assertEqual(data["i-2"]["availability_zone"], "eu-central-1a")
+
+    def test_count_running_standard_vcpus(self):
+        instances = [{"InstanceId": "i-1", "InstanceType": "t3.small", "CpuOptions": {"CoreCount": 1,
+                                                                                      "ThreadsPerCore": 2}},
+                     {"InstanceId": "i-2", "InstanceType": "p3.2xlarge", "CpuOptions": {"CoreCount": 4,
+                                                                                        "ThreadsPerCore": 2}},
+                     {"InstanceId": "i-3", "InstanceType": "c5.large", "InstanceLifecycle": "spot",
+                      "CpuOptions": {"CoreCount": 1, "ThreadsPerCore": 2}}]
+        with Stubber(AWSUtils.get_client(region=REGION)) as stubber:
+            stubber.add_response("describe_instances", {"Reservations": [{"Instances": instances[:2]}],
+                                                        "NextToken": "page-2"})
+            stubber.add_response("describe_instances", {"Reservations": [{"Instances": instances[2:]}]})
+            self.assertEqual(AWSUtils.count_running_standard_vcpus(region=REGION), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import gc
+import unittest
+import weakref
+from threading import Thread
+from botocore.stub import Stubber
+from CloudMeasurement.experiments.awsUtils import ClientPool
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_client_reused(self):
+        pool = ClientPool()
+        c1 = pool.get_client(region="eu-central-1")
+        c2 = pool.get_client(region="eu-central-1")
+        self.assertIs(c1, c2)
+        self.assertEqual(pool.get_stats()["clients_created"], 1)
+        self.assertEqual(pool.get_stats()["clients_reused"], 1)
+
+    def test_client_keyed_by_region(self):
+        pool = ClientPool()
+        c1 = pool.get_client(region="eu-central-1")
+        c2 = pool.get_client(region="eu-west-1")
+        self.assertIsNot(c1, c2)
+        self.assertEqual(pool.get_stats()["clients_created"], 2)
+        self.assertEqual(pool.get_stats()["sessions_created"], 1)
+
+    def test_resource_per_thread(self):
+        pool = ClientPool()
+        r1 = pool.get_resource(region="eu-central-1")
+        resources = []
+        t = Thread(target=lambda: resources.append(pool.get_resource(region="eu-central-1")))
+        t.start()
+        t.join()
+        self.assertIsNot(r1, resources[0])
+        self.assertIs(r1, pool.get_resource(region="eu-central-1"))
+        self.assertEqual(pool.get_stats()["resources_created"], 2)
+        self.assertEqual(pool.get_stats()["resources_reused"], 1)
+
+    def test_resource_dropped_with_thread(self):
+        pool = ClientPool()
+        resources = []
+        t = Thread(target=lambda: resources.append(weakref.ref(pool.get_resource(region="eu-central-1"))))
+        t.start()
+        t.join()
+        gc.collect()
+        # the pool does not keep the resources of the finished threads, their ids can be reused
+        self.assertIsNone(resources[0]())
+
+    def test_api_calls_counted(self):
+        pool = ClientPool()
+        client = pool.get_client(region="eu-central-1")
+        with Stubber(client) as stubber:
+            stubber.add_response("describe_regions", {"Regions": []})
+            stubber.add_response("describe_regions", {"Regions": []})
+            client.describe_regions()
+            client.describe_regions()
+        self.assertEqual(pool.get_api_calls(), {"DescribeRegions": 2})
+
+    def test_clear(self):
+        pool = ClientPool()
+        pool.get_client(region="eu-central-1")
+        r1 = pool.get_resource(region="eu-central-1")
+        pool.clear()
+        self.assertEqual(pool.get_stats()["clients_created"], 0)
+        self.assertIsNot(pool.get_resource(region="eu-central-1"), r1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import sqlite3
+import unittest
+from pathlib import Path
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+
+DB_PATH = Path("/tmp/test_cloudMeasurementDB.db")
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        CloudMeasurementDB.create_db(DB_PATH)
+
+    def tearDown(self):
+        if DB_PATH.is_file():
+            DB_PATH.unlink()
+
+    def test_get_experiment(self):
+        self.assertIsNone(CloudMeasurementDB.get_experiment(experiment_id="EXP", db_path=DB_PATH))
+        CloudMeasurementDB.add_experiment(db_path=DB_PATH, experiment_id="EXP", cloud_util="fake",
+                                          experiment_type="multiregional", peered=1, network_optimized=0,
+                                          creation_date="2020-10-10", starting_date="None", status="CREATING",
+                                          ansible_file="/tmp/EXP.cfg", cidr_block="10.0.0.0/16")
+        self.assertEqual(CloudMeasurementDB.get_experiment(experiment_id="EXP", db_path=DB_PATH),
+                         ("EXP", "fake", "multiregional", 1, 0, "2020-10-10", "None", "CREATING", "/tmp/EXP.cfg",
+                          "10.0.0.0/16"))
+        self.assertIsNone(CloudMeasurementDB.get_experiment(experiment_id="' OR '1'='1", db_path=DB_PATH))
+
+    def test_duplicate_instance(self):
+        instance = {"machine_type": "t3.small", "experiment_id": "EXP", "region": "eu-west-1",
+                    "availability_zone": "eu-west-1a", "vpc_id": "vpc-1", "status": "running",
+                    "public_address": "1.1.1.1", "private_address": "10.0.0.1", "key_pair_id": "id_rsa"}
+        CloudMeasurementDB.add_instance(db_path=DB_PATH, instance_id="i-1", **instance)
+        with self.assertRaises(sqlite3.IntegrityError):
+            CloudMeasurementDB.add_instance(db_path=DB_PATH, instance_id="i-1", **instance)
+        # the failed insert does not keep the db locked
+        CloudMeasurementDB.add_instance(db_path=DB_PATH, instance_id="i-2", **instance)
+        self.assertEqual(len(CloudMeasurementDB.get_instances_experiment(db_path=DB_PATH, experiment_id="EXP")), 2)
+
+    def test_images(self):
+        CloudMeasurementDB.add_images(db_path=DB_PATH, cloud_util="fake", images={"eu-west-1": "ami-1"},
+                                      image_name="cm-probe-1", creation_date="2020-10-10")
+        self.assertEqual(CloudMeasurementDB.get_images_dict(db_path=DB_PATH, cloud_util="fake"),
+                         {"eu-west-1": "ami-1"})
+        self.assertEqual(CloudMeasurementDB.get_images_dict(db_path=DB_PATH, cloud_util="aws"), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
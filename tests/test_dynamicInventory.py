@@ -0,0 +1,81 @@
+import os
+import unittest
+from pathlib import Path
+from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration
+from CloudMeasurement.experiments.dynamicInventory import DynamicInventory
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+
+DB_PATH = Path("/tmp/test_dynamicInventory.db")
+
+
+def add_instance(instance_id, experiment_id, availability_zone, public_address):
+    CloudMeasurementDB.add_instance(db_path=DB_PATH, instance_id=instance_id, machine_type="t3.small",
+                                    experiment_id=experiment_id, region=availability_zone[:-1],
+                                    availability_zone=availability_zone, vpc_id="vpc-1", status="running",
+                                    public_address=public_address, private_address="10.0.0.1", key_pair_id="id_rsa")
+
+
+class CountingInventory(DynamicInventory):
+    builds = 0
+
+    def build_inventory(self, experiment_id=None):
+        self.builds += 1
+        return super(CountingInventory, self).build_inventory(experiment_id=experiment_id)
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        CloudMeasurementDB.create_db(DB_PATH)
+        add_instance("i-1", "EXP1", "eu-central-1a", "1.1.1.1")
+        add_instance("i-2", "EXP1", "eu-west-1b", "1.1.1.2")
+        add_instance("i-3", "EXP2", "eu-central-1a", "1.1.1.3")
+        add_instance("i-4", "EXP2", "eu-central-1b", None)
+
+    def tearDown(self):
+        for path in (DB_PATH, DynamicInventory(db_path=DB_PATH).get_cache_path()):
+            if path.is_file():
+                path.unlink()
+
+    def test_groups(self):
+        inventory = DynamicInventory(db_path=DB_PATH).get_inventory()
+        self.assertEqual(sorted(inventory["all"]["hosts"]), ["1.1.1.1", "1.1.1.2", "1.1.1.3"])
+        self.assertEqual(inventory["all"]["hosts"]["1.1.1.2"]["instance_id"], "i-2")
+        self.assertEqual(inventory["all"]["hosts"]["1.1.1.2"]["ansible_user"], "ubuntu")
+        children = inventory["all"]["children"]
+        self.assertEqual(sorted(children["experiment_EXP1"]["hosts"]), ["1.1.1.1", "1.1.1.2"])
+        self.assertEqual(sorted(children["eu_central_1"]["hosts"]), ["1.1.1.1", "1.1.1.3"])
+        self.assertEqual(sorted(children["eu_central_1a"]["hosts"]), ["1.1.1.1", "1.1.1.3"])
+        self.assertNotIn("eu_central_1b", children)
+        self.assertEqual(InventoryConfiguration.get_hosts(inventory, host_pattern="eu_west_1"),
+                         [("1.1.1.2", "ubuntu")])
+
+    def test_experiment(self):
+        inventory = DynamicInventory(db_path=DB_PATH).get_inventory(experiment_id="EXP2")
+        self.assertEqual(list(inventory["all"]["hosts"]), ["1.1.1.3"])
+        self.assertEqual(sorted(inventory["all"]["children"]), ["eu_central_1", "eu_central_1a", "experiment_EXP2"])
+
+    def test_cache(self):
+        inventory = DynamicInventory(db_path=DB_PATH).get_inventory(experiment_id="EXP1")
+        self.assertTrue(DynamicInventory(db_path=DB_PATH).get_cache_path().is_file())
+        # a new instance, as in a new cm command, reads the cache file instead of the db
+        cached_inventory = CountingInventory(db_path=DB_PATH)
+        self.assertEqual(cached_inventory.get_inventory(experiment_id="EXP1"), inventory)
+        self.assertEqual(cached_inventory.builds, 0)
+        add_instance("i-5", "EXP1", "eu-west-1a", "1.1.1.5")
+        # a later modification time, even on the filesystems with a coarse one
+        db_stat = DB_PATH.stat()
+        os.utime(str(DB_PATH), ns=(db_stat.st_atime_ns, db_stat.st_mtime_ns + 10 ** 9))
+        inventory = cached_inventory.get_inventory(experiment_id="EXP1")
+        self.assertEqual(cached_inventory.builds, 1)
+        self.assertIn("1.1.1.5", inventory["all"]["hosts"])
+
+    def test_broken_cache(self):
+        with open(str(DynamicInventory(db_path=DB_PATH).get_cache_path()), "w") as cache_file:
+            cache_file.write("{")
+        inventory = DynamicInventory(db_path=DB_PATH).get_inventory(experiment_id="EXP2")
+        self.assertEqual(list(inventory["all"]["hosts"]), ["1.1.1.3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
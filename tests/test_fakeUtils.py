@@ -0,0 +1,283 @@
+import unittest
+from pathlib import Path
+from time import time
+from botocore.exceptions import ClientError
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.fakeUtils.fakeUtils import FAKE_CLOUD
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+
+DB_PATH = Path("/tmp/test_fakeUtils.db")
+REGIONS = ["eu-central-1", "eu-west-1", "us-east-1"]
+
+
+class FlakyUtils(FakeUtils):
+    """ Fake cloud utils where the subnets of the failing regions can not be created """
+    failing_regions = set()
+
+    def create_subnet(self, vpc_id, region, **kwargs):
+        if region in FlakyUtils.failing_regions:
+            raise FAKE_CLOUD.error("InternalError", "CreateSubnet")
+        return FakeUtils.create_subnet(vpc_id=vpc_id, region=region, **kwargs)
+
+
+class StuckTeardownUtils(FakeUtils):
+    """ Fake cloud utils where the vpcs of the failing regions can not be removed """
+    failing_regions = set()
+
+    @staticmethod
+    def remove_vpc(region, vpc_id, max_workers=8):
+        if region in StuckTeardownUtils.failing_regions:
+            raise FAKE_CLOUD.error("DependencyViolation", "DeleteVpc")
+        return FakeUtils.remove_vpc(region=region, vpc_id=vpc_id, max_workers=max_workers)
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeUtils.configure(seed=0)
+
+    def test_experiment_lifecycle(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils, instances_per_az=2)
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        for region in REGIONS:
+            self.assertEqual(len(vpcs_data[region]), 2)
+            for instance_dict in vpcs_data[region]:
+                self.assertIsNotNone(instance_dict["public_address"])
+                self.assertTrue(instance_dict["private_address"].startswith("10.0."))
+        self.assertEqual(FakeUtils.get_api_calls()["CreateVpcPeeringConnection"], 3)
+        for region in REGIONS:
+            route_table = FAKE_CLOUD.get_region(region)[vpcs_data[region][0]["public_route_table_id"]]
+            peer_routes = sorted(route["DestinationCidrBlock"] for route in route_table["Routes"]
+                                 if "VpcPeeringConnectionId" in route)
+            self.assertEqual(peer_routes, sorted(vpcs_data[other][0]["vpc_cidr_block"]
+                                                 for other in REGIONS if other != region))
+
+        for region in REGIONS:
+            FakeUtils.remove_vpc(region=region, vpc_id=vpcs_data[region][0]["vpc_id"])
+        for region in REGIONS:
+            remaining = [r["type"] for r in FAKE_CLOUD.get_region(region).values() if r["type"] != "instance"]
+            self.assertEqual(remaining, [])
+
+    def test_transit_gateway_topology(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils, topology="transit_gateway")
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        peering_ids = trace.create_peering_connection()
+        hub = REGIONS[0]
+        self.assertEqual(sorted(peering_ids), sorted((spoke, hub) for spoke in REGIONS[1:]))
+        self.assertEqual(FakeUtils.get_api_calls()["CreateTransitGatewayPeeringAttachment"], len(REGIONS) - 1)
+        self.assertNotIn("CreateVpcPeeringConnection", FakeUtils.get_api_calls())
+        # one summary route for every vpc, one route for every spoke in the hub and in the spoke
+        self.assertEqual(len([r for r in trace.routes if r["kind"] == "vpc"]), len(REGIONS))
+        self.assertEqual(len([r for r in trace.routes if r["kind"] == "transit_gateway"]), 2 * (len(REGIONS) - 1))
+        hub_table = FAKE_CLOUD.get_region(hub)[trace.transit_gateways[hub]["route_table_id"]]
+        self.assertEqual(sorted(route["DestinationCidrBlock"] for route in hub_table["Routes"]),
+                         sorted(vpcs_data[spoke][0]["vpc_cidr_block"] for spoke in REGIONS[1:]))
+
+        dict_region_vpc = {region: vpcs_data[region][0]["vpc_id"] for region in REGIONS}
+        MultiregionalTrace.purge_experiment(dict_region_vpc=dict_region_vpc, cloud_utils=FakeUtils,
+                                            transit_gateways=trace.transit_gateways, routes=trace.routes)
+        for region in REGIONS:
+            remaining = [r["type"] for r in FAKE_CLOUD.get_region(region).values() if r["type"] != "instance"]
+            self.assertEqual(remaining, [])
+
+    def test_resume(self):
+        saved = dict()
+
+        def on_checkpoint(experiment_id, step, region, data):
+            if data is None:
+                saved.pop((step, region))
+            else:
+                saved[(step, region)] = data
+
+        FlakyUtils.failing_regions = {"us-east-1"}
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FlakyUtils)
+        trace.on_checkpoint = on_checkpoint
+        with self.assertRaises(ClientError):
+            trace.create_multiregional_vpcs()
+        self.assertEqual(sorted(region for step, region in saved if step == "vpc"), ["eu-central-1", "eu-west-1"])
+        experiment_id = saved[("experiment", None)]["experiment_id"]
+        # the vpc of the failed region is orphaned
+        self.assertEqual(len(FakeUtils.get_vpcs_by_name(region="us-east-1", name=experiment_id)), 1)
+
+        FlakyUtils.failing_regions = set()
+        trace = MultiregionalTrace(cloud_util=FlakyUtils, **saved[("experiment", None)]["parameters"])
+        trace.on_checkpoint = on_checkpoint
+        trace.resume(checkpoints=saved)
+        create_vpc_calls = FakeUtils.get_api_calls()["CreateVpc"]
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        # only the missing region is created, and its orphan vpc is removed
+        self.assertEqual(FakeUtils.get_api_calls()["CreateVpc"], create_vpc_calls + 1)
+        self.assertEqual(vpcs_data["experiment_id"], experiment_id)
+        for region in REGIONS:
+            self.assertEqual(FakeUtils.get_vpcs_by_name(region=region, name=experiment_id),
+                             [vpcs_data[region][0]["vpc_id"]])
+        self.assertEqual(len(trace.peering_ids), 3)
+
+        # a completed experiment has nothing left to do
+        trace = MultiregionalTrace(cloud_util=FlakyUtils, **saved[("experiment", None)]["parameters"])
+        trace.resume(checkpoints=saved)
+        api_calls = FakeUtils.get_api_calls()
+        trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        for operation in ("CreateVpc", "RunInstances", "CreateVpcPeeringConnection"):
+            self.assertEqual(FakeUtils.get_api_calls()[operation], api_calls[operation])
+
+    def test_resume_peering(self):
+        saved = dict()
+
+        def on_checkpoint(experiment_id, step, region, data):
+            # the peering step is saved in the db like cm does
+            if data is None:
+                saved.pop((step, region))
+                if step == "peering":
+                    CloudMeasurementDB.delete_private_network(db_path=DB_PATH, experiment_id=experiment_id)
+                return
+            saved[(step, region)] = data
+            if step == "peering":
+                CloudMeasurementDB.delete_private_network(db_path=DB_PATH, experiment_id=experiment_id)
+                CloudMeasurementDB.add_transit_gateways(db_path=DB_PATH, experiment_id=experiment_id,
+                                                        transit_gateways=data["transit_gateways"])
+                CloudMeasurementDB.add_routes(db_path=DB_PATH, experiment_id=experiment_id, routes=data["routes"])
+
+        CloudMeasurementDB.create_db(DB_PATH)
+        self.addCleanup(DB_PATH.unlink)
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils, topology="transit_gateway")
+        trace.on_checkpoint = on_checkpoint
+        trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        experiment_id = saved[("experiment", None)]["experiment_id"]
+        # the vpc of a region is lost, so its region and the peering are created again
+        FAKE_CLOUD.remove(REGIONS[-1], saved[("vpc", REGIONS[-1])]["vpc_id"])
+
+        trace = MultiregionalTrace(cloud_util=FakeUtils, **saved[("experiment", None)]["parameters"])
+        trace.on_checkpoint = on_checkpoint
+        trace.resume(checkpoints=saved)
+        self.assertNotIn(("peering", None), saved)
+        self.assertEqual(CloudMeasurementDB.get_transit_gateways_dict(experiment_id=experiment_id, db_path=DB_PATH),
+                         dict())
+        trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        self.assertEqual(CloudMeasurementDB.get_transit_gateways_dict(experiment_id=experiment_id, db_path=DB_PATH),
+                         trace.transit_gateways)
+        self.assertEqual(len(CloudMeasurementDB.get_routes(experiment_id=experiment_id, db_path=DB_PATH)),
+                         len(trace.routes))
+
+    def test_network_optimized(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils, network_optimized=True)
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        for region in REGIONS:
+            instance_dict = vpcs_data[region][0]
+            instance = FAKE_CLOUD.get_region(region)[instance_dict["instance_id"]]
+            self.assertEqual(instance["InstanceType"], "c5n.large")
+            placement_group_name = "{}-{}".format(vpcs_data["experiment_id"], instance_dict["availability_zone"])
+            self.assertEqual(instance["Placement"]["GroupName"], placement_group_name)
+        trace.purge()
+        for region in REGIONS:
+            self.assertEqual(FAKE_CLOUD.find(region, "placement_group"), [])
+
+    def test_network_optimized_burstable(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils, network_optimized=True,
+                                   machine_type_mapping="t3.small")
+        with self.assertRaises(ValueError):
+            trace.create_multiregional_vpcs()
+        self.assertNotIn("CreateVpc", FakeUtils.get_api_calls())
+
+    def test_purge(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils)
+        trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.purge()
+        for region in REGIONS:
+            self.assertEqual(FakeUtils.count_vpcs(region=region), 0)
+
+    def test_purge_experiments(self):
+        experiments = dict()
+        for _ in range(3):
+            trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils)
+            vpcs_data = trace.create_multiregional_vpcs()
+            experiments[vpcs_data["experiment_id"]] = {
+                "cloud_utils": StuckTeardownUtils,
+                "dict_region_vpc": {region: vpcs_data[region][0]["vpc_id"] for region in REGIONS}}
+        StuckTeardownUtils.failing_regions = {"us-east-1"}
+        removed = []
+        failed = MultiregionalTrace.purge_experiments(
+            experiments=experiments, max_workers=4,
+            on_region_removed=lambda experiment_id, region, vpc_id, error: removed.append((region, error is None)))
+        StuckTeardownUtils.failing_regions = set()
+        self.assertEqual(failed, {experiment_id: ["us-east-1"] for experiment_id in experiments})
+        self.assertEqual(sorted(removed), sorted([(region, region != "us-east-1") for region in REGIONS] * 3))
+        self.assertEqual(FakeUtils.count_vpcs(region="eu-central-1"), 0)
+        self.assertEqual(FakeUtils.count_vpcs(region="us-east-1"), 3)
+
+    def test_latency_injection(self):
+        FakeUtils.configure(operation_latency={"CreateVpc": 0.2})
+        start = time()
+        FakeUtils.create_vpc(vpc_name="test", region="eu-central-1")
+        self.assertGreaterEqual(time() - start, 0.2)
+        record = [r for r in FakeUtils.get_api_records() if r["operation"] == "CreateVpc"][0]
+        self.assertGreaterEqual(record["latency"], 0.2)
+
+    def test_throttling_retried(self):
+        FakeUtils.configure(seed=1, throttle_rate=0.5, base_delay=0.001)
+        for _ in range(20):
+            FakeUtils.create_vpc(vpc_name="test", region="eu-central-1")
+        metrics = FakeUtils.get_rate_limiter_metrics()["total"]
+        self.assertGreater(metrics["throttles"], 0)
+        self.assertEqual(metrics["retries"], metrics["throttles"])
+        self.assertEqual(FakeUtils.count_vpcs(region="eu-central-1"), 20)
+
+    def test_failure_injection(self):
+        FakeUtils.configure(operation_failure_rate={"CreateInternetGateway": 1})
+        with self.assertRaises(ClientError) as context:
+            FakeUtils.create_internet_gateway(region="eu-central-1")
+        self.assertEqual(context.exception.response["Error"]["Code"], "InternalError")
+        self.assertEqual(FakeUtils.get_api_records()[-1]["error"], "InternalError")
+
+    def test_ids_after_configure(self):
+        vpc_id = FakeUtils.create_vpc(vpc_name="test", region="eu-central-1")
+        # a new cm run starts from a new fake cloud, its ids can be saved in the same db
+        FakeUtils.configure(seed=0)
+        self.assertNotEqual(FakeUtils.create_vpc(vpc_name="test", region="eu-central-1"), vpc_id)
+
+    def test_wait_for_state(self):
+        transit_gateway_id = FakeUtils.create_transit_gateway(region="eu-central-1", name="test")["transit_gateway_id"]
+        peer_transit_gateway_id = FakeUtils.create_transit_gateway(region="eu-west-1",
+                                                                   name="test")["transit_gateway_id"]
+        attachment_id = FakeUtils.request_transit_gateway_peering(region="eu-central-1",
+                                                                  transit_gateway_id=transit_gateway_id,
+                                                                  peer_region="eu-west-1",
+                                                                  peer_transit_gateway_id=peer_transit_gateway_id,
+                                                                  name="test")
+        wait_arguments = {"region": "eu-west-1", "describe_operation": "describe_transit_gateway_peering_attachments",
+                          "ids_parameter": "TransitGatewayAttachmentIds",
+                          "result_key": "TransitGatewayPeeringAttachments", "resource_ids": [attachment_id],
+                          "description": "transit gateway peering"}
+        FakeUtils.wait_for_state(states=("pendingAcceptance",), **wait_arguments)
+        with self.assertRaises(TimeoutError):
+            FakeUtils.wait_for_state(states=("available",), timeout=0.05, **wait_arguments)
+        FakeUtils.accept_transit_gateway_peerings(region="eu-west-1", attachment_ids=[attachment_id])
+        self.assertEqual(FakeUtils.wait_for_state(states=("available",), **wait_arguments)[0]["id"], attachment_id)
+        FakeUtils.delete_transit_gateway_peering(region="eu-central-1", attachment_id=attachment_id)
+        self.assertEqual(FakeUtils.wait_for_state(states=("deleted",), **wait_arguments), [])
+        self.assertIn("DescribeTransitGatewayPeeringAttachments", FakeUtils.get_api_calls())
+
+    def test_quota(self):
+        FakeUtils.configure(vpc_quota=1)
+        FakeUtils.create_vpc(vpc_name="test", region="eu-central-1")
+        report = FakeUtils.preflight({"eu-central-1": {"vpc_needed": 1, "instances_needed": 1,
+                                                       "instance_type": "t3.small"}})
+        self.assertFalse(report["eu-central-1"]["ok"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.fakeUtils.fakeUtils import FAKE_CLOUD
+from CloudMeasurement.experiments.imageBaker import ImageBaker
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+
+REGIONS = ["eu-central-1", "eu-west-1", "us-east-1"]
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeUtils.configure(seed=0)
+        self.baker = ImageBaker(cloud_util=FakeUtils)
+
+    def test_bake(self):
+        provisioned = []
+        image_name, images = self.baker.bake(source_region=REGIONS[0], regions=REGIONS,
+                                             provision=provisioned.append)
+        self.assertEqual(len(provisioned), 1)
+        self.assertIsNotNone(provisioned[0]["public_address"])
+        self.assertEqual(sorted(images), sorted(REGIONS))
+        self.assertEqual(FakeUtils.get_api_calls()["CopyImage"], len(REGIONS) - 1)
+        for region, image_id in images.items():
+            self.assertEqual(FAKE_CLOUD.get_region(region)[image_id]["Name"], image_name)
+        # the builder is removed
+        self.assertEqual(FakeUtils.get_vpcs_by_name(region=REGIONS[0], name=image_name), [])
+
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils)
+        trace.images = {REGIONS[0]: images[REGIONS[0]]}
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        for region in REGIONS:
+            instance_dict = vpcs_data[region][0]
+            image_id = FAKE_CLOUD.get_region(region)[instance_dict["instance_id"]]["ImageId"]
+            self.assertEqual(instance_dict["baked"], region == REGIONS[0])
+            self.assertEqual(image_id == images[region], region == REGIONS[0])
+
+    def test_failed_provision_removes_the_builder(self):
+        def provision(instance_dict):
+            raise RuntimeError("apt failed")
+
+        with self.assertRaises(RuntimeError):
+            self.baker.bake(source_region=REGIONS[0], regions=REGIONS, provision=provision)
+        self.assertEqual(FakeUtils.count_vpcs(region=REGIONS[0]), 0)
+        self.assertNotIn("CreateImage", FakeUtils.get_api_calls())
+
+
+if __name__ == '__main__':
+    unittest.main()
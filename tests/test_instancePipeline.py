@@ -0,0 +1,56 @@
+import unittest
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.instancePipeline import InstancePipeline
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+
+REGION = "eu-central-1"
+
+
+class MyTestCase(unittest.TestCase):
+
+    def launch(self, number_of_instances):
+        vpc_id = FakeUtils.create_vpc(vpc_name="test", region=REGION)
+        route_table_id = FakeUtils.create_route_table(vpc_id=vpc_id, region=REGION, table_name="test")
+        subnet_id = FakeUtils.create_subnet(vpc_id=vpc_id, region=REGION, az=REGION + "a", subnet_name="test",
+                                            cidr_block="10.0.0.0/24", route_table_id=route_table_id,
+                                            map_public_ip_on_launch=True)
+        return FakeUtils.run_instances(region=REGION, subnet_id=subnet_id, instance_type="t3.small",
+                                       key_name="id_rsa", image_id="ami", number_of_instances=number_of_instances)
+
+    def test_instances_ready_independently(self):
+        FakeUtils.configure(seed=0, instance_boot_jitter=0.6, instance_ssh_time=0.1)
+        instances_ids = self.launch(number_of_instances=4)
+        ready = []
+        pipeline = InstancePipeline(cloud_utils=FakeUtils, region=REGION, instances_id_list=instances_ids,
+                                    ready_stage="ssh_reachable", delay=0.05, max_delay=0.05,
+                                    on_ready=lambda instance_id, data: ready.append((instance_id, data)))
+        instances_data = pipeline.run()
+        self.assertEqual(sorted(instance_id for instance_id, _ in ready), sorted(instances_ids))
+        for instance_id in instances_ids:
+            self.assertIsNotNone(instances_data[instance_id]["public_address"])
+            timings = pipeline.timings[instance_id]
+            self.assertLessEqual(timings["running"], timings["status_ok"])
+            self.assertLessEqual(timings["status_ok"], timings["ssh_reachable"])
+        # the first instance is configured before the slowest one is running
+        first_ready = pipeline.timings[ready[0][0]]["ssh_reachable"]
+        self.assertLess(first_ready, max(timings["running"] for timings in pipeline.timings.values()))
+
+    def test_timeout(self):
+        FakeUtils.configure(instance_boot_time=10)
+        pipeline = InstancePipeline(cloud_utils=FakeUtils, region=REGION, instances_id_list=self.launch(1),
+                                    timeout=0.2, delay=0.05)
+        with self.assertRaises(TimeoutError):
+            pipeline.run()
+
+    def test_create_instances_callback(self):
+        FakeUtils.configure()
+        trace = MultiregionalTrace(list_of_regions=[REGION, "eu-west-1"], cloud_util=FakeUtils)
+        trace.create_multiregional_vpcs()
+        ready = []
+        trace.create_instances(ready_stage="ssh_reachable",
+                               on_instance_ready=lambda region, instance_dict: ready.append(region))
+        self.assertEqual(sorted(ready), sorted([REGION, "eu-west-1"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from pathlib import Path
+from CloudMeasurement.experiments.awsUtils import MetadataCatalog
+
+TEST_DB_PATH = Path("/tmp/test_metadataCatalog.db")
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        if TEST_DB_PATH.is_file():
+            TEST_DB_PATH.unlink()
+
+    def test_put_get(self):
+        catalog = MetadataCatalog(db_path=TEST_DB_PATH)
+        catalog.put("azs", "region-1", ["region-1a", "region-1b"])
+        self.assertEqual(catalog.get("azs", "region-1"), ["region-1a", "region-1b"])
+        self.assertIsNone(catalog.get("azs", "region-2"))
+
+    def test_warm_across_instances(self):
+        MetadataCatalog(db_path=TEST_DB_PATH).put("ami", "region-1", "ami-1", name="image")
+        self.assertEqual(MetadataCatalog(db_path=TEST_DB_PATH).get("ami", "region-1", name="image"), "ami-1")
+
+    def test_expired(self):
+        catalog = MetadataCatalog(db_path=TEST_DB_PATH, ttl=-1)
+        catalog.put("regions", "all", ["region-1"])
+        self.assertIsNone(catalog.get("regions", "all"))
+
+    def test_invalidate(self):
+        catalog = MetadataCatalog(db_path=TEST_DB_PATH)
+        catalog.put("azs", "region-1", ["region-1a"])
+        catalog.put("azs", "region-2", ["region-2a"])
+        catalog.put("regions", "all", ["region-1", "region-2"])
+        catalog.invalidate(kind="azs", region="region-1")
+        self.assertIsNone(catalog.get("azs", "region-1"))
+        self.assertEqual(catalog.get("azs", "region-2"), ["region-2a"])
+        catalog.invalidate()
+        self.assertIsNone(catalog.get("regions", "all"))
+
+
+if __name__ == '__main__':
+    unittest.main()
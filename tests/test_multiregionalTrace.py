@@ -1,9 +1,81 @@
 import unittest
+from threading import Lock
+from time import sleep, time
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+
+REGIONS = ["eu-central-1", "eu-west-1", "us-east-1", "ap-south-1"]
+
+
+class SlowCloudUtils(object):
+    """ Minimal cloud utils where every vpc takes DELAY seconds to be created """
+    DELAY = 0.2
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counter = 0
+
+    def new_id(self, prefix):
+        with self._lock:
+            self.counter += 1
+            return "{}-{}".format(prefix, self.counter)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def get_all_regions(self, *args, **kwargs):
+        return REGIONS
+
+    def get_az_in_the_region(self, region):
+        return [region + "a"]
+
+    def get_api_calls(self):
+        return {}
+
+    def bind_api_phase(self, function):
+        return function
+
+    def preflight(self, requirements):
+        return {region: {"ok": True} for region in requirements}
+
+    def generate_experiment_id(self):
+        return "EXP"
+
+    def create_vpc(self, vpc_name, region, cidr_block):
+        sleep(self.DELAY)
+        return self.new_id("vpc")
+
+    def create_internet_gateway(self, region, gateway_name=None):
+        return self.new_id("igw")
+
+    def create_route_table(self, vpc_id, region, table_name):
+        return self.new_id("rtb")
+
+    def create_security_group(self, vpc_id, region, security_group_name, description):
+        return self.new_id("sg")
+
+    def create_subnet(self, vpc_id, region, az, subnet_name, cidr_block, route_table_id, **kwargs):
+        return "subnet-" + cidr_block
 
 
 class MyTestCase(unittest.TestCase):
-    def test_something(self):
-        pass
+
+    def test_regions_provisioned_concurrently(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=SlowCloudUtils)
+        start = time()
+        vpcs_data = trace.create_multiregional_vpcs(cidr_block="10.0.0.0/16")
+        self.assertLess(time() - start, SlowCloudUtils.DELAY * len(REGIONS))
+        self.assertEqual(vpcs_data["experiment_id"], "EXP")
+        for index, region in enumerate(REGIONS):
+            self.assertEqual(len(vpcs_data[region]), 1)
+            self.assertEqual(vpcs_data[region][0]["availability_zone"], [region + "a"])
+            # the cidr blocks follow the order of the regions
+            self.assertEqual(vpcs_data[region][0]["public_subnet"], ["subnet-10.0.{}.0/24".format(index)])
+
+    def test_max_workers(self):
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=SlowCloudUtils, max_workers=1)
+        start = time()
+        trace.create_multiregional_vpcs()
+        self.assertGreaterEqual(time() - start, SlowCloudUtils.DELAY * len(REGIONS))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,28 @@
+import unittest
+from copy import deepcopy
+from benchmarks.provisioningBenchmark import run_benchmark, get_scenarios, compare_with_baseline, PHASES
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_benchmark_report(self):
+        scenarios = get_scenarios(regions=(2,), azs=(2,), instances=(1,))
+        report = run_benchmark(scenarios, latency=0, instance_time=0)
+        self.assertEqual(sorted(report["scenarios"]), ["multiregional-r2-az1-i1", "regional-r1-az2-i1"])
+        phases = report["scenarios"]["multiregional-r2-az1-i1"]["phases"]
+        self.assertEqual(set(phases), set(PHASES))
+        self.assertGreater(phases["create_experiment_environment"]["api_calls"], 0)
+        self.assertGreater(phases["create_instances"]["peak_memory"], 0)
+
+    def test_compare_with_baseline(self):
+        baseline = {"scenarios": {"s": {"phases": {"create_instances": {"wall_time": 1.0, "api_calls": 10,
+                                                                        "peak_memory": 1}}}}}
+        report = deepcopy(baseline)
+        self.assertEqual(compare_with_baseline(report, baseline), [])
+        report["scenarios"]["s"]["phases"]["create_instances"]["wall_time"] = 1.5
+        regressions = compare_with_baseline(report, baseline, tolerance=0.2)
+        self.assertEqual([(r["phase"], r["metric"]) for r in regressions], [("create_instances", "wall_time")])
+
+
+if __name__ == '__main__':
+    unittest.main()
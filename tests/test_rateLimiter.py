@@ -0,0 +1,88 @@
+import unittest
+from botocore.exceptions import EndpointConnectionError
+from time import monotonic
+from CloudMeasurement.experiments.awsUtils import RateLimiter, TokenBucket
+
+
+class FakeHttpResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_bucket_burst(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+        for _ in range(5):
+            self.assertEqual(bucket.acquire(), 0.0)
+
+    def test_bucket_waits_when_empty(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        bucket.acquire()
+        self.assertGreater(bucket.acquire(), 0.0)
+
+    def test_bucket_adaptive_rate(self):
+        bucket = TokenBucket(rate=10, capacity=10, min_rate=1)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 5)
+        bucket.on_success()
+        self.assertGreater(bucket.rate, 5)
+
+    def test_throttle_is_retried(self):
+        limiter = RateLimiter(base_delay=0.01)
+        bucket = limiter.get_bucket(account=None, region="region-1")
+        response = (FakeHttpResponse(503), {"Error": {"Code": "RequestLimitExceeded"}})
+        delay = limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=response, attempts=1,
+                                        caught_exception=None)
+        self.assertIsNotNone(delay)
+        metrics = limiter.get_metrics()
+        self.assertEqual(metrics["total"]["throttles"], 1)
+        self.assertEqual(metrics["regions"]["region-1"]["retries"], 1)
+
+    def test_success_is_not_retried(self):
+        limiter = RateLimiter()
+        bucket = limiter.get_bucket(account=None, region="region-1")
+        response = (FakeHttpResponse(200), {"ResponseMetadata": {}})
+        self.assertIsNone(limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=response,
+                                                  attempts=1, caught_exception=None))
+
+    def test_max_attempts(self):
+        limiter = RateLimiter(max_attempts=3)
+        bucket = limiter.get_bucket(account=None, region="region-1")
+        response = (FakeHttpResponse(400), {"Error": {"Code": "Throttling"}})
+        self.assertIsNone(limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=response,
+                                                  attempts=3, caught_exception=None))
+        self.assertEqual(limiter.get_metrics()["total"]["errors"], 1)
+
+    def test_bucket_reserve(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+        self.assertEqual(bucket.reserve(), 0.0)
+        # the second token is not there yet, the wait is returned without sleeping
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+
+    def test_retry_waits_once_for_the_token(self):
+        limiter = RateLimiter(rate=10, capacity=1, base_delay=0.01, max_delay=0.01)
+        bucket = limiter.get_bucket(account=None, region="region-1")
+        bucket.acquire()
+        response = (FakeHttpResponse(503), {"Error": {"Code": "ServiceUnavailable"}})
+        start = monotonic()
+        delay = limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=response, attempts=1,
+                                        caught_exception=None)
+        self.assertLess(monotonic() - start, 0.05)
+        self.assertAlmostEqual(delay, 0.1, delta=0.01)
+        metrics = limiter.get_metrics()["total"]
+        self.assertLessEqual(metrics["backoff_time"], 0.01)
+        self.assertAlmostEqual(metrics["backoff_time"] + metrics["wait_time"], delay)
+
+    def test_exceptions(self):
+        limiter = RateLimiter(base_delay=0.01)
+        bucket = limiter.get_bucket(account=None, region="region-1")
+        exception = EndpointConnectionError(endpoint_url="https://ec2.region-1.amazonaws.com")
+        self.assertIsNotNone(limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=None,
+                                                     attempts=1, caught_exception=exception))
+        self.assertIsNone(limiter.get_retry_delay(key=(None, "region-1"), bucket=bucket, response=None, attempts=1,
+                                                  caught_exception=ValueError("bad parameter")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import shutil
+import unittest
+from pathlib import Path
+from CloudMeasurement.experiments.ansibleConfiguration import InventoryConfiguration
+from CloudMeasurement.experiments.sshExecutor import SshExecutor, SSH_UNREACHABLE
+
+TEST_DIR = Path("/tmp/test_sshExecutor")
+KNOWN_HOSTS_PATH = TEST_DIR / "test.known_hosts"
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        TEST_DIR.mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(str(TEST_DIR), ignore_errors=True)
+
+    def test_get_command(self):
+        self.assertEqual(SshExecutor.get_command("raw", "crontab /home/ubuntu/crontab.cfg", become=True),
+                         ("sudo sh -c 'crontab /home/ubuntu/crontab.cfg'", None, None))
+        self.assertEqual(SshExecutor.get_command("copy", "src=/tmp/a dest=/home/ubuntu/a mode=777"),
+                         ("tee /home/ubuntu/a > /dev/null && chmod 777 /home/ubuntu/a", "/tmp/a", None))
+        self.assertEqual(SshExecutor.get_command("fetch", "src=/home/ubuntu/a dest=/tmp/data", become=True),
+                         ("sudo cat /home/ubuntu/a", None, "/tmp/data"))
+        with self.assertRaises(ValueError):
+            SshExecutor.get_command("apt", "name=traceroute")
+
+    def test_get_args(self):
+        args = SshExecutor(known_hosts_path=KNOWN_HOSTS_PATH).get_args("1.1.1.1", "ubuntu", "uptime")
+        self.assertEqual(args[0], "ssh")
+        self.assertIn("ControlMaster=auto", args)
+        self.assertIn("StrictHostKeyChecking=accept-new", args)
+        self.assertIn("UserKnownHostsFile={}".format(KNOWN_HOSTS_PATH), args)
+        self.assertNotIn("StrictHostKeyChecking=no", args)
+        self.assertEqual(args[-2:], ["ubuntu@1.1.1.1", "uptime"])
+        self.assertEqual(SshExecutor(known_hosts_path=KNOWN_HOSTS_PATH).get_args("localhost", None, "uptime"),
+                         ["sh", "-c", "uptime"])
+
+    def test_run_localhost(self):
+        src = TEST_DIR / "src.txt"
+        with open(str(src), "w") as f:
+            f.write("data")
+        executor = SshExecutor(known_hosts_path=KNOWN_HOSTS_PATH)
+        stats = executor.run([("localhost", None)], module="copy",
+                             module_args="src={} dest={} mode=600".format(src, TEST_DIR / "dest.txt"))
+        self.assertEqual(stats["ok"], {"localhost": 1})
+        with open(str(TEST_DIR / "dest.txt")) as f:
+            self.assertEqual(f.read(), "data")
+
+        stats = executor.run([("localhost", None)], module="fetch",
+                             module_args="src={} dest={}".format(src, TEST_DIR / "fetched"))
+        self.assertEqual(stats["ok"], {"localhost": 1})
+        with open(str(SshExecutor.get_fetch_path(TEST_DIR / "fetched", "localhost", src))) as f:
+            self.assertEqual(f.read(), "data")
+
+        stats = executor.run([("localhost", None)], module="raw", module_args="exit 3")
+        self.assertEqual(stats["failures"], {"localhost": 1})
+        self.assertEqual(executor.results["localhost"][0], 3)
+
+    def test_get_stats(self):
+        stats = SshExecutor.get_stats([("1.1.1.1", 0, "", ""), ("1.1.1.2", SSH_UNREACHABLE, "", ""),
+                                       ("1.1.1.3", 1, "", "")])
+        self.assertEqual(stats["ok"], {"1.1.1.1": 1})
+        self.assertEqual(stats["dark"], {"1.1.1.2": 1})
+        self.assertEqual(stats["failures"], {"1.1.1.3": 1})
+        self.assertEqual(len(stats["processed"]), 3)
+
+    def test_run_inventory(self):
+        inventory_path = TEST_DIR / "test.cfg"
+        ic = InventoryConfiguration(inventory_path=inventory_path)
+        ic.add_host(host_id="id_1", region="region-1", public_ip="1.1.1.1")
+        ic.add_host(host_id="id_2", region="region-2", public_ip="1.1.1.2", user="admin")
+        ic.make_inventory()
+        self.assertEqual(InventoryConfiguration.get_hosts(inventory_path),
+                         [("1.1.1.1", "ubuntu"), ("1.1.1.2", "admin")])
+        self.assertEqual(InventoryConfiguration.get_hosts(inventory_path, host_pattern="region_2"),
+                         [("1.1.1.2", "admin")])
+        self.assertEqual(InventoryConfiguration.get_hosts(inventory_path, host_pattern="1.1.1.1"),
+                         [("1.1.1.1", "ubuntu")])
+        stats = InventoryConfiguration.run_inventory(inventory_path, host_pattern="localhost", module="raw",
+                                                     module_args="true", cmdline="", executor="ssh")
+        self.assertEqual(stats["ok"], {"localhost": 1})
+        with self.assertRaises(ValueError):
+            InventoryConfiguration.run_inventory(inventory_path, host_pattern="all", module="raw",
+                                                 module_args="true", executor="paramiko")
+        # a dict inventory has no file to keep the known hosts next to
+        with self.assertRaises(ValueError):
+            InventoryConfiguration.run_inventory(InventoryConfiguration.read_inventory(inventory_path),
+                                                 host_pattern="all", module="raw", module_args="true", executor="ssh")
+
+
+if __name__ == '__main__':
+    unittest.main()
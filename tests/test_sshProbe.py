@@ -0,0 +1,63 @@
+import socket
+import threading
+import unittest
+from CloudMeasurement.experiments.sshProbe import SshProbe
+
+
+class BannerServer(object):
+    """ Tcp server on localhost that answers every connection with the banner """
+    def __init__(self, banner):
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(16)
+        self.port = self.socket.getsockname()[1]
+        self.banner = banner
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            connection.sendall(self.banner)
+            connection.close()
+
+    def close(self):
+        self.socket.close()
+
+
+def get_closed_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_ssh_banner(self):
+        server = BannerServer(b"SSH-2.0-OpenSSH_7.6p1\r\n")
+        try:
+            self.assertEqual(SshProbe.probe_many(["127.0.0.1"], port=server.port), {"127.0.0.1": True})
+        finally:
+            server.close()
+
+    def test_not_ssh(self):
+        server = BannerServer(b"HTTP/1.1 400 Bad Request\r\n")
+        try:
+            self.assertEqual(SshProbe.probe_many(["127.0.0.1"], port=server.port), {"127.0.0.1": False})
+        finally:
+            server.close()
+
+    def test_closed_port(self):
+        results = []
+        reachable = SshProbe.probe_many(["127.0.0.1"], port=get_closed_port(), timeout=1,
+                                        on_result=lambda address, result: results.append((address, result)))
+        self.assertEqual(reachable, {"127.0.0.1": False})
+        self.assertEqual(results, [("127.0.0.1", False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import shutil
+import unittest
+from pathlib import Path
+
+import yaml
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+from time import sleep
+from CloudMeasurement.experiments.startupPlaybook import StartupPlaybook, PlaybookBatches, TRACEROUTE_TEMPLATE
+
+PLAYBOOK_DIR = Path("/tmp/test_startupPlaybook")
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.startup_playbook = StartupPlaybook(playbook_dir=PLAYBOOK_DIR)
+        self.startup_playbook.add_host(ip="1.1.1.1", destinations=["2.2.2.2", "3.3.3.3"])
+        self.startup_playbook.add_host(ip="2.2.2.2", destinations=["1.1.1.1", "3.3.3.3"], baked=True,
+                                       network_optimized=True)
+
+    def tearDown(self):
+        shutil.rmtree(str(PLAYBOOK_DIR), ignore_errors=True)
+
+    def test_path_type(self):
+        with self.assertRaises(TypeError):
+            StartupPlaybook(playbook_dir=str(PLAYBOOK_DIR))
+
+    def test_make_playbook(self):
+        playbook_path = self.startup_playbook.make_playbook(src_ports="33434-33436", dst_ports="33434-33435")
+        with open(str(playbook_path)) as playbook_file:
+            plays = yaml.safe_load(playbook_file)
+        self.assertEqual(len(plays), 1)
+        self.assertEqual(plays[0]["hosts"], "all")
+        self.assertEqual((plays[0]["vars"]["src_start"], plays[0]["vars"]["src_end"]), (33434, 33436))
+        self.assertEqual(len(plays[0]["tasks"]), len(StartupPlaybook.get_tasks()))
+        self.assertEqual([task["name"] for task in plays[0]["tasks"] if "tools" in task.get("tags", [])],
+                         ["install the traceroute tools", "create the experiment directories"])
+        with open(str(PLAYBOOK_DIR / "host_vars" / "2.2.2.2.yml")) as host_vars_file:
+            self.assertEqual(yaml.safe_load(host_vars_file), {"destinations": ["1.1.1.1", "3.3.3.3"],
+                                                              "baked": True, "network_optimized": True})
+        self.assertTrue((PLAYBOOK_DIR / "traceroute.sh.j2").is_file())
+
+    @unittest.skipIf(jinja2 is None, "jinja2 is installed with ansible")
+    def test_traceroute_template(self):
+        template = jinja2.Environment(trim_blocks=True).from_string(TRACEROUTE_TEMPLATE)
+        script = template.render(destinations=["2.2.2.2", "3.3.3.3"], src_start=33434, src_end=33436,
+                                 dst_start=33434, dst_end=33435, experiment_dir="/home/ubuntu/experiments",
+                                 experiment_bk_dir="/home/ubuntu/experiments_bk")
+        lines = script.splitlines()
+        self.assertEqual(lines[0], "#!/bin/bash")
+        self.assertEqual(len(lines), 1 + 2 * 2)
+        self.assertTrue(lines[1].startswith("sudo paris-traceroute -n -s 33434 -p 33434 -U -m 60 2.2.2.2 | tee "
+                                            "/home/ubuntu/experiments/ip_2_2_2_2date_$(date"))
+        self.assertTrue(lines[4].endswith("_s33435_p33434.log"))
+
+    def test_batches(self):
+        def run_batch(hosts):
+            sleep(0.1)
+            dark = {"3.3.3.3": 1} if "3.3.3.3" in hosts else {}
+            return {"ok": {host: 6 for host in hosts if host not in dark}, "dark": dark}
+
+        batches = PlaybookBatches(run_batch=run_batch)
+        batches.add("1.1.1.1")
+        # added while the first batch is running, they are configured together by the second batch
+        sleep(0.05)
+        batches.add("2.2.2.2")
+        batches.add("3.3.3.3")
+        stats = batches.join()
+        self.assertEqual([hosts for hosts, _ in batches.batches], [["1.1.1.1"], ["2.2.2.2", "3.3.3.3"]])
+        self.assertEqual(batches.get_hosts(), ["1.1.1.1", "2.2.2.2", "3.3.3.3"])
+        self.assertEqual(stats["ok"], {"1.1.1.1": 6, "2.2.2.2": 6})
+        self.assertEqual(stats["dark"], {"3.3.3.3": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
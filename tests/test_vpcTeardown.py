@@ -0,0 +1,59 @@
+import unittest
+from threading import Lock
+from CloudMeasurement.experiments.awsUtils.vpcTeardown import VpcTeardown
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.fakeUtils.fakeUtils import FAKE_CLOUD
+
+REGION = "eu-central-1"
+
+
+class MyTestCase(unittest.TestCase):
+
+    def make_recording_teardown(self):
+        teardown = VpcTeardown(ec2_client=None, vpc_id="vpc-1")
+        order = []
+        lock = Lock()
+
+        def recorder(name):
+            def record():
+                with lock:
+                    order.append(name)
+                return name
+            return record
+
+        teardown.nodes = {name: (recorder(name), dependencies)
+                          for name, (_, dependencies) in teardown.nodes.items()}
+        return teardown, order
+
+    def test_all_nodes_deleted_once(self):
+        teardown, order = self.make_recording_teardown()
+        self.assertEqual(teardown.run(), "vpc")
+        self.assertEqual(sorted(order), sorted(teardown.nodes.keys()))
+
+    def test_dependencies_respected(self):
+        teardown, order = self.make_recording_teardown()
+        teardown.run()
+        for name, (_, dependencies) in teardown.nodes.items():
+            for dependency in dependencies:
+                self.assertLess(order.index(dependency), order.index(name))
+        self.assertEqual(order[-1], "vpc")
+
+    def test_deleted_ids(self):
+        FakeUtils.configure(seed=0)
+        vpc_id = FakeUtils.create_vpc(vpc_name="test", region=REGION)
+        route_table_id = FakeUtils.create_route_table(vpc_id=vpc_id, region=REGION, table_name="test")
+        subnet_id = FakeUtils.create_subnet(vpc_id=vpc_id, region=REGION, az=REGION + "a", subnet_name="test",
+                                            cidr_block="10.0.0.0/24", route_table_id=route_table_id)
+        gateway_id = FakeUtils.create_internet_gateway(region=REGION)
+        FakeUtils.attach_internet_gateway_to_vpc(vpc_id=vpc_id, region=REGION, internet_gateway_id=gateway_id)
+        security_group_id = FakeUtils.create_security_group(vpc_id=vpc_id, region=REGION, security_group_name="test")
+        created_ids = set(resource["id"] for resource in FAKE_CLOUD.get_region(REGION).values())
+
+        teardown = VpcTeardown(ec2_client=FakeUtils.get_client(region=REGION), vpc_id=vpc_id)
+        teardown.run()
+        self.assertTrue({vpc_id, route_table_id, subnet_id, gateway_id, security_group_id} <= created_ids)
+        self.assertEqual(teardown.deleted_ids, created_ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
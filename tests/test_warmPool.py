@@ -0,0 +1,97 @@
+import unittest
+from pathlib import Path
+from CloudMeasurement.experiments.fakeUtils import FakeUtils
+from CloudMeasurement.experiments.multiregionalTrace import MultiregionalTrace
+from CloudMeasurement.experiments.warmPool import WarmPool
+from CloudMeasurement.liteSQLdb import CloudMeasurementDB
+
+DB_PATH = Path("/tmp/test_warmPool.db")
+REGIONS = ["eu-central-1", "eu-west-1"]
+MACHINE_TYPES = {region: "t3.small" for region in REGIONS}
+
+
+class LostClaimPool(WarmPool):
+
+    def claim(self, region, machine_type, availability_zone, experiment_id):
+        return None
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeUtils.configure(seed=0)
+        CloudMeasurementDB.create_db(DB_PATH)
+        self.pool = WarmPool(db_path=DB_PATH, cloud_util=FakeUtils)
+
+    def tearDown(self):
+        if DB_PATH.is_file():
+            DB_PATH.unlink()
+
+    def test_refill(self):
+        self.assertEqual(len(self.pool.refill(machine_type_mapping=MACHINE_TYPES, size=2)), 4)
+        for region in REGIONS:
+            self.assertEqual(self.pool.count_ready(region=region, machine_type="t3.small",
+                                                   availability_zone=region + "a"), 2)
+        # a full pool is not provisioned again
+        self.assertEqual(self.pool.refill(machine_type_mapping=MACHINE_TYPES, size=2), [])
+        self.assertEqual(FakeUtils.get_api_calls()["CreateVpc"], 4)
+
+    def test_claim(self):
+        self.pool.refill(machine_type_mapping={"eu-central-1": "t3.small"}, size=1)
+        api_calls = FakeUtils.get_api_calls()
+        trace = MultiregionalTrace(list_of_regions=REGIONS, cloud_util=FakeUtils)
+        trace.warm_pool = self.pool
+        vpcs_data = trace.create_multiregional_vpcs()
+        trace.create_instances()
+        trace.create_peering_connection()
+        experiment_id = vpcs_data["experiment_id"]
+        # only the region without a ready set is provisioned
+        self.assertEqual(FakeUtils.get_api_calls()["CreateVpc"], api_calls["CreateVpc"] + 1)
+        self.assertEqual(FakeUtils.get_api_calls()["RunInstances"], api_calls["RunInstances"] + 1)
+        self.assertEqual(self.pool.count_ready(region="eu-central-1", machine_type="t3.small",
+                                               availability_zone="eu-central-1a"), 0)
+        for region in REGIONS:
+            self.assertEqual(FakeUtils.get_vpcs_by_name(region=region, name=experiment_id),
+                             [vpcs_data[region][0]["vpc_id"]])
+            self.assertEqual(vpcs_data[region][0]["vpc_cidr_block"], self.pool.get_cidr_block(region))
+            self.assertIsNotNone(vpcs_data[region][0]["public_address"])
+        self.assertEqual(len(trace.peering_ids), 1)
+
+    def test_claim_availability_zone(self):
+        self.pool.refill(machine_type_mapping={"eu-central-1": "t3.small"}, size=1,
+                         az_mapping={"eu-central-1": "eu-central-1b"})
+        self.assertEqual(CloudMeasurementDB.get_warm_pool(db_path=DB_PATH)[0][9], "eu-central-1b")
+        self.assertIsNone(self.pool.claim(region="eu-central-1", machine_type="t3.small",
+                                          availability_zone="eu-central-1a", experiment_id="EXP"))
+        claimed = self.pool.claim(region="eu-central-1", machine_type="t3.small", availability_zone="eu-central-1b",
+                                  experiment_id="EXP")
+        self.assertEqual(claimed["vpc"]["availability_zone"], ["eu-central-1b"])
+
+    def test_preflight_after_lost_claim(self):
+        FakeUtils.configure(seed=0, vpc_quota=1)
+        self.pool.refill(machine_type_mapping={"eu-central-1": "t3.small"}, size=1)
+        api_calls = FakeUtils.get_api_calls()
+        trace = MultiregionalTrace(list_of_regions=["eu-central-1"], cloud_util=FakeUtils)
+        # the ready set is claimed by another experiment after the preflight
+        trace.warm_pool = LostClaimPool(db_path=DB_PATH, cloud_util=FakeUtils)
+        with self.assertRaises(PermissionError):
+            trace.create_multiregional_vpcs()
+        self.assertEqual(FakeUtils.get_api_calls()["CreateVpc"], api_calls["CreateVpc"])
+
+    def test_cidr_block(self):
+        regions = sorted(FakeUtils.get_all_regions())
+        self.assertEqual(self.pool.get_cidr_block(regions[0]), "10.0.0.0/24")
+        self.assertEqual(self.pool.get_cidr_block(regions[2]), "10.0.2.0/24")
+        with self.assertRaises(ValueError):
+            WarmPool(db_path=DB_PATH, cloud_util=FakeUtils, cidr_block="10.0.0.0/24").get_cidr_block(regions[1])
+
+    def test_drain(self):
+        pool_ids = self.pool.refill(machine_type_mapping=MACHINE_TYPES, size=1)
+        self.assertEqual(sorted(self.pool.drain()), sorted(pool_ids))
+        self.assertEqual(CloudMeasurementDB.get_warm_pool(db_path=DB_PATH), [])
+        for region in REGIONS:
+            self.assertEqual(FakeUtils.count_vpcs(region=region), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()